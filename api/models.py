@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Deque, List, Optional, Tuple
+from typing import Deque, List, Literal, Optional, Tuple
 class sshInfo(BaseModel):
     user_name :str
 class jetsonInfo(BaseModel):
@@ -17,7 +17,7 @@ class DestroyEnvVMRequest(BaseModel):
 
 class CreateUser(BaseModel):
     user_name: str
-    user_network_id: int
+    user_network_id: Optional[int] = None
 
 
 class UserNetworkInfo(BaseModel):
@@ -35,9 +35,21 @@ class CreateUserEnvVMRequest(BaseModel):
     user_info: UserNetworkInfo
     nodes:Optional[list] = None
 
+class GoldenImageRequest(BaseModel):
+    ubuntu_version: str
+    rootfs_patterns: List[str] = []
+    force: bool = False
+
 class TurnNode(BaseModel):
     node_name :str
 
+class PowerNodes(BaseModel):
+    node_names :List[str]
+    state :Literal["on", "off"]
+
+class UserNodes(BaseModel):
+    nodes :List[str]
+
 class VlanNode(BaseModel):
     node_name :str
     vlan_id :int
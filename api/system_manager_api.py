@@ -3,9 +3,9 @@ from fastapi import FastAPI, HTTPException, Path
 import os
 import sys
 import json
-import time
-import pandas as pd
+import sqlite3
 import logging
+from contextlib import contextmanager
 from subprocess import run, CalledProcessError
 
 # Configure logging
@@ -14,20 +14,31 @@ logger = logging.getLogger(__name__)
 
 
 # Import functions from scripts
+from config import ARTIFACT_CACHE_ENABLED, ARTIFACT_PREFETCH
 from config import DRIVER_RPI4, DRIVER_RPI4_PATH, NODE_CONFIG_PATH, ROOT_FS_RPI4, SWITCH_PASSWORD, SWITCH_SECRET
 from scripts.create_env import launch_env
 from scripts.destroy_env import destroy_user_env
 from scripts.user_env import UserEnv
 from scripts.jetson_ctl import Jetson
 from scripts.ip_addr_manager import IpAddr
+from scripts.artifact_cache import ARTIFACT_CACHE, tftp_artifacts
 from scripts.create_env_vm import VmManager
+from scripts.golden_image import build_golden_image
+from scripts.vm_pool import VmPool
 from scripts.macvlan import MacVlan
 from scripts.container_create import Container
+from scripts.job_manager import JobConflict, JobManager, set_job_step
+from scripts.step_graph import StepGraph
+from scripts.readiness import wait_for
+from scripts.resource_inventory import INVENTORY
+from scripts.user_store import UserStore
+from scripts.ipam import NetworkIdAllocator, UserNetwork
 # switch import 
-from switch.switch_manager import SwitchManager
 from switch.poe_manager import PoeManager
+from switch.switch_session import SWITCH_SESSIONS
 
 # Global configuration paths
+from config.config import SWITCH_IDLE_VLAN, SWITCH_VLAN_TIMEOUT, VM_INTERFACE_TIMEOUT
 from config.config import SWITCH_CONFIG_PATH ,ACTIVE_USERS_PATH ,RESOURCE_JSON_PATH ,RESSOURCE_CSV_PATH ,VPN_NAME ,HOST_INTERFACE, VM_INTERFACE
 from config.constants import ROOT_FS_3274 ,ROOT_FS_3541 ,TOOLS_SCRIPT_PATH ,USER_SCRIPT_PATH_3271 ,USER_SCRIPT_PATH_3274 ,DRIVER_3274 ,DRIVER_3541 ,DRIVER_3274_PATH, DRIVER_3541_PATH
 
@@ -65,21 +76,33 @@ def load_switch_config():
         raise
 
 SWITCH_CONFIG = load_switch_config()
+@contextmanager
 def get_switch_and_poe():
     """
-    Helper function to initialize and return both the SwitchManager and PoeManager.
+    Context manager yielding the SwitchManager and PoeManager of the testbed switch.
+
+    The connection is a long-lived pooled session; commands issued inside the
+    block are serialized with every other user of the switch.
     """
-    
-    config = SWITCH_CONFIG
-    switch = SwitchManager(
-        device_type=config.get('device_type'),
-        ip=config.get('ip'),
-        port=config.get('port'),
-        password=config.get('password'),
-        #username= config.get('username')
-    )
-    poe = PoeManager(switch)
-    return switch, poe
+    with SWITCH_SESSIONS.session(SWITCH_CONFIG) as switch:
+        yield switch, PoeManager(switch)
+
+def get_switch_stats():
+    """
+    Return switch session counters (connect time, reuse rate).
+    """
+    return SWITCH_SESSIONS.get_stats()
+
+# Worker pool for long-running provisioning jobs
+JOB_MANAGER = JobManager()
+
+# Warm pool of pre-booted user VMs, refilled in the background
+VM_POOL = VmPool()
+VM_POOL.start()
+
+# TFTP boot files mirrored on the host in the background
+if ARTIFACT_CACHE_ENABLED and ARTIFACT_PREFETCH:
+    ARTIFACT_CACHE.prefetch_async(tftp_artifacts())
 
 # Create FastAPI instance (endpoints can be added later)
 app = FastAPI()
@@ -113,28 +136,27 @@ def update_ressource_from_platforme(list_ressource_csv, list_ressource_json):
 
 def get_resource_list():
     """
-    Load and return the resource list from resource.json.
+    Return the resource list from resource.json (cached, reloaded on change).
     """
     try:
         # update
         #update_ressource_from_platforme(RESSOURCE_CSV_PATH,RESOURCE_JSON_PATH)
-        with open(RESOURCE_JSON_PATH, 'r') as file:
-            data = json.load(file)
-        return data
+        return INVENTORY.all()
     except Exception as e:
         logging.error("Error reading resource list: %s", e)
         raise
 def update_resource(name):
     """
-    Load and return the update resource  from resource.json.
+    Return the resource matching name from resource.json.
+    Falls back to the first resource whose name contains it.
     """
     try:
-
-        with open(RESOURCE_JSON_PATH, 'r') as file:
-            data = json.load(file)
-            for ressource in data :
-                if name in ressource["name"]: 
-                    return ressource
+        ressource = INVENTORY.get_by_name(name)
+        if ressource is not None:
+            return ressource
+        for ressource in INVENTORY.all():
+            if name in ressource["name"]:
+                return ressource
  
        
     except Exception as e:
@@ -152,6 +174,25 @@ def load_node_configs(path: Path) -> dict[str, dict]:
     # Helper: identify Jetson nodes only
 node_nfs_configs = load_node_configs(NODE_CONFIG_PATH)
 
+def jetson_nodes(nodes: list[str]) -> list[str]:
+    """
+    Return the nodes whose NFS config pattern is a Jetson one (starts with 'j').
+    """
+    return [
+        node for node in nodes
+        if next((pat for pat in node_nfs_configs if pat in node and pat.startswith("j")), None)
+    ]
+
+def node_nfs_root(node: str, configs: dict[str, dict]):
+    """
+    Return the 'nfsroot-xxx' directory of a node, or None if no pattern matches.
+    """
+    matched = next((pattern for pattern in configs if pattern in node), None)
+    try:
+        return configs[matched]["rootfs"].split("/")[2] if matched else None
+    except (KeyError, IndexError):
+        return None
+
 def configure_and_setup_nfs_nodes(
     vm_manager,
     user_name: str,
@@ -204,7 +245,7 @@ def configure_and_setup_nfs_nodes(
             
             )
             vm_manager.setup_nfs_rpi(
-                user_name,
+                vm_name,
                 rootfs_dir,
                 [node],
             )
@@ -220,7 +261,7 @@ def configure_and_setup_nfs_nodes(
             
             )
             vm_manager.setup_nfs_jtx2(
-                user_name,
+                vm_name,
                 rootfs_dir,
                 [node],
             )
@@ -236,7 +277,7 @@ def configure_and_setup_nfs_nodes(
                 cfg["driver_path"]
             )
             vm_manager.setup_nfs_jetson(
-                user_name,
+                vm_name,
                 rootfs_dir,
                 [node]
             )
@@ -256,40 +297,55 @@ def testbed_reset():
     Reset the testbed by turning off all nodes.
     """
     logging.info("Resetting testbed: turning off all nodes.")
-    _, poe = get_switch_and_poe()
-    poe.turn_all_off()
+    with get_switch_and_poe() as (_, poe):
+        poe.turn_all_off()
 
 def turn_on_all_nodes():
     """
     Turn on all nodes in the testbed.
     """
     logging.info("Turning on all nodes.")
-    _, poe = get_switch_and_poe()
-    poe.turn_all_on()
+    with get_switch_and_poe() as (_, poe):
+        poe.turn_all_on()
 
 def turn_on_node(interface: str):
     """
     Turn on a specific node by its interface.
     """
-    _, poe = get_switch_and_poe()
-    poe.turn_on(interface)
+    with get_switch_and_poe() as (_, poe):
+        poe.turn_on(interface)
     logging.info("Interface '%s' is up", interface)
 
 def turn_off_node(interface: str):
     """
     Turn off a specific node by its interface.
     """
-    _, poe = get_switch_and_poe()
-    poe.turn_off(interface)
+    with get_switch_and_poe() as (_, poe):
+        poe.turn_off(interface)
     logging.info("Interface '%s' is down", interface)
 
+def power_nodes(node_names: list[str], state: str):
+    """
+    Turn a list of nodes "on" or "off" in one bulk switch operation.
+    """
+    interfaces = [get_switch_interface(name) for name in node_names]
+    with get_switch_and_poe() as (_, poe):
+        poe.set_power(interfaces, state)
+    logging.info("Nodes %s powered %s", node_names, state)
+
 def attach_vlan_device_interface(interface: str, vlan_id: int):
     """
     Attach a VLAN to a specific device interface.
     """
-    switch, _ = get_switch_and_poe()
-    switch.vlan_access(interface, vlan_id)
-    time.sleep(10)  # Consider making this delay configurable or async.
+    with get_switch_and_poe() as (switch, _):
+        switch.vlan_access(interface, vlan_id)
+
+    def port_in_vlan():
+        # Re-acquire the session per poll so other switch calls are not blocked
+        with get_switch_and_poe() as (switch, _):
+            return switch.get_access_vlan(interface) == vlan_id
+
+    wait_for(port_in_vlan, f"switch port {interface} in VLAN {vlan_id}", SWITCH_VLAN_TIMEOUT)
     logging.info("Interface '%s' set to VLAN %s", interface, vlan_id)
 
 def get_switch_interface(device_name: str) -> str:
@@ -299,10 +355,9 @@ def get_switch_interface(device_name: str) -> str:
     Raises:
         ValueError: If the device name is not found.
     """
-    df = pd.DataFrame(get_resource_list())
-    result = df[df['name'] == device_name]
-    if not result.empty:
-        return result.iloc[0]['switch_interface']
+    resource = INVENTORY.get_by_name(device_name)
+    if resource is not None:
+        return resource['switch_interface']
     else:
         error_msg = f"Device name '{device_name}' not found"
         logging.error(error_msg)
@@ -312,73 +367,74 @@ def get_switch_interface(device_name: str) -> str:
 # Active Users Management
 # ---------------------------
 
-def allocate_active_users(user_name: str, user_network_id: int):
-    """
-    Allocate a new user by adding them to the active users JSON.
+# Active users live in SQLite; active_users.json is migrated on first start
+USER_STORE = UserStore()
+NETWORK_IDS = NetworkIdAllocator(used=USER_STORE.network_ids())
+
+def allocate_active_users(user_name: str, user_network_id: int = None):
     """
-    if user_network_id > 254 or user_network_id < 3:
-        logging.error("Choose user_network_id between 3 and 253")
-        return
+    Allocate a new user by adding them to the active users store.
+    When no user_network_id is given, the next free one is allocated.
 
+    Returns:
+        The new user record, or None if the name or network ID is taken.
+    """
     try:
-        with open(ACTIVE_USERS_PATH, 'r') as file:
-            existing_users = json.load(file)
-    except FileNotFoundError:
-        existing_users = []
-
-    if any(user["user_network_id"] == user_network_id for user in existing_users):
-        logging.error("User number %s is already allocated.", user_network_id)
-        return
-    elif any(user["user_name"] == user_name for user in existing_users):
-        logging.error("User name %s is already allocated.", user_name)
-        return
-    else:
-        ip_addr = IpAddr()
-        user_subnet = ip_addr.user_subnet(user_network_id)
-        nfs_ip_addr = ip_addr.nfs_interface_ip(user_network_id)
-        user_macvlan = f"macvlan_{user_name}"
-        new_user = {
-            "user_name": user_name,
-            "user_network_id": user_network_id,
-            "user_subnet": user_subnet,
-            "nfs_ip_addr": nfs_ip_addr,
-            "macvlan_interface": user_macvlan,
-        }
-        existing_users.append(new_user)
-        with open(ACTIVE_USERS_PATH, 'w') as file:
-            json.dump(existing_users, file, indent=4)
-        logging.info("User %s allocated with network ID %s", user_name, user_network_id)
+        user_network_id = NETWORK_IDS.allocate(user_network_id)
+    except ValueError as e:
+        logging.error("%s", e)
+        return None
+
+    network = UserNetwork.from_id(user_network_id)
+    new_user = {
+        "user_name": user_name,
+        "user_network_id": user_network_id,
+        "user_subnet": str(network.subnet),
+        "nfs_ip_addr": str(network.nfs_ip),
+        "macvlan_interface": f"macvlan_{user_name}",
+    }
+    try:
+        USER_STORE.add(new_user)
+    except sqlite3.IntegrityError as e:
+        if "user_network_id" in str(e):
+            # Taken in the database by another process: the ID stays reserved here
+            logging.error("Network ID %s is already allocated.", user_network_id)
+        else:
+            NETWORK_IDS.release(user_network_id)
+            logging.error("User name %s is already allocated.", user_name)
+        return None
+    logging.info("User %s allocated with network ID %s", user_name, user_network_id)
+    return new_user
 
 def clear_active_users():
     """
-    Clear all active users from the active users JSON file.
+    Clear all active users from the active users store.
     """
     try:
-        with open(ACTIVE_USERS_PATH, 'r') as file:
-            existing_users = json.load(file)
-        existing_users.clear()
-        with open(ACTIVE_USERS_PATH, 'w') as file:
-            json.dump(existing_users, file, indent=4)
+        for user_network_id in USER_STORE.network_ids():
+            NETWORK_IDS.release(user_network_id)
+        USER_STORE.clear()
         logging.info("Active Users Cleared")
     except Exception as e:
         logging.error("Failed to clear active users: %s", e)
 
+def get_user_network(user_network_id: int) -> dict:
+    """
+    Return every address derived from a user network ID.
+    """
+    return UserNetwork.from_id(user_network_id).to_dict()
+
 def get_user_info(user_name: str, user_network_id: int):
     """
     Retrieve and return user information as a JSON string.
     """
     try:
-        with open(ACTIVE_USERS_PATH, 'r') as file:
-            active_users = json.load(file)
-        filtered_users = [
-            user for user in active_users 
-            if user['user_name'] == user_name and user['user_network_id'] == user_network_id
-        ]
-        if not filtered_users:
+        user = USER_STORE.get(user_name, user_network_id)
+        if user is None:
             error_msg = f"No user info found for {user_name} with network ID {user_network_id}"
             logging.error(error_msg)
             raise ValueError(error_msg)
-        return json.dumps(filtered_users[0])
+        return json.dumps(user)
     except Exception as e:
         logging.error("Error getting user info: %s", e)
         raise
@@ -397,6 +453,8 @@ def destroy_user_env_vm(vm_name: str, macvlan_name: str):
     vm_manager = VmManager()
     vm_manager.delete_vm(vm_name)
     vm_manager.delete_macvlan_for_vm(macvlan_manager, macvlan_name)
+    # Environments created before the VM was recorded are named after their user
+    USER_STORE.remove_env(USER_STORE.user_of_vm(vm_name) or vm_name)
 
 def check_args_type_create_user_env_vm(ubuntu_version: str, vm_name: str, root_size: str, user_info: dict):
     """
@@ -421,69 +479,311 @@ def update_ssh(user_name: str):
 def create_user_env_vm(ubuntu_version: str, vm_name: str, root_size: str, user_info: dict, nodes):
     """
     Create a VM environment for the user.
+
+    Provisioning runs as a StepGraph: independent steps (package installs,
+    DHCP, NAT, SSH keys, VPN, ...) overlap and the first failure aborts.
     
     Returns:
-        A dict with the VM IP address and status.
+        A dict with the VM IP address, status and per-step durations.
     """
     check_args_type_create_user_env_vm(ubuntu_version, vm_name, root_size, user_info)
     macvlan_name = user_info["macvlan_interface"]
     user_name = user_info["user_name"]
     nfs_ip_addr = user_info["nfs_ip_addr"]
     user_network_id = user_info["user_network_id"]
+    nodes = nodes or []
 
     interface_name = HOST_INTERFACE # Update as needed.
     vm_manager = VmManager()
-    existed = vm_manager.create_user_vm(ubuntu_version, vm_name, root_size)
-    jetson_nodes = [
-    node for node in nodes
-    if next((pat for pat in node_nfs_configs if pat in node and pat.startswith("j")), None)
-    ]   
+    USER_STORE.set_vm(user_name, vm_name)
+    set_job_step("create_vm")
+    if vm_manager.check_vm_exists(vm_name):
+        logging.info("VM %s already exists!", vm_name)
+        existed = {"created": False}
+    else:
+        existed = VM_POOL.claim(ubuntu_version, vm_name, root_size)
+        if existed is None:
+            # Network, NAT and SSH keys are applied by cloud-init on first boot
+            existed = vm_manager.create_user_vm(ubuntu_version, vm_name, root_size,
+                                                nfs_ip_addr=nfs_ip_addr, network_id=user_network_id,
+                                                ssh_keys=vm_manager.get_user_ssh_keys(user_name))
+    nbd_nodes = jetson_nodes(nodes)
+    steps = StepGraph(vm_name)
     if existed["created"]:
-        time.sleep(20)
-        vm_manager.create_macvlan_for_vm(user_name, user_network_id, SWITCH_CONFIG, interface_name, macvlan_name)
-        res = vm_manager.interface_check(vm_name, VM_INTERFACE)
-        time.sleep(10)
-        logging.info("Interface check result: %s", res)
-        vm_manager.set_nfs_ip_addr(vm_name, nfs_ip_addr)
-        vm_manager.install_library(vm_name, nfs_ip_addr)
-
-        
+        vm_manager.wait_for_agent(vm_name)
+        # Pool VM or current golden image: packages and services are already there
+        preinstalled = existed.get("pooled") or vm_manager.is_golden(vm_name)
+        if preinstalled:
+            logging.info("VM %s comes from %s, skipping installs.", vm_name,
+                         existed.get("pool_vm") or existed.get("image"))
+
+        def check_interface():
+            res = wait_for(lambda: vm_manager.interface_check(vm_name, VM_INTERFACE),
+                           f"interface {VM_INTERFACE} in VM {vm_name}", VM_INTERFACE_TIMEOUT)
+            logging.info("Interface check result: %s", res)
+
+        first_boot = existed.get("first_boot", False)
+        if first_boot:
+            # The MACVLAN NIC was added before the first boot: only the switch is left
+            steps.add("create_macvlan", vm_manager.configure_switch_vlan, user_network_id, SWITCH_CONFIG)
+        else:
+            steps.add("create_macvlan", vm_manager.create_macvlan_for_vm,
+                      user_name, user_network_id, SWITCH_CONFIG, interface_name, macvlan_name)
+        steps.add("interface_check", check_interface, deps=["create_macvlan"])
+        steps.add("set_nfs_ip_addr", vm_manager.set_nfs_ip_addr, vm_name, nfs_ip_addr, deps=["interface_check"])
+        if preinstalled:
+            # Exports and the nbd-server listenaddr need the NFS address
+            install_deps, nfs_deps = [], ["set_nfs_ip_addr"]
+            nbd_deps = nfs_deps
+            steps.add("create_dhcp_server", vm_manager.create_dhcp_server, vm_name, nfs_ip_addr,
+                      deps=["set_nfs_ip_addr"])
+        else:
+            install_deps, nbd_deps = ["update_apt"], ["setup_nbd_server"]
+            nfs_deps = ["install_base_packages", "setup_tftp_server"]
+            steps.add("update_apt", vm_manager.update_apt, vm_name, deps=["set_nfs_ip_addr"])
+            steps.add("install_base_packages", vm_manager.install_base_packages, vm_name, deps=install_deps)
+            steps.add("setup_tftp_server", vm_manager.setup_tftp_server, vm_name, deps=install_deps)
+            steps.add("setup_nbd_server", vm_manager.setup_nbd_server, vm_name, deps=install_deps)
+            steps.add("create_dhcp_server", vm_manager.create_dhcp_server, vm_name, nfs_ip_addr, deps=install_deps)
+        # After netplan apply in set_nfs_ip_addr, which bounces the VM network
+        steps.add("push_user_tools", vm_manager.push_user_tools, vm_name, deps=["set_nfs_ip_addr"])
+        if not first_boot:
+            steps.add("configure_vm_nat", vm_manager.configure_vm_nat, vm_name, deps=["set_nfs_ip_addr"])
+            steps.add("add_ssh_key", vm_manager.add_ssh_key_to_lxd, user_name, vm_name, deps=["set_nfs_ip_addr"])
         # Configure and set up NFS for all nodes
-        configure_and_setup_nfs_nodes(
-            vm_manager,
-            user_name,
-            vm_name,
-            nfs_ip_addr,
-            nodes,
-            config_path=NODE_CONFIG_PATH
-        )
-
-        vm_manager.create_dhcp_server(vm_name, nfs_ip_addr)
-        vm_manager.configure_vm_nat(vm_name)
-        
-        time.sleep(2)
-        vm_manager.add_ssh_key_to_lxd(user_name, user_name)
-
-        if jetson_nodes:
-            vm_manager.configure_nbd_on_lxc_vm(vm_name, nfs_ip_addr.split('/')[0],jetson_nodes)
+        steps.add("configure_nfs_nodes", configure_and_setup_nfs_nodes,
+                  vm_manager, user_name, vm_name, nfs_ip_addr, nodes,
+                  config_path=NODE_CONFIG_PATH,
+                  deps=nfs_deps)
+        if nbd_nodes:
+            steps.add("configure_nbd", vm_manager.configure_nbd_on_lxc_vm,
+                      vm_name, nfs_ip_addr.split('/')[0], nbd_nodes,
+                      deps=nbd_deps)
         ## add vpn interface if the vlan 
-        vm_manager.setup_vpn_vlan(VPN_NAME, user_network_id)
-        return {"vm_ip_address": "10.0.0.0", "status": "User Env Created"}
+        steps.add("setup_vpn_vlan", vm_manager.setup_vpn_vlan, VPN_NAME, user_network_id, deps=["create_macvlan"])
     
     else:
         vm_manager.start_vm(vm_name)
         # Configure and set up NFS for all nodes
-        configure_and_setup_nfs_nodes(
-            vm_manager,
-            user_name,
-            vm_name,
-            nfs_ip_addr,
-            nodes,
-            config_path=NODE_CONFIG_PATH
-        )
-        if jetson_nodes:
-            vm_manager.configure_nbd_on_lxc_vm(vm_name, nfs_ip_addr.split('/')[0],jetson_nodes)
-        return {"vm_ip_address": "10.0.0.0", "status": "User Env Created"}
+        steps.add("configure_nfs_nodes", configure_and_setup_nfs_nodes,
+                  vm_manager, user_name, vm_name, nfs_ip_addr, nodes,
+                  config_path=NODE_CONFIG_PATH)
+        if nbd_nodes:
+            steps.add("configure_nbd", vm_manager.configure_nbd_on_lxc_vm,
+                      vm_name, nfs_ip_addr.split('/')[0], nbd_nodes)
+
+    durations = steps.run()
+    # Later node changes go through add_user_nodes / remove_user_nodes
+    USER_STORE.add_nodes(user_name, nodes)
+    return {"vm_ip_address": "10.0.0.0", "status": "User Env Created", "step_durations": durations}
+
+def attach_vlan_nodes(node_names: list[str], vlan_id: int):
+    """
+    Put the switch ports of the given nodes in a VLAN.
+    """
+    for name in node_names:
+        attach_vlan_device_interface(get_switch_interface(name), vlan_id)
+
+def user_vm_name(user_name: str) -> str:
+    """
+    Return the environment VM of a user, as recorded by create_user_env_vm
+    (environments created before that are named after their user).
+    """
+    return USER_STORE.vm(user_name) or user_name
+
+def recorded_user_nodes(user_name: str, vm_name: str) -> list[str]:
+    """
+    Return the nodes recorded for a user. Environments set up before nodes
+    were recorded are backfilled from the NFS and NBD exports of their VM.
+    """
+    recorded = USER_STORE.nodes(user_name)
+    vm_manager = VmManager()
+    if not recorded and vm_manager.check_vm_exists(vm_name):
+        exported = vm_manager.exported_nodes(vm_name)
+        if exported:
+            logging.info("Recording the nodes exported by VM %s: %s", vm_name, exported)
+            USER_STORE.add_nodes(user_name, exported)
+            recorded = USER_STORE.nodes(user_name)
+    return recorded
+
+def add_user_nodes(user_name: str, nodes: list[str]):
+    """
+    Set up the nodes that are not yet in the environment of a user:
+    NFS root, NBD image (Jetson nodes) and switch port in the user VLAN.
+    The nodes already set up are not touched.
+
+    Returns:
+        The added nodes, all nodes of the environment and per-step
+        durations, or None if the user is unknown.
+
+    Raises:
+        ValueError: If a node is not in the resource inventory.
+    """
+    user = USER_STORE.get(user_name)
+    if user is None:
+        return None
+    vm_name = user_vm_name(user_name)
+    nfs_ip_addr = user["nfs_ip_addr"]
+    recorded = recorded_user_nodes(user_name, vm_name)
+    added = [node for node in dict.fromkeys(nodes) if node not in recorded]
+    durations = {}
+    if added:
+        # Fail before touching the VM when a node has no switch port
+        for node in added:
+            get_switch_interface(node)
+        vm_manager = VmManager()
+        steps = StepGraph(vm_name)
+        steps.add("configure_nfs_nodes", configure_and_setup_nfs_nodes,
+                  vm_manager, user_name, vm_name, nfs_ip_addr, added,
+                  config_path=NODE_CONFIG_PATH)
+        nbd_nodes = jetson_nodes(added)
+        if nbd_nodes:
+            steps.add("configure_nbd", vm_manager.update_nbd_config,
+                      vm_name, nfs_ip_addr.split('/')[0], nbd_nodes)
+        steps.add("attach_vlan", attach_vlan_nodes, added, user["user_network_id"])
+        durations = steps.run()
+        USER_STORE.add_nodes(user_name, added)
+    logging.info("Nodes added to the environment of %s: %s", user_name, added)
+    return {"added": added, "nodes": USER_STORE.nodes(user_name), "step_durations": durations}
+
+def remove_user_nodes(user_name: str, nodes: list[str]):
+    """
+    Tear down nodes of the environment of a user: switch port back to
+    SWITCH_IDLE_VLAN, NBD export and image, NFS root.
+
+    Returns:
+        The removed nodes, the remaining nodes and per-step durations,
+        or None if the user is unknown.
+
+    Raises:
+        ValueError: If a node is not in the environment (nothing is removed).
+    """
+    user = USER_STORE.get(user_name)
+    if user is None:
+        return None
+    vm_name = user_vm_name(user_name)
+    recorded = recorded_user_nodes(user_name, vm_name)
+    removed = list(dict.fromkeys(nodes))
+    unknown = [node for node in removed if node not in recorded]
+    if unknown:
+        raise ValueError(f"Nodes not in the environment of {user_name}: {', '.join(unknown)}")
+    durations = {}
+    if removed:
+        vm_manager = VmManager()
+        nfs_roots = {}
+        for node in removed:
+            nfs_root = node_nfs_root(node, node_nfs_configs)
+            if nfs_root is None:
+                logging.warning("No NFS config found for node '%s'; skipping its NFS root.", node)
+                continue
+            nfs_roots.setdefault(nfs_root, []).append(node)
+        steps = StepGraph(vm_name)
+        # The node leaves the user network before its root goes away
+        steps.add("release_vlan", attach_vlan_nodes, removed, SWITCH_IDLE_VLAN)
+        nbd_nodes = jetson_nodes(removed)
+        if nbd_nodes:
+            steps.add("remove_nbd", vm_manager.remove_nbd_nodes,
+                      vm_name, user["nfs_ip_addr"].split('/')[0], nbd_nodes, deps=["release_vlan"])
+
+        def remove_nfs_roots():
+            # One root after the other: each pass rewrites /etc/exports
+            for nfs_root, devices in nfs_roots.items():
+                vm_manager.remove_nfs_roots(vm_name, nfs_root, devices)
+
+        steps.add("remove_nfs_roots", remove_nfs_roots, deps=["release_vlan"])
+        durations = steps.run()
+        USER_STORE.remove_nodes(user_name, removed)
+    logging.info("Nodes removed from the environment of %s: %s", user_name, removed)
+    return {"removed": removed, "nodes": USER_STORE.nodes(user_name), "step_durations": durations}
+
+def submit_add_user_nodes(user_name: str, nodes: list[str]):
+    """
+    Queue add_user_nodes on the job worker pool.
+
+    Returns:
+        The job ID, or None if the user is unknown.
+
+    Raises:
+        ValueError: If a node is not in the resource inventory.
+        JobConflict: If a job is already active for the user VM.
+    """
+    if USER_STORE.get(user_name) is None:
+        return None
+    for node in nodes:
+        get_switch_interface(node)
+    # Same key as the create job of the VM: never run next to it
+    return JOB_MANAGER.submit("add_user_nodes", add_user_nodes, user_name, nodes,
+                              key=user_vm_name(user_name), exclusive=True)
+
+def submit_remove_user_nodes(user_name: str, nodes: list[str]):
+    """
+    Queue remove_user_nodes on the job worker pool.
+
+    Returns:
+        The job ID, or None if the user is unknown.
+
+    Raises:
+        JobConflict: If a job is already active for the user VM.
+    """
+    if USER_STORE.get(user_name) is None:
+        return None
+    return JOB_MANAGER.submit("remove_user_nodes", remove_user_nodes, user_name, nodes,
+                              key=user_vm_name(user_name), exclusive=True)
+
+def get_vm_pool_stats():
+    """
+    Return the warm pool size, ready VMs and hit/miss counters.
+    """
+    return VM_POOL.get_stats()
+
+def get_artifact_cache_stats():
+    """
+    Return the artifact cache size and hit/miss counters.
+    """
+    return ARTIFACT_CACHE.get_stats()
+
+def submit_create_user_env_vm(ubuntu_version: str, vm_name: str, root_size: str, user_info: dict, nodes) -> str:
+    """
+    Queue create_user_env_vm on the job worker pool.
+
+    Returns:
+        The job ID to poll with get_job().
+    """
+    check_args_type_create_user_env_vm(ubuntu_version, vm_name, root_size, user_info)
+    # Recorded before queueing: node jobs of this user then use the same job key
+    USER_STORE.set_vm(user_info["user_name"], vm_name)
+    return JOB_MANAGER.submit(
+        "create_user_env_vm",
+        create_user_env_vm,
+        ubuntu_version, vm_name, root_size, user_info, nodes,
+        key=vm_name
+    )
+
+def get_job(job_id: str):
+    """
+    Return the state of a job, or None if the ID is unknown.
+    """
+    return JOB_MANAGER.get(job_id)
+
+def list_jobs():
+    """
+    Return the state of all known jobs.
+    """
+    return JOB_MANAGER.list()
+
+def submit_build_golden_image(ubuntu_version: str, rootfs_patterns: list[str], force: bool = False) -> str:
+    """
+    Queue a golden image build on the job worker pool.
+
+    Returns:
+        The job ID to poll with get_job().
+    """
+    return JOB_MANAGER.submit(
+        "build_golden_image",
+        build_golden_image,
+        ubuntu_version, rootfs_patterns, force,
+        key=f"golden-{ubuntu_version}"
+    )
 
 def stop_user_vm(vm_name: str):
     """
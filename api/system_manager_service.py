@@ -4,14 +4,16 @@ from config.init_logging import setup_logging
 import system_manager_api
 import logging
 import uvicorn
-import time
 import os
 from pydantic import BaseModel
 from models import (
     DestroyEnvVMRequest,
     CreateUser,
     CreateUserEnvVMRequest,
+    GoldenImageRequest,
     TurnNode,
+    PowerNodes,
+    UserNodes,
     VlanNode,
     jetsonInfo,
     sshInfo,
@@ -61,7 +63,7 @@ def call_update_resource(request:Ressource):
 # Destroy User Environment (VM)
 #--------------------------------------------------
 @app.post('/destroy_env_vm', summary="Destroy VM Environment", description="Destroy a user's VM environment.")
-async def call_destroy_env_vm(request: DestroyEnvVMRequest):
+def call_destroy_env_vm(request: DestroyEnvVMRequest):
     try:
         logging.info("Destroy VM request: %s", request)
         system_manager_api.destroy_user_env_vm(request.vm_name, request.macvlan_interface)
@@ -73,28 +75,99 @@ async def call_destroy_env_vm(request: DestroyEnvVMRequest):
 #--------------------------------------------------
 # Create User Environment (VM)
 #--------------------------------------------------
-@app.post('/create_user_env_vm', summary="Create VM Environment", description="Create a VM environment for a user.")
-async def call_create_user_env_vm(request: CreateUserEnvVMRequest):
+@app.post('/create_user_env_vm', summary="Create VM Environment", description="Queue the creation of a VM environment for a user and return its job ID.")
+def call_create_user_env_vm(request: CreateUserEnvVMRequest):
     try:
         logging.info("Create VM request: %s", request)
-        response = system_manager_api.create_user_env_vm(
+        job_id = system_manager_api.submit_create_user_env_vm(
             request.ubuntu_version,
             request.vm_name,
             request.root_size,
             request.user_info.dict(),  # Convert Pydantic model to dict
             request.nodes
         )
-        time.sleep(2)
-        return response
+        return {"job_id": job_id, "status": "User Env Creation Queued"}
     except Exception as e:
         logging.error("Error creating VM environment: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create VM environment")
 
+#--------------------------------------------------
+# User Environment Nodes
+#--------------------------------------------------
+@app.post('/env/{user_name}/nodes', summary="Add Nodes", description="Queue the setup of the nodes not yet in a user's environment (NFS root, NBD image, VLAN port) and return its job ID.")
+def call_add_user_nodes(user_name: str, request: UserNodes):
+    try:
+        logging.info("Add nodes request for %s: %s", user_name, request)
+        job_id = system_manager_api.submit_add_user_nodes(user_name, request.nodes)
+        if job_id is None:
+            raise HTTPException(status_code=404, detail=f"User '{user_name}' not found")
+        return {"job_id": job_id, "status": "Node Addition Queued"}
+    except HTTPException:
+        raise
+    except system_manager_api.JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logging.error("Error adding nodes: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to add nodes")
+
+@app.delete('/env/{user_name}/nodes', summary="Remove Nodes", description="Queue the teardown of nodes of a user's environment (VLAN port, NBD image, NFS root) and return its job ID.")
+def call_remove_user_nodes(user_name: str, request: UserNodes):
+    try:
+        logging.info("Remove nodes request for %s: %s", user_name, request)
+        job_id = system_manager_api.submit_remove_user_nodes(user_name, request.nodes)
+        if job_id is None:
+            raise HTTPException(status_code=404, detail=f"User '{user_name}' not found")
+        return {"job_id": job_id, "status": "Node Removal Queued"}
+    except HTTPException:
+        raise
+    except system_manager_api.JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logging.error("Error removing nodes: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to remove nodes")
+
+#--------------------------------------------------
+# Jobs
+#--------------------------------------------------
+@app.get('/jobs', summary="List Jobs", description="List queued, running and finished provisioning jobs.")
+def call_list_jobs():
+    return system_manager_api.list_jobs()
+
+@app.get('/jobs/{job_id}', summary="Get Job", description="Get the state, current step and elapsed time of a job.")
+def call_get_job(job_id: str):
+    job = system_manager_api.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.post('/golden_image', summary="Build Golden Image", description="Queue the build of the golden LXD image user VMs are launched from and return its job ID.")
+def call_build_golden_image(request: GoldenImageRequest):
+    try:
+        job_id = system_manager_api.submit_build_golden_image(
+            request.ubuntu_version,
+            request.rootfs_patterns,
+            request.force
+        )
+        return {"job_id": job_id, "status": "Golden Image Build Queued"}
+    except Exception as e:
+        logging.error("Error queuing golden image build: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to queue golden image build")
+
+@app.get('/pool', summary="VM Pool Stats", description="Size, ready VMs and hit/miss counters of the warm VM pool.")
+def call_get_vm_pool_stats():
+    return system_manager_api.get_vm_pool_stats()
+
+@app.get('/artifacts', summary="Artifact Cache Stats", description="Cached TFTP artifacts and hit/miss counters of the host-side artifact cache.")
+def call_get_artifact_cache_stats():
+    return system_manager_api.get_artifact_cache_stats()
+
 #--------------------------------------------------
 # Stop User VM
 #--------------------------------------------------
 @app.post('/stop_vm', summary="Stop VM", description="Stop a running user VM.")
-async def call_stop_user_vm(request: DestroyEnvVMRequest):
+def call_stop_user_vm(request: DestroyEnvVMRequest):
     try:
         logging.info("Stop VM request: %s", request)
         system_manager_api.stop_user_vm(request.vm_name)
@@ -106,12 +179,20 @@ async def call_stop_user_vm(request: DestroyEnvVMRequest):
 #--------------------------------------------------
 # Create User (Allocate Active User)
 #--------------------------------------------------
-@app.post('/create_user', summary="Create User", description="Allocate a new active user in the testbed.")
-async def create_user(request: CreateUser):
+@app.post('/create_user', summary="Create User", description="Allocate a new active user in the testbed. The next free network ID is used when none is given.")
+def create_user(request: CreateUser):
     try:
         logging.info("Create user request: %s", request)
-        system_manager_api.allocate_active_users(request.user_name, request.user_network_id)
-        return {"status": "User Created"}
+        user = system_manager_api.allocate_active_users(request.user_name, request.user_network_id)
+        if user is None:
+            raise HTTPException(status_code=409, detail="User name or network ID already allocated")
+        return {
+            "status": "User Created",
+            "user_info": user,
+            "network": system_manager_api.get_user_network(user["user_network_id"]),
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error("Error creating user: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create user")
@@ -180,6 +261,19 @@ def call_turn_off_node(request: TurnNode):
         logging.error("Error turning off node: %s", e)
         raise HTTPException(status_code=500, detail="Failed to turn off node")
 
+#--------------------------------------------------
+# Power a List of Nodes
+#--------------------------------------------------
+@app.post('/power_nodes', summary="Power Nodes", description="Turn a list of nodes on or off in one bulk PoE operation.")
+def call_power_nodes(request: PowerNodes):
+    try:
+        logging.info("Power nodes request: %s", request)
+        system_manager_api.power_nodes(request.node_names, request.state)
+        return {"success": True, "state": request.state}
+    except Exception as e:
+        logging.error("Error powering nodes: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to power nodes")
+
 #--------------------------------------------------
 # Add VLAN to Node
 #--------------------------------------------------
@@ -195,11 +289,18 @@ def call_add_vlan_int(request: VlanNode):
         logging.error("Error adding VLAN: %s", e)
         raise HTTPException(status_code=500, detail="Failed to add VLAN")
 
+#--------------------------------------------------
+# Switch Session Statistics
+#--------------------------------------------------
+@app.get('/switch_stats', summary="Switch Session Stats", description="Connection counters of the pooled switch sessions (connect time, reuse rate).")
+def call_switch_stats():
+    return system_manager_api.get_switch_stats()
+
 #--------------------------------------------------
 # Get User Information
 #--------------------------------------------------
 @app.post('/get_user_info', summary="Get User Info", description="Retrieve information about a specific active user.")
-async def call_get_user_info(request: CreateUser):
+def call_get_user_info(request: CreateUser):
     try:
         logging.info("Get user info request: %s", request)
         user_info = system_manager_api.get_user_info(request.user_name, request.user_network_id)
@@ -212,7 +313,7 @@ async def call_get_user_info(request: CreateUser):
 # Add SSH Public Key to VM
 #--------------------------------------------------
 @app.post('/ssh_add', summary="Add SSH Key", description="Add an SSH public key to a VM for the given user.")
-async def call_ssh_add(request: sshInfo):
+def call_ssh_add(request: sshInfo):
     try:
         logging.info("SSH add request: %s", request)
         return system_manager_api.update_ssh(request.user_name)
@@ -224,7 +325,7 @@ async def call_ssh_add(request: sshInfo):
 # Flash Jetson Device
 #--------------------------------------------------
 @app.post('/flash_jetson', summary="Flash Jetson", description="Flash a Jetson device using the provided parameters.")
-async def call_flash_jetson(request: jetsonInfo):
+def call_flash_jetson(request: jetsonInfo):
     try:
         logging.info("Flash jetson request: %s", request)
         flash_info = system_manager_api.flash_jetson(
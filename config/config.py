@@ -23,6 +23,113 @@ if os.path.exists(env_file):
 HOST_INTERFACE = os.getenv("HOST_INTERFACE", "eno1")  # Used for the switch to the VM (host side)
 VM_INTERFACE   = os.getenv("VM_INTERFACE", "enp6s0")  # Used to check if the VM network is up
 
+# User networks: network ID N is VLAN N and subnet 10.111.N.0/24
+USER_NETWORK_SUPERNET    = os.getenv("USER_NETWORK_SUPERNET", "10.111.0.0/16")
+USER_SUBNET_PREFIX       = int(os.getenv("USER_SUBNET_PREFIX", "24"))
+USER_NETWORK_ID_MIN      = int(os.getenv("USER_NETWORK_ID_MIN", "3"))
+USER_NETWORK_ID_MAX      = int(os.getenv("USER_NETWORK_ID_MAX", "253"))
+USER_NETWORK_ID_RESERVED = os.getenv("USER_NETWORK_ID_RESERVED", "")  # e.g. "100-110,200"
+
+# --------------------------------------------------------------------------
+# LXD Settings
+# --------------------------------------------------------------------------
+LXD_BACKEND              = os.getenv("LXD_BACKEND", "pylxd")  # "pylxd" (REST over the unix socket) or "cli" (fork lxc)
+STREAM_CHUNK_SIZE        = int(os.getenv("STREAM_CHUNK_SIZE", str(4 * 1024 * 1024)))  # Bytes in flight when streaming a file into a VM
+STREAM_PROGRESS_INTERVAL = float(os.getenv("STREAM_PROGRESS_INTERVAL", "10"))       # Seconds between progress log lines
+
+# --------------------------------------------------------------------------
+# Readiness Waits (seconds)
+# --------------------------------------------------------------------------
+READY_INITIAL_INTERVAL  = float(os.getenv("READY_INITIAL_INTERVAL", "0.5"))  # First poll delay, doubled each poll
+READY_MAX_INTERVAL      = float(os.getenv("READY_MAX_INTERVAL", "5"))
+VM_AGENT_TIMEOUT        = float(os.getenv("VM_AGENT_TIMEOUT", "180"))        # LXD agent up after launch
+VM_INTERFACE_TIMEOUT    = float(os.getenv("VM_INTERFACE_TIMEOUT", "60"))     # NIC present / address assigned
+VM_SERVICE_TIMEOUT      = float(os.getenv("VM_SERVICE_TIMEOUT", "60"))       # systemd unit active
+SWITCH_VLAN_TIMEOUT     = float(os.getenv("SWITCH_VLAN_TIMEOUT", "30"))      # Switch port shows the VLAN
+
+# --------------------------------------------------------------------------
+# Golden Image Settings
+# --------------------------------------------------------------------------
+# User VMs launch from "<alias>-<ubuntu version>-v<version>" when it exists
+GOLDEN_IMAGE_ENABLED   = os.getenv("GOLDEN_IMAGE_ENABLED", "true").lower() == "true"
+GOLDEN_IMAGE_ALIAS     = os.getenv("GOLDEN_IMAGE_ALIAS", "testbed-golden")
+GOLDEN_IMAGE_VERSION   = os.getenv("GOLDEN_IMAGE_VERSION", "1")     # Bump when the baked-in setup changes
+GOLDEN_IMAGE_ROOT_SIZE = os.getenv("GOLDEN_IMAGE_ROOT_SIZE", "20GiB")  # User VM root size must be at least this
+GOLDEN_IMAGE_ROOTFS    = os.getenv("GOLDEN_IMAGE_ROOTFS", "")       # Node patterns to pre-extract, e.g. "j20,rpi4"
+
+# --------------------------------------------------------------------------
+# Rootfs Cache Settings
+# --------------------------------------------------------------------------
+# Node root filesystems are extracted once into LXD block volumes keyed by
+# tarball sha256; each VM gets a copy-on-write copy instead of push + extract
+ROOTFS_CACHE_ENABLED     = os.getenv("ROOTFS_CACHE_ENABLED", "false").lower() == "true"
+ROOTFS_CACHE_POOL        = os.getenv("ROOTFS_CACHE_POOL", "default")     # Use a ZFS/btrfs pool for cheap copies
+ROOTFS_CACHE_PREFIX      = os.getenv("ROOTFS_CACHE_PREFIX", "rootfs-cache")
+ROOTFS_CACHE_VOLUME_SIZE = os.getenv("ROOTFS_CACHE_VOLUME_SIZE", "32GiB")  # Must hold the largest extracted rootfs
+ROOTFS_CACHE_INDEX_PATH  = os.getenv("ROOTFS_CACHE_INDEX_PATH", os.path.join(BASE_DIR, "rootfs_cache.json"))
+
+# --------------------------------------------------------------------------
+# Shared Rootfs Settings
+# --------------------------------------------------------------------------
+# One host-wide NFS server VM holds a read-only copy of each node rootfs;
+# user VMs mount it and re-export it to their nodes (needs kernel >= 5.11)
+SHARED_ROOTFS_ENABLED        = os.getenv("SHARED_ROOTFS_ENABLED", "false").lower() == "true"
+SHARED_ROOTFS_INSTANCE       = os.getenv("SHARED_ROOTFS_INSTANCE", "rootfs-nfs")
+SHARED_ROOTFS_UBUNTU_VERSION = os.getenv("SHARED_ROOTFS_UBUNTU_VERSION", "24.04")
+SHARED_ROOTFS_ROOT_SIZE      = os.getenv("SHARED_ROOTFS_ROOT_SIZE", "100GiB")  # Must hold every extracted rootfs
+SHARED_ROOTFS_DIR            = os.getenv("SHARED_ROOTFS_DIR", "/srv/rootfs")
+
+# --------------------------------------------------------------------------
+# Rootfs Extraction Settings
+# --------------------------------------------------------------------------
+# Use "<name>.tar.zst" next to a rootfs tarball when it is up to date
+# (created with `python -m scripts.rootfs_extract <tarball>`)
+ROOTFS_PREFER_ZSTD = os.getenv("ROOTFS_PREFER_ZSTD", "true").lower() == "true"
+ROOTFS_ZSTD_LEVEL  = int(os.getenv("ROOTFS_ZSTD_LEVEL", "10"))
+
+# --------------------------------------------------------------------------
+# Apt Cache Settings
+# --------------------------------------------------------------------------
+# apt-cacher-ng container shared by all VMs, handed to them at launch
+APT_CACHE_ENABLED        = os.getenv("APT_CACHE_ENABLED", "false").lower() == "true"
+APT_CACHE_INSTANCE       = os.getenv("APT_CACHE_INSTANCE", "apt-cache")
+APT_CACHE_UBUNTU_VERSION = os.getenv("APT_CACHE_UBUNTU_VERSION", "24.04")
+APT_CACHE_PORT           = int(os.getenv("APT_CACHE_PORT", "3142"))
+APT_CACHE_OFFLINE        = os.getenv("APT_CACHE_OFFLINE", "false").lower() == "true"  # Never ask the mirrors (warm cache only)
+
+# --------------------------------------------------------------------------
+# Artifact Cache Settings
+# --------------------------------------------------------------------------
+# TFTP boot files are downloaded once to the host (sha256 store, resumable)
+# and pushed into user VMs instead of each VM fetching them with wget
+ARTIFACT_CACHE_ENABLED    = os.getenv("ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+ARTIFACT_CACHE_DIR        = os.getenv("ARTIFACT_CACHE_DIR", os.path.join(BASE_DIR, "artifacts"))
+ARTIFACT_SERVER_URL       = os.getenv("ARTIFACT_SERVER_URL", "")               # Defaults to http://<DRIVER_SERVER_IP>
+ARTIFACT_FETCH_TIMEOUT    = float(os.getenv("ARTIFACT_FETCH_TIMEOUT", "60"))   # Seconds without data before a retry
+ARTIFACT_FETCH_RETRIES    = int(os.getenv("ARTIFACT_FETCH_RETRIES", "5"))      # Each retry resumes the partial file
+ARTIFACT_PREFETCH         = os.getenv("ARTIFACT_PREFETCH", "true").lower() == "true"  # Mirror the boot files at startup
+ARTIFACT_PREFETCH_WORKERS = int(os.getenv("ARTIFACT_PREFETCH_WORKERS", "4"))
+
+# --------------------------------------------------------------------------
+# NFS Device Root Settings
+# --------------------------------------------------------------------------
+# "copy": unique dirs (etc, var, ...) copied per device, the rest symlinked
+# "overlay": overlayfs per device over the shared rootfs (no copy)
+NFS_ROOT_MODE       = os.getenv("NFS_ROOT_MODE", "copy")
+NFS_PREPARE_ENGINE  = os.getenv("NFS_PREPARE_ENGINE", "python")  # "python" (parallel nfs_root_prepare.py) or "bash"
+NFS_PREPARE_WORKERS = int(os.getenv("NFS_PREPARE_WORKERS", "8"))  # Device roots prepared at the same time
+
+# --------------------------------------------------------------------------
+# Warm VM Pool Settings
+# --------------------------------------------------------------------------
+VM_POOL_SIZE            = int(os.getenv("VM_POOL_SIZE", "0"))            # Pre-booted VMs kept ready, 0 disables the pool
+VM_POOL_PREFIX          = os.getenv("VM_POOL_PREFIX", "pool-vm")
+VM_POOL_UBUNTU_VERSION  = os.getenv("VM_POOL_UBUNTU_VERSION", "24.04")   # Only requests for this version are served
+VM_POOL_ROOT_SIZE       = os.getenv("VM_POOL_ROOT_SIZE", "40GiB")        # ... with this root size
+VM_POOL_REFILL_INTERVAL = float(os.getenv("VM_POOL_REFILL_INTERVAL", "30"))
+VM_POOL_MAX_LOAD        = float(os.getenv("VM_POOL_MAX_LOAD", "0.7"))    # 1-min load average per CPU above which no VM is built
+VM_POOL_MIN_FREE_MEM_MB = int(os.getenv("VM_POOL_MIN_FREE_MEM_MB", "8192"))  # Host memory kept free for user VMs
+
 # --------------------------------------------------------------------------
 # Redis Settings
 # --------------------------------------------------------------------------
@@ -35,6 +142,13 @@ REDIS_USER_INDEX = os.getenv("REDIS_USER_INDEX", "UserIdxs")
 # --------------------------------------------------------------------------
 VPN_NAME = os.getenv("VPN_NAME", "vm-openvpn-server")
 
+# --------------------------------------------------------------------------
+# Job Settings
+# --------------------------------------------------------------------------
+JOB_MAX_WORKERS  = int(os.getenv("JOB_MAX_WORKERS", "2"))    # Environments built in parallel
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "100"))  # Finished jobs kept for polling
+STEP_MAX_WORKERS = int(os.getenv("STEP_MAX_WORKERS", "4"))    # Provisioning steps run in parallel per job
+
 # --------------------------------------------------------------------------
 # FastAPI Application Settings
 # --------------------------------------------------------------------------
@@ -50,6 +164,7 @@ SWITCH_CONFIG_PATH = os.path.join(BASE_DIR,root_file_relative, "switch_config.js
 
 
 ACTIVE_USERS_PATH  = os.path.join(BASE_DIR, "active_users.json")
+ACTIVE_USERS_DB_PATH = os.getenv("ACTIVE_USERS_DB_PATH", os.path.join(BASE_DIR, "active_users.db"))
 NODE_CONFIG_PATH  = os.path.join(BASE_DIR, "nfs_node_configs.json")
 
 # If you have a separate CSV in a different location, you can keep it as-is:
@@ -64,6 +179,11 @@ RESSOURCE_CSV_PATH = os.getenv(
 
 SWITCH_PASSWORD = os.getenv("SWITCH_PASSWORD","")
 SWITCH_SECRET = os.getenv("SWITCH_SECRET","")
+SWITCH_KEEPALIVE_INTERVAL = int(os.getenv("SWITCH_KEEPALIVE_INTERVAL", "60"))  # Seconds between session keepalives
+SWITCH_IDLE_VLAN = int(os.getenv("SWITCH_IDLE_VLAN", "1"))  # Access VLAN of node ports removed from a user environment
+POE_POWER_BUDGET  = int(os.getenv("POE_POWER_BUDGET", "120"))   # Watts that may be switched on at once
+POE_PORT_WATTS    = int(os.getenv("POE_PORT_WATTS", "30"))      # Worst-case draw of one powered device
+POE_STAGGER_DELAY = float(os.getenv("POE_STAGGER_DELAY", "3"))  # Seconds between power-on batches
 # --------------------------------------------------------------------------
 # Logging Settings
 # --------------------------------------------------------------------------
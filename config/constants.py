@@ -24,8 +24,6 @@ NBD_SIZE = 16384
 
 # Define the nbd
 CONFIG_DIR = os.path.abspath(os.path.join(BASE_DIR, "../config"))
-IP_CONFIG_FILE_PATH = os.path.join(BASE_DIR, "ipconfig.txt")
-DHCP_CONFIG_FILE_PATH = os.path.join(CONFIG_DIR, "dhcpConfig.txt")
 RPI4_CONFIG_FILE_PATH = os.path.join(CONFIG_DIR, "tabhosts-rpi4.conf")
 JTX2_CONFIG_FILE_PATH = os.path.join(CONFIG_DIR, "tabhosts-jtx2.conf")
 #--- nfs 
@@ -43,6 +41,7 @@ USER_SCRIPT_PATH_3271 = "jetson/jp3541/"
 # nfs script name
 JETSON_SETUP_NFS = "nfs_setup.sh"
 RPI4_SETUP_NFS = "nfs_rpi4_setup.sh"
+NFS_ROOT_PREPARE = "nfs_root_prepare.py"  # Parallel replacement of both scripts
 # -------------------------------
 #  NFS Driver Settings
 # ------------------------------
@@ -53,10 +52,3 @@ DRIVER_RPI4 = "core-image-minimal-rpi4-rootfs.tar.bz2"
 DRIVER_3274_PATH = os.path.join(CONFIG_DIR, DRIVER_3541 )
 DRIVER_3541_PATH  = os.path.join(CONFIG_DIR, DRIVER_3541 )
 DRIVER_RPI4_PATH = os.path.join(CONFIG_DIR, DRIVER_RPI4 )
-BASE_IMAGE_J20_J40 = os.path.join(BASE_DIR, "nbd_jetson_jp3541.img")
-NBD_IMAGE_NAME_J20_J40 ="nbd_jetson_jp3541.img"
-
-BASE_IMAGE_J10 = os.path.join(BASE_DIR, "nbd_jetson_jp3274.img")
-NBD_IMAGE_NAME_J10 ="nbd_jetson_jp3274.img"
-BASE_IMAGE_JTX = os.path.join(BASE_DIR, "nbd_jetson_jp3274_tx2.img")
-NBD_IMAGE_NAME_JTX ="nbd_jetson_jp3274_tx2.img"
\ No newline at end of file
@@ -7,27 +7,63 @@ This package contains various utility scripts for system management.
 The modules are re-exported here for convenience.
 """
 
+from .apt_cache import *
+from .artifact_cache import *
 from .check_interface import *
+from .cloud_init import *
+from .config_templates import *
 from .container_create import *
 from .create_env import *
 from .create_env_vm import *
 from .destroy_env import *
+from .golden_image import *
 from .ip_addr_manager import *
+from .ipam import *
 from .jetson_ctl import *
+from .job_manager import *
+from .lxd_backend import *
 from .macvlan import *
+from .nbd_config import *
 from .network_interface import *
+from .readiness import *
+from .resource_inventory import *
+from .rootfs_cache import *
+from .rootfs_extract import *
+from .shared_rootfs import *
+from .step_graph import *
 from .user_env import *
+from .user_store import *
+from .vm_bundle import *
+from .vm_pool import *
 
 __all__ = [
     # List the modules that you want to expose for external use.
+    "apt_cache",
+    "artifact_cache",
     "check_interface",
+    "cloud_init",
+    "config_templates",
     "container_create",
     "create_env",
     "create_env_vm",
     "destroy_env",
+    "golden_image",
     "ip_addr_manager",
+    "ipam",
     "jetson_ctl",
+    "job_manager",
+    "lxd_backend",
     "macvlan",
+    "nbd_config",
     "network_interface",
+    "readiness",
+    "resource_inventory",
+    "rootfs_cache",
+    "rootfs_extract",
+    "shared_rootfs",
+    "step_graph",
     "user_env",
+    "user_store",
+    "vm_bundle",
+    "vm_pool",
 ]
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+from typing import Optional
+
+from config import (
+    APT_CACHE_ENABLED,
+    APT_CACHE_INSTANCE,
+    APT_CACHE_OFFLINE,
+    APT_CACHE_PORT,
+    APT_CACHE_UBUNTU_VERSION,
+    VM_AGENT_TIMEOUT,
+    VM_INTERFACE_TIMEOUT,
+    VM_SERVICE_TIMEOUT,
+)
+from scripts.lxd_backend import get_lxd, instance_address
+from scripts.readiness import wait_for
+from scripts.vm_bundle import VmBundle
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Files written into every VM: apt asks the detect script which proxy to use
+APT_PROXY_CONF = "/etc/apt/apt.conf.d/01testbed-proxy"
+APT_PROXY_DETECT = "/usr/local/bin/apt-proxy-detect"
+
+ACNG_CONFIG_FILE = "/etc/apt-cacher-ng/zz_testbed.conf"
+
+
+class AptCacheProxy:
+    """
+    Host-local apt-cacher-ng shared by every user VM.
+
+    The proxy runs in an LXD container on the bridge. VMs get its address at
+    launch through cloud-init vendor-data, so each .deb is downloaded from the
+    Ubuntu mirrors once and then served over the LAN. apt only goes through the
+    proxy while it answers (Proxy-Auto-Detect), so a stopped proxy never breaks
+    an install.
+    """
+
+    def __init__(self, instance: str = APT_CACHE_INSTANCE, port: int = APT_CACHE_PORT):
+        self.instance = instance
+        self.port = port
+        self.lock = threading.Lock()
+
+    def ensure_instance(self) -> None:
+        """
+        Launches and provisions the proxy container on first use, starts it if stopped.
+        """
+        with self.lock:
+            info = get_lxd().info(self.instance)
+            if info is not None:
+                if info["status"] != "Running":
+                    get_lxd().start(self.instance)
+                return
+            logging.info("Launching apt cache proxy %s", self.instance)
+            get_lxd().run(["lxc", "launch", f"ubuntu:{APT_CACHE_UBUNTU_VERSION}", self.instance,
+                           "-c", "boot.autostart=true"], check=True)
+            wait_for(lambda: get_lxd().exec(self.instance, ["true"]).returncode == 0,
+                     f"LXD agent in {self.instance}", VM_AGENT_TIMEOUT)
+            wait_for(lambda: instance_address(self.instance) is not None,
+                     f"IPv4 address of {self.instance}", VM_INTERFACE_TIMEOUT)
+            settings = [f"Port: {self.port}", "PassThroughPattern: .*"]
+            if APT_CACHE_OFFLINE:
+                # Serve the cached package lists without asking the mirrors
+                settings.append("Offlinemode: 1")
+            bundle = VmBundle(f"apt-cache {self.instance}")
+            bundle.run(["apt-get", "update"])
+            bundle.run(["env", "DEBIAN_FRONTEND=noninteractive", "apt-get", "-o", "DPkg::Lock::Timeout=600",
+                        "install", "-y", "apt-cacher-ng"])
+            bundle.add_bytes("\n".join(settings) + "\n", ACNG_CONFIG_FILE)
+            bundle.run(["systemctl", "enable", "apt-cacher-ng"])
+            bundle.run(["systemctl", "restart", "apt-cacher-ng"])
+            bundle.execute(self.instance)
+            wait_for(lambda: get_lxd().exec(self.instance, ["systemctl", "is-active", "--quiet",
+                                                            "apt-cacher-ng"]).returncode == 0,
+                     f"apt-cacher-ng in {self.instance}", VM_SERVICE_TIMEOUT)
+
+    def proxy_url(self) -> str:
+        address = instance_address(self.instance)
+        if address is None:
+            raise RuntimeError(f"apt cache proxy {self.instance} has no IPv4 address")
+        return f"http://{address}:{self.port}"
+
+    def write_files(self) -> list[dict]:
+        """
+        Returns the cloud-config write_files entries that point apt at the
+        proxy, or [] when the proxy cannot be started (VMs then use the
+        mirrors directly).
+        """
+        try:
+            self.ensure_instance()
+            proxy = self.proxy_url()
+        except Exception as e:
+            logging.warning("apt cache proxy unavailable, VMs use the mirrors directly: %s", e)
+            return []
+        host = proxy[len("http://"):].rsplit(":", 1)[0]
+        detect = ("#!/bin/bash\n"
+                  "# Prints the apt proxy while it answers, DIRECT otherwise\n"
+                  f"if timeout 1 bash -c ': </dev/tcp/{host}/{self.port}' 2>/dev/null; then\n"
+                  f"    echo {proxy}\n"
+                  "else\n"
+                  "    echo DIRECT\n"
+                  "fi\n")
+        return [
+            {"path": APT_PROXY_DETECT, "permissions": "0755", "content": detect},
+            {"path": APT_PROXY_CONF, "content": f'Acquire::http::Proxy-Auto-Detect "{APT_PROXY_DETECT}";\n'},
+        ]
+
+    def vendor_data(self) -> Optional[str]:
+        """
+        Returns the cloud-config that points apt at the proxy, or None when the
+        proxy cannot be started.
+
+        Keys of the user-data replace the vendor-data ones (lists are not
+        merged): a VM launched with its own write_files gets the proxy files
+        in its user-data instead (see user_data_files).
+        """
+        files = self.write_files()
+        if not files:
+            return None
+        # JSON is valid YAML: no yaml dependency for the cloud-config
+        return "#cloud-config\n" + json.dumps({"write_files": files}, indent=2) + "\n"
+
+    def user_data_files(self) -> list[dict]:
+        """
+        write_files entries to add to the user-data of a new VM ([] when
+        the proxy is disabled or unavailable).
+        """
+        return self.write_files() if APT_CACHE_ENABLED else []
+
+    def launch_options(self) -> list[str]:
+        """
+        Extra `lxc launch` arguments that configure the apt proxy in the new VM.
+        """
+        if not APT_CACHE_ENABLED:
+            return []
+        vendor_data = self.vendor_data()
+        return ["-c", f"cloud-init.vendor-data={vendor_data}"] if vendor_data else []
+
+
+APT_CACHE = AptCacheProxy()
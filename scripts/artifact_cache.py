@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import (
+    ARTIFACT_CACHE_DIR,
+    ARTIFACT_FETCH_RETRIES,
+    ARTIFACT_FETCH_TIMEOUT,
+    ARTIFACT_PREFETCH_WORKERS,
+    ARTIFACT_SERVER_URL,
+    NODE_CONFIG_PATH,
+)
+from config.constants import DRIVER_SERVER_IP
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Boot files of the TFTP setups, relative to the artifact server
+JTX2_KERNEL = "jtx2/Image"
+JTX2_DTB = "jtx2/tegra186-p3636-0001-p3509-0000-a01.dtb"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def rpi_boot_archive(rpi_version: str) -> str:
+    return f"{rpi_version}.tar.gz"
+
+
+def tftp_artifacts(config_path: str = NODE_CONFIG_PATH) -> list[str]:
+    """
+    Returns the TFTP boot files needed by the node patterns of the NFS
+    node-config registry (the RPi boot archives and the JTX2 kernel and dtb).
+    """
+    with open(config_path, "r") as file:
+        patterns = list(json.load(file))
+    names = [rpi_boot_archive(pattern) for pattern in patterns if pattern.startswith("rpi")]
+    if any(pattern.startswith("jtx") for pattern in patterns):
+        names += [JTX2_KERNEL, JTX2_DTB]
+    return names
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(8 * 1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Host-side mirror of the files user VMs used to download from the
+    driver server (TFTP boot archives, kernel images, device trees).
+
+    Files are stored once by sha256 under <root>/blobs and indexed by their
+    path on the server in <root>/index.json. A miss downloads the file with
+    HTTP range requests, so an interrupted transfer resumes where it stopped;
+    VmManager then pushes the local copy into the VM instead of running wget.
+    """
+
+    def __init__(self, root_dir: str = ARTIFACT_CACHE_DIR, base_url: Optional[str] = None,
+                 timeout: float = ARTIFACT_FETCH_TIMEOUT, retries: int = ARTIFACT_FETCH_RETRIES):
+        self.root_dir = root_dir
+        self.base_url = (base_url or ARTIFACT_SERVER_URL or f"http://{DRIVER_SERVER_IP}").rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.index_path = os.path.join(root_dir, "index.json")
+        self.lock = threading.Lock()
+        self.fetch_locks: dict[str, threading.Lock] = {}
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "resumed": 0, "bytes_downloaded": 0}
+
+    # --------------------------------------------------------------------------
+    # Index
+    # --------------------------------------------------------------------------
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root_dir, "blobs", digest)
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name.lstrip('/')}"
+
+    def lookup(self, name: str) -> Optional[str]:
+        """
+        Returns the local path of a cached artifact, or None when it is not
+        cached (or its blob is missing or truncated).
+        """
+        with self.lock:
+            entry = self._load_index().get(name)
+        if not entry:
+            return None
+        path = self._blob_path(entry["sha256"])
+        if not os.path.isfile(path) or os.path.getsize(path) != entry["size"]:
+            return None
+        return path
+
+    # --------------------------------------------------------------------------
+    # Download
+    # --------------------------------------------------------------------------
+    def _download(self, url: str, part: str) -> None:
+        """
+        Downloads url into part, continuing a previous partial download.
+        Raises OSError when the transfer is cut short (part is kept).
+        """
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Nothing left past offset: the previous transfer was complete
+                return
+            raise
+        with response:
+            if offset and response.status != 206:
+                logging.info("%s ignores range requests, downloading from the start", url)
+                offset = 0
+            elif offset:
+                logging.info("Resuming %s at byte %d", url, offset)
+                with self.lock:
+                    self.stats["resumed"] += 1
+            length = response.headers.get("Content-Length")
+            with open(part, "ab" if offset else "wb") as file:
+                shutil.copyfileobj(response, file, CHUNK_SIZE)
+            received = os.path.getsize(part) - offset
+        with self.lock:
+            self.stats["bytes_downloaded"] += received
+        if length is not None and received != int(length):
+            raise OSError(f"{url}: received {received} of {length} bytes")
+
+    def fetch(self, name: str, sha256: Optional[str] = None) -> str:
+        """
+        Returns the local path of an artifact, downloading it on a miss.
+
+        Args:
+            name: Path of the file on the artifact server, e.g. "jtx2/Image".
+            sha256: Expected digest; a mismatching download is discarded.
+        """
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(name, threading.Lock())
+        with fetch_lock:
+            path = self.lookup(name)
+            if path and (sha256 is None or os.path.basename(path) == sha256):
+                with self.lock:
+                    self.stats["hits"] += 1
+                logging.info("Artifact cache hit for %s", name)
+                return path
+            with self.lock:
+                self.stats["misses"] += 1
+            logging.info("Artifact cache miss for %s, downloading %s", name, self.url(name))
+            os.makedirs(os.path.join(self.root_dir, "partial"), exist_ok=True)
+            os.makedirs(os.path.join(self.root_dir, "blobs"), exist_ok=True)
+            part = os.path.join(self.root_dir, "partial", hashlib.sha256(name.encode()).hexdigest())
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self._download(self.url(name), part)
+                    break
+                except (OSError, urllib.error.URLError) as e:
+                    logging.warning("Download of %s failed (attempt %d/%d): %s", name, attempt, self.retries, e)
+                    # A missing file stays missing: only retry transfer and server errors
+                    not_found = isinstance(e, urllib.error.HTTPError) and e.code in (403, 404)
+                    if attempt == self.retries or not_found:
+                        with self.lock:
+                            self.stats["errors"] += 1
+                        raise
+                    time.sleep(2 ** attempt)
+            digest = file_sha256(part)
+            if sha256 and digest != sha256:
+                os.remove(part)
+                with self.lock:
+                    self.stats["errors"] += 1
+                raise ValueError(f"Checksum mismatch for {name}: expected {sha256}, got {digest}")
+            path = self._blob_path(digest)
+            os.replace(part, path)
+            with self.lock:
+                index = self._load_index()
+                index[name] = {"sha256": digest, "size": os.path.getsize(path), "url": self.url(name),
+                               "fetched": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                self._save_index(index)
+            return path
+
+    # --------------------------------------------------------------------------
+    # Prefetch
+    # --------------------------------------------------------------------------
+    def prefetch(self, names: list[str]) -> dict[str, Optional[str]]:
+        """
+        Fetches several artifacts concurrently.
+
+        Returns:
+            Name -> local path, or None for the artifacts that failed.
+        """
+        def fetch_or_none(name):
+            try:
+                return self.fetch(name)
+            except Exception as e:
+                logging.error("Prefetch of %s failed: %s", name, e)
+                return None
+
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(ARTIFACT_PREFETCH_WORKERS, len(names))) as executor:
+            return dict(zip(names, executor.map(fetch_or_none, names)))
+
+    def prefetch_async(self, names: list[str]) -> threading.Thread:
+        """
+        Runs prefetch() in a background thread.
+        """
+        thread = threading.Thread(target=self.prefetch, args=(names,), name="artifact-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["artifacts"] = len(self._load_index())
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / requests, 3) if requests else 0.0
+        return stats
+
+
+ARTIFACT_CACHE = ArtifactCache()
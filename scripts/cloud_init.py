@@ -0,0 +1,69 @@
+import json
+import random
+from typing import Iterable
+
+from scripts.config_templates import UPLINK_INTERFACE, render_netplan
+
+# Written by cloud-init on first boot; applied again by sysctl at every boot
+NAT_SYSCTL_FILE = "/etc/sysctl.d/60-testbed-nat.conf"
+
+
+def _cloud_config(config: dict) -> str:
+    # JSON is valid YAML: no yaml dependency for the cloud-config
+    return "#cloud-config\n" + json.dumps(config, indent=2) + "\n"
+
+
+def random_mac() -> str:
+    """
+    Returns a MAC address in the LXD range (00:16:3e), so the NFS NIC can be
+    matched by address in the network-config before the VM has ever booted.
+    """
+    return "00:16:3e:" + ":".join(f"{random.randint(0, 255):02x}" for _ in range(3))
+
+
+def nat_commands(uplink: str = UPLINK_INTERFACE) -> list[str]:
+    """
+    Shell commands that enable forwarding and masquerade through the uplink;
+    safe to run again (the iptables rule is only added once).
+    """
+    rule = f"-t nat -C POSTROUTING -o {uplink} -j MASQUERADE"
+    return [
+        "sysctl -w net.ipv4.ip_forward=1",
+        f"iptables {rule} 2>/dev/null || iptables {rule.replace('-C', '-A', 1)}",
+    ]
+
+
+def render_network_config(nfs_ip_addr: str, nfs_mac: str) -> str:
+    """
+    Renders the cloud-init network-config of a user VM (its netplan config,
+    with the MACVLAN NIC matched by nfs_mac).
+    """
+    return render_netplan(nfs_ip_addr, nfs_mac)
+
+
+def render_user_data(ssh_keys: Iterable[str] = (), packages: Iterable[str] = (),
+                     uplink: str = UPLINK_INTERFACE, write_files: Iterable[dict] = ()) -> str:
+    """
+    Renders the cloud-init user-data of a user VM: NAT at every boot, root
+    SSH keys and, for VMs not launched from the golden image, the packages.
+
+    write_files are extra files (e.g. the apt proxy config): the user-data
+    write_files list replaces the vendor-data one, so they must be here.
+    """
+    config = {
+        "write_files": [
+            {"path": NAT_SYSCTL_FILE, "content": "net.ipv4.ip_forward=1\n"},
+        ] + list(write_files),
+        # bootcmd runs at every boot, iptables rules do not survive a reboot
+        "bootcmd": nat_commands(uplink),
+    }
+    ssh_keys = list(ssh_keys)
+    if ssh_keys:
+        # Keys go to the default user and, with disable_root off, to root
+        config["disable_root"] = False
+        config["ssh_authorized_keys"] = ssh_keys
+    packages = list(packages)
+    if packages:
+        config["package_update"] = True
+        config["packages"] = packages
+    return _cloud_config(config)
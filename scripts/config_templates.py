@@ -0,0 +1,89 @@
+import ipaddress
+import json
+from typing import Iterable, Optional
+
+from config import VM_INTERFACE
+
+# Service configs of user VMs, rendered per request and shipped with
+# VmBundle.add_bytes: nothing is written on the host, so environments can
+# be built concurrently (the nbd-server config is in scripts.nbd_config)
+
+# Interface of the VM on the LXD bridge (default profile NIC): DHCP, NAT uplink
+UPLINK_INTERFACE = "enp5s0"
+
+# Written in the VM
+NETPLAN_FILE = "/etc/netplan/50-cloud-init.yaml"
+DHCPD_CONF_FILE = "/etc/dhcp/dhcpd.conf"
+DHCPD_SUBNET_FILE = "/etc/dhcp/dhcpd.testbed.conf"  # Included once from dhcpd.conf
+TFTPD_CONFIG_FILE = "/etc/default/tftpd-hpa"
+TFTP_ROOT = "/var/lib/tftpboot"
+
+# Static host tables shipped to /etc/dhcp and included by the subnet config
+DHCP_HOST_TABLES = ["tabhosts-rpi4.conf", "tabhosts-jtx2.conf"]
+DHCP_DNS_SERVERS = ["8.8.8.8", "8.8.4.4"]
+
+
+def render_netplan(nfs_ip_addr: str, nfs_mac: Optional[str] = None, interface: str = VM_INTERFACE,
+                   uplink: str = UPLINK_INTERFACE) -> str:
+    """
+    Renders the netplan (v2) config of a user VM: DHCP on the bridge uplink,
+    the static NFS address on the MACVLAN NIC. Used as cloud-init
+    network-config and as NETPLAN_FILE.
+
+    Args:
+        nfs_ip_addr: Address with prefix, e.g. "10.111.3.1/24".
+        nfs_mac: hwaddr of the MACVLAN NIC; without it the NIC is matched by name.
+    """
+    nfs_nic = {"dhcp4": False, "addresses": [nfs_ip_addr]}
+    if nfs_mac:
+        nfs_nic.update({"match": {"macaddress": nfs_mac}, "set-name": interface})
+    config = {
+        "network": {
+            "version": 2,
+            "ethernets": {
+                uplink: {"dhcp4": True},
+                interface: nfs_nic,
+            },
+        }
+    }
+    # JSON is valid YAML: no yaml dependency
+    return json.dumps(config, indent=2) + "\n"
+
+
+def render_dhcpd_subnet(nfs_ip_addr: str, host_tables: Iterable[str] = DHCP_HOST_TABLES) -> str:
+    """
+    Renders the isc-dhcp-server subnet of the user network: the NFS address
+    is the router and the 6 addresses after it (+2 to +7) are leased.
+
+    Args:
+        nfs_ip_addr: NFS address of the VM, e.g. "10.111.3.1/24".
+    """
+    interface = ipaddress.ip_interface(nfs_ip_addr)
+    network = interface.network
+    address = interface.ip
+    lines = [
+        f"subnet {network.network_address} netmask {network.netmask} {{",
+        f"    range {address + 2} {address + 7};",
+        f"    option routers {address};",
+        f"    option domain-name-servers {', '.join(DHCP_DNS_SERVERS)};",
+        "}",
+    ]
+    lines += [f'include "/etc/dhcp/{table}";' for table in host_tables]
+    return "\n".join(lines) + "\n"
+
+
+def render_tftpd_config(directory: str = TFTP_ROOT) -> str:
+    """
+    Renders /etc/default/tftpd-hpa serving directory.
+    """
+    return (f'TFTP_USERNAME="tftp"\n'
+            f'TFTP_DIRECTORY="{directory}"\n'
+            f'TFTP_ADDRESS=":69"\n'
+            f'TFTP_OPTIONS="--secure"\n')
+
+
+def render_export_line(path: str, options: str, clients: str = "*") -> str:
+    """
+    Renders one /etc/exports entry.
+    """
+    return f"{path} {clients}({options})"
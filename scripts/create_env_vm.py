@@ -1,5 +1,5 @@
+import shlex
 import subprocess
-import time
 import json
 import os
 import sys
@@ -7,15 +7,49 @@ import logging
 from typing import Any, Optional
 import pylxd
 import redis
-from config import DHCP_CONFIG_FILE_PATH, DRIVER_SERVER_IP, IP_CONFIG_FILE_PATH, JETSON_SETUP_NFS, JTX2_CONFIG_FILE_PATH,  REDIS_HOST, REDIS_PORT, REDIS_USER_INDEX, ROOT_FS_RPI4, RPI4_SETUP_NFS, VM_INTERFACE ,USER_SCRIPT_PATH ,TOOLS_SCRIPT_PATH ,NBD_SIZE
-from config.constants import BASE_IMAGE_J10, BASE_IMAGE_J20_J40, BASE_IMAGE_JTX ,NBD_IMAGE_NAME_J10, NBD_IMAGE_NAME_J20_J40, NBD_IMAGE_NAME_JTX, ROOT_FS_3274, RPI4_CONFIG_FILE_PATH
+from config import VM_AGENT_TIMEOUT, VM_INTERFACE_TIMEOUT, VM_SERVICE_TIMEOUT
+from config import GOLDEN_IMAGE_ALIAS, GOLDEN_IMAGE_ENABLED, GOLDEN_IMAGE_VERSION
+from config import ARTIFACT_CACHE_ENABLED, HOST_INTERFACE
+from config import NFS_PREPARE_ENGINE, NFS_PREPARE_WORKERS, NFS_ROOT_MODE, ROOTFS_CACHE_ENABLED, SHARED_ROOTFS_ENABLED
+from config import DRIVER_SERVER_IP, JETSON_SETUP_NFS, NFS_ROOT_PREPARE, REDIS_HOST, REDIS_PORT, REDIS_USER_INDEX, ROOT_FS_RPI4, RPI4_SETUP_NFS, VM_INTERFACE ,USER_SCRIPT_PATH ,TOOLS_SCRIPT_PATH ,NBD_SIZE
+from config.constants import CONFIG_DIR, ROOT_FS_3274
+from scripts.apt_cache import APT_CACHE
+from scripts.config_templates import (DHCP_HOST_TABLES, DHCPD_CONF_FILE, DHCPD_SUBNET_FILE, NETPLAN_FILE,
+                                      TFTP_ROOT, TFTPD_CONFIG_FILE, render_dhcpd_subnet, render_netplan,
+                                      render_tftpd_config)
+from scripts.cloud_init import nat_commands, random_mac, render_network_config, render_user_data
+from scripts.artifact_cache import ARTIFACT_CACHE, JTX2_DTB, JTX2_KERNEL, rpi_boot_archive
 from scripts.macvlan import MacVlan
-from scripts.ip_addr_manager import IpAddr
-from switch.switch_manager import SwitchManager
+from scripts.nbd_config import (NBD_CONFIG_FILE, NBD_EXPORT_PREFIX, content_hash, load_node_images, node_base_image,
+                                node_folder, parse_exported_nodes, render_nbd_config)
+from scripts.lxd_backend import get_lxd
+from scripts.readiness import wait_for
+from scripts.rootfs_cache import ROOTFS_CACHE
+from scripts.rootfs_extract import PARALLEL_PACKAGES, extractor, preferred_tarball
+from scripts.shared_rootfs import SHARED_ROOTFS
+from scripts.vm_bundle import VmBundle
+from switch.switch_session import SWITCH_SESSIONS
 
 
 # Setup module-level logger
 logger = logging.getLogger(__name__)
+
+# apt-get waits for the dpkg lock instead of failing, so installs can overlap
+APT_INSTALL = ["env", "DEBIAN_FRONTEND=noninteractive", "apt-get", "-o", "DPkg::Lock::Timeout=600", "install", "-y"]
+
+# Installed by cloud-init on first boot of a VM launched from the stock image
+FIRST_BOOT_PACKAGES = ["binutils", "bzip2", "nfs-kernel-server", "tftpd-hpa", "nbd-server", "isc-dhcp-server"]
+
+# Device name of the MACVLAN NIC on the user VLAN (VM_INTERFACE inside the VM)
+MACVLAN_DEVICE = "eth2"
+
+# Written into golden images: the image version, and a marker left in every
+# pre-extracted rootfs until the per-user files have been pushed into it
+GOLDEN_VERSION_FILE = "/etc/testbed-golden-version"
+GOLDEN_ROOTFS_MARKER = ".golden-rootfs"
+# Shared NBD base images in the VM; per-node images are thin copies of them
+NBD_BASE_DIR = "/root/nbd_base"
+
 class VmManager:
     """
     A class to manage Virtual Machines using LXC.
@@ -34,7 +68,7 @@ class VmManager:
         """
         full_command = ["lxc", "exec", vm_name, "--"] + command
         try:
-            result =subprocess.run(full_command, capture_output=True,check=True, text=True)
+            result = get_lxd().run(full_command, check=True)
             logging.info("Command succeeded: %s", " ".join(command))
             return result
         except subprocess.CalledProcessError as e:
@@ -45,9 +79,24 @@ class VmManager:
     def run_command(command: list[str], description: str) -> None:
         """
         Runs a shell command with a description.
+
+        lxc commands go through the LXD backend (no fork with pylxd); their
+        output is logged once the command has finished.
         """
         logging.info("Running: %s", description)
         logging.info("Command: %s", " ".join(command))
+        if command[0] == "lxc":
+            result = get_lxd().run(command)
+            for line in result.stdout.splitlines():
+                logging.info(line.strip())
+            if result.stderr:
+                logging.error(result.stderr)
+            if result.returncode != 0:
+                error_message = f"Command execution failed with return code {result.returncode}"
+                logging.error(error_message)
+                raise Exception(error_message)
+            logging.info("Command executed successfully")
+            return
         process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         while True:
             output = process.stdout.readline()
@@ -64,6 +113,14 @@ class VmManager:
             raise Exception(error_message)
         else:
             logging.info("Command executed successfully")
+
+    def apt_install(self, vm_name: str, packages: list[str]) -> None:
+        """
+        Installs packages inside the VM, waiting for any concurrent apt run.
+        """
+        self.run_command(["lxc", "exec", vm_name, "--"] + APT_INSTALL + packages,
+                         f"Install {' '.join(packages)}")
+
     def folder_exists(self, vm_name: str, folder: str) -> bool:
         """
         Checks if the folder specified by nfs_root exists in the LXC container.
@@ -72,15 +129,7 @@ class VmManager:
             lxc file list <vm_name>/mnt/nfs
         and returns True if the folder exists.
         """
-        # Construct the command using the container name and the folder path.
-        check_command = ["lxc", "exec", vm_name, "--", "test", "-d", folder]
-        try:
-            # Attempt to check if the directory exists inside the container.
-            self.run_command(check_command, f"Check if directory {folder} exists")
-            return True
-        except Exception:
-            # If the command fails (i.e., the folder doesn't exist), return False.
-            return False
+        return get_lxd().exec(vm_name, ["test", "-d", folder]).returncode == 0
     # --------------------------------------------------------------------------
     # 2. VM State Checkers & Helpers
     # --------------------------------------------------------------------------
@@ -88,27 +137,13 @@ class VmManager:
         """
         Checks if the given VM is running.
         """
-        list_command = ["lxc", "list", vm_name, "--format", "json"]
-        try:
-            result = subprocess.run(list_command, capture_output=True, text=True, check=True)
-            instances = json.loads(result.stdout)
-            return bool(instances and instances[0]["name"] == vm_name and instances[0]["status"] == "Running")
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to execute command: %s", e)
-            return False
+        return get_lxd().state(vm_name) == "Running"
 
     def is_vm_stopped(self, vm_name: str) -> bool:
         """
         Checks if the given VM is stopped.
         """
-        list_command = ["lxc", "list", vm_name, "--format", "json"]
-        try:
-            result = subprocess.run(list_command, capture_output=True, text=True, check=True)
-            instances = json.loads(result.stdout)
-            return bool(instances and instances[0]["name"] == vm_name and instances[0]["status"] == "Stopped")
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to execute command: %s", e)
-            return False
+        return get_lxd().state(vm_name) == "Stopped"
 
     def is_interface_up(self, vm_name: str, interface_name: str = "enp5s0") -> bool:
         """
@@ -116,26 +151,90 @@ class VmManager:
         """
         check_command = ["lxc", "exec", vm_name, "--", "ip", "-c", "a"]
         try:
-            result = subprocess.run(check_command, capture_output=True, text=True, check=True)
+            result = get_lxd().run(check_command, check=True)
             return interface_name in result.stdout
         except subprocess.CalledProcessError:
             return False
 
+    def is_agent_ready(self, vm_name: str) -> bool:
+        """
+        Checks if the LXD agent inside the VM accepts exec requests.
+        """
+        return get_lxd().exec(vm_name, ["true"]).returncode == 0
+
+    def interface_has_address(self, vm_name: str, interface_name: str, address: Optional[str] = None) -> bool:
+        """
+        Checks if the interface has an IPv4 address (a specific one if given, e.g. "10.111.3.4/24").
+        """
+        result = get_lxd().exec(vm_name, ["ip", "-4", "-o", "addr", "show", "dev", interface_name])
+        if result.returncode != 0:
+            return False
+        if address is None:
+            return " inet " in result.stdout
+        return f" {address} " in result.stdout or f" {address}/" in result.stdout
+
+    def is_service_active(self, vm_name: str, service: str) -> bool:
+        """
+        Checks if a systemd unit is active inside the VM.
+        """
+        return get_lxd().exec(vm_name, ["systemctl", "is-active", "--quiet", service]).returncode == 0
+
+    def wait_for_agent(self, vm_name: str, timeout: float = VM_AGENT_TIMEOUT) -> float:
+        return wait_for(lambda: self.is_agent_ready(vm_name), f"LXD agent in VM {vm_name}", timeout)
+
+    def wait_for_interface(self, vm_name: str, interface_name: str, address: Optional[str] = None,
+                           timeout: float = VM_INTERFACE_TIMEOUT) -> float:
+        description = f"{address or 'an address'} on {interface_name} in VM {vm_name}"
+        return wait_for(lambda: self.interface_has_address(vm_name, interface_name, address), description, timeout)
+
+    def wait_for_service(self, vm_name: str, service: str, timeout: float = VM_SERVICE_TIMEOUT) -> float:
+        return wait_for(lambda: self.is_service_active(vm_name, service), f"{service} active in VM {vm_name}", timeout)
+
+    def golden_image_alias(self, ubuntu_version: str) -> str:
+        return f"{GOLDEN_IMAGE_ALIAS}-{ubuntu_version}-v{GOLDEN_IMAGE_VERSION}"
+
+    def image_exists(self, alias: str) -> bool:
+        """
+        Checks if a local LXD image with this alias exists.
+        """
+        result = get_lxd().run(["lxc", "image", "info", alias])
+        return result.returncode == 0
+
+    def golden_version(self, vm_name: str) -> Optional[str]:
+        """
+        Returns the golden image version the VM was launched from, or None.
+        """
+        result = get_lxd().exec(vm_name, ["cat", GOLDEN_VERSION_FILE])
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def is_golden(self, vm_name: str) -> bool:
+        """
+        Checks if the VM comes from the current golden image, i.e. the
+        package installs and service setup can be skipped.
+        """
+        return self.golden_version(vm_name) == GOLDEN_IMAGE_VERSION
+
+    def golden_rootfs_pending(self, vm_name: str, nfs_root: str) -> bool:
+        """
+        Checks if nfs_root was pre-extracted in the golden image and still
+        needs its per-user files.
+        """
+        marker = os.path.join(nfs_root, GOLDEN_ROOTFS_MARKER)
+        return get_lxd().exec(vm_name, ["test", "-f", marker]).returncode == 0
+
     def check_vm_exists(self, vm_name: str) -> bool:
         """
         Checks if the specified VM exists.
         """
-        client = pylxd.Client()
-        for instance in client.instances.all():
-            if instance.name == vm_name and instance.type == 'virtual-machine':
-                return True
-        return False
+        info = get_lxd().info(vm_name)
+        return bool(info and info["type"] == "virtual-machine")
 
     def get_vm_ip(self, vm_name: str) -> Optional[str]:
         """
         Retrieves the IP address of the VM using pylxd.
         """
-        client = pylxd.Client()
+        # Reuse the backend's client when it has one
+        client = getattr(get_lxd(), "client", None) or pylxd.Client()
         try:
             vm = client.virtual_machines.get(vm_name)
             network_info = vm.state().network
@@ -150,23 +249,64 @@ class VmManager:
     # --------------------------------------------------------------------------
     # 3. VM Lifecycle Management
     # --------------------------------------------------------------------------
-    def create_user_vm(self, ubuntu_version: str, vm_name: str, root_size: str) -> dict[str, Any]:
+    def create_user_vm(self, ubuntu_version: str, vm_name: str, root_size: str,
+                       nfs_ip_addr: Optional[str] = None, network_id: Optional[int] = None,
+                       ssh_keys: Optional[list[str]] = None) -> dict[str, Any]:
         """
         Creates a new user VM if it does not already exist.
-        Returns a dict indicating if the VM was created.
+
+        The VM is launched from the golden image for this Ubuntu version when
+        one is available, otherwise from the stock ubuntu image.
+
+        With nfs_ip_addr and network_id the VM is configured on first boot:
+        the MACVLAN NIC is added before the VM starts, and cloud-init gets the
+        network-config (static NFS address) and user-data (NAT, SSH keys,
+        packages), so no network reconfiguration is needed afterwards.
+
+        Returns a dict indicating if the VM was created, from which image and
+        whether it was configured on first boot.
         """
         if self.check_vm_exists(vm_name):
             logging.info("VM %s already exists!", vm_name)
             return {"created": False}
-        command = f"lxc launch ubuntu:{ubuntu_version} {vm_name} --vm --device root,size={root_size} -c limits.cpu=4 -c limits.memory=4GiB"
-        logging.info("Executing command: %s", command)
+        image = f"ubuntu:{ubuntu_version}"
+        if GOLDEN_IMAGE_ENABLED:
+            alias = self.golden_image_alias(ubuntu_version)
+            if self.image_exists(alias):
+                image = alias
+            else:
+                logging.warning("Golden image %s not found, launching from %s", alias, image)
+        first_boot = nfs_ip_addr is not None and network_id is not None
+        command = ["lxc", "init" if first_boot else "launch", image, vm_name, "--vm",
+                   "--device", f"root,size={root_size}",
+                   "-c", "limits.cpu=4", "-c", "limits.memory=4GiB"]
+        logging.info("Executing command: %s", " ".join(command))
+        if first_boot:
+            nfs_mac = random_mac()
+            packages = [] if image != f"ubuntu:{ubuntu_version}" else FIRST_BOOT_PACKAGES + PARALLEL_PACKAGES
+            # The apt proxy files go in the user-data: its write_files would replace the vendor-data ones
+            user_data = render_user_data(ssh_keys or [], packages, write_files=APT_CACHE.user_data_files())
+            command += ["-c", f"cloud-init.network-config={render_network_config(nfs_ip_addr, nfs_mac)}",
+                        "-c", f"cloud-init.user-data={user_data}"]
+        else:
+            command += APT_CACHE.launch_options()
         try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
+            result = get_lxd().run(command, check=True)
             logging.info("STDOUT: %s", result.stdout)
-            return {"created": True}
         except subprocess.CalledProcessError as e:
             logging.error("Failed to create VM %s. Error: %s", vm_name, e)
             raise
+        if first_boot:
+            try:
+                self.add_macvlan_nic(vm_name, network_id, HOST_INTERFACE, nfs_mac)
+                get_lxd().start(vm_name)
+            except Exception as e:
+                # A VM left without its MACVLAN NIC would be taken as an existing,
+                # configured VM by the next create: remove it so that one starts over
+                logging.error("First boot of VM %s failed, deleting it. Error: %s", vm_name, e)
+                get_lxd().run(["lxc", "delete", vm_name, "--force"])
+                raise
+        return {"created": True, "image": image, "first_boot": first_boot}
 
     def start_vm(self, vm_name: str) -> int:
         """
@@ -175,19 +315,16 @@ class VmManager:
         """
         if not self.is_vm_running(vm_name):
             logging.info("Starting VM %s...", vm_name)
-            subprocess.run(['lxc', 'start', vm_name], check=True)
-            timeout = 30
-            interval = 2
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                if self.is_interface_up(vm_name, VM_INTERFACE):
-                    logging.info("VM %s is running with an active network interface.", vm_name)
-                    self.configure_vm_nat(vm_name)
-                    return 0
-                logging.info("Waiting for interface in VM %s to come up...", vm_name)
-                time.sleep(interval)
-            logging.warning("VM %s started, but network interface is still down.", vm_name)
-            return 1
+            get_lxd().start(vm_name)
+            try:
+                wait_for(lambda: self.is_interface_up(vm_name, VM_INTERFACE),
+                         f"interface {VM_INTERFACE} in VM {vm_name}", VM_AGENT_TIMEOUT)
+            except TimeoutError:
+                logging.warning("VM %s started, but network interface is still down.", vm_name)
+                return 1
+            logging.info("VM %s is running with an active network interface.", vm_name)
+            self.configure_vm_nat(vm_name)
+            return 0
         else:
             logging.info("VM %s is already running!", vm_name)
             return 0
@@ -199,7 +336,7 @@ class VmManager:
         if not self.is_vm_stopped(vm_name):
             command = ['lxc', 'stop', vm_name, '--force']
             try:
-                subprocess.run(command, check=True)
+                get_lxd().run(command, check=True)
                 logging.info("VM %s stopped successfully.", vm_name)
             except subprocess.CalledProcessError as e:
                 logging.error("Failed to stop VM %s. Error: %s", vm_name, e)
@@ -214,8 +351,10 @@ class VmManager:
         if self.is_vm_running(vm_name):
             delete_command = ["lxc", "delete", vm_name, "--force"]
             try:
-                subprocess.run(delete_command, capture_output=True, text=True, check=True)
+                get_lxd().run(delete_command, check=True)
                 logging.info("VM %s has been deleted.", vm_name)
+                if ROOTFS_CACHE_ENABLED:
+                    ROOTFS_CACHE.release(vm_name)
             except subprocess.CalledProcessError as e:
                 logging.error("Failed to delete VM %s. Error: %s", vm_name, e)
                 raise
@@ -229,13 +368,9 @@ class VmManager:
         """
         Enables IP forwarding and sets up NAT inside the VM.
         """
-        commands = [
-            "sysctl -w net.ipv4.ip_forward=1",
-            "iptables -t nat -A POSTROUTING -o enp5s0 -j MASQUERADE"
-        ]
-        for cmd in commands:
+        for cmd in nat_commands():
             try:
-                subprocess.run(['lxc', 'exec', vm_name, '--', 'sh', '-c', cmd], check=True)
+                get_lxd().run(['lxc', 'exec', vm_name, '--', 'sh', '-c', cmd], check=True)
                 logging.info("Executed in %s: %s", vm_name, cmd)
             except subprocess.CalledProcessError as e:
                 logging.error("Error configuring NAT in VM %s: %s", vm_name, e)
@@ -243,48 +378,24 @@ class VmManager:
 
     def set_nfs_ip_addr(self, vm_name: str, nfs_ip_addr: str) -> None:
         """
-        Configures the NFS IP address inside the VM.
+        Checks that the NFS IP address is set inside the VM.
+
+        VMs created with first-boot configuration already have it; other VMs
+        (claimed from the pool, or created before) get the netplan config
+        written and applied once.
         """
         interface_name = VM_INTERFACE
-        if self.interface_check(vm_name, interface_name):
-            command_check = ["lxc", "exec", vm_name, "--", "ip", "addr", "show", interface_name]
-            try:
-                result = subprocess.run(command_check, capture_output=True, text=True, check=True)
-                if nfs_ip_addr in result.stdout:
-                    logging.info("IP %s already set on %s; skipping update.", nfs_ip_addr, interface_name)
-                    return
-            except subprocess.CalledProcessError as e:
-                logging.error("Failed to check IP address: %s", e)
-                return
-
-            ip = IpAddr()
-            ip.update_network_config(IP_CONFIG_FILE_PATH, nfs_ip_addr)
-            push_command = ["lxc", "file", "push", IP_CONFIG_FILE_PATH, f"{vm_name}/root/"]
-            self.run_command(push_command, "Copy NFS IP config")
-            time.sleep(7)
-            lxc_command = f"lxc exec {vm_name} -- sh -c \"cat /root/ipconfig.txt > /etc/netplan/50-cloud-init.yaml\""
-            try:
-                result = subprocess.run(lxc_command, shell=True, capture_output=True, text=True)
-                logging.info("Updated netplan: %s", result.stdout)
-            except subprocess.CalledProcessError as e:
-                logging.error("Failed to update netplan: %s", e)
-            disable_cloud_init = [
-                "lxc", "exec", vm_name, "--", "sudo", "sh", "-c",
-                "echo 'network: {config: disabled}' > /etc/cloud/cloud.cfg.d/99-disable-network-config.cfg"
-            ]
-            try:
-                subprocess.run(disable_cloud_init, capture_output=True, text=True, check=True)
-                logging.info("Disabled cloud-init network configuration.")
-            except subprocess.CalledProcessError as e:
-                logging.error("Failed to disable cloud-init: %s", e)
-            netplan_apply = ["lxc", "exec", vm_name, "--", "sudo", "netplan", "apply"]
-            logging.info("Applying netplan configuration: %s", " ".join(netplan_apply))
-            try:
-                subprocess.run(netplan_apply, capture_output=True, text=True, check=True)
-                time.sleep(7)
-                logging.info("Netplan applied successfully.")
-            except subprocess.CalledProcessError as e:
-                logging.error("Netplan apply failed: %s", e)
+        if self.interface_has_address(vm_name, interface_name, nfs_ip_addr):
+            logging.info("IP %s already set on %s; skipping update.", nfs_ip_addr, interface_name)
+            return
+        if not self.interface_check(vm_name, interface_name):
+            return
+        bundle = VmBundle(f"nfs-ip {vm_name}")
+        bundle.add_bytes(render_netplan(nfs_ip_addr), NETPLAN_FILE, 0o600)
+        bundle.add_bytes("network: {config: disabled}\n", "/etc/cloud/cloud.cfg.d/99-disable-network-config.cfg")
+        bundle.run(["netplan", "apply"], "Apply netplan configuration")
+        bundle.execute(vm_name)
+        self.wait_for_interface(vm_name, interface_name, nfs_ip_addr)
 
     def interface_check(self, vm_name: str, interface_name: str) -> bool:
         """
@@ -292,7 +403,7 @@ class VmManager:
         """
         command = ["lxc", "exec", vm_name, "--", "ip", "-c", "a"]
         try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
+            result = get_lxd().run(command, check=True)
             if interface_name in result.stdout:
                 logging.info("Interface %s is present in VM %s.", interface_name, vm_name)
                 return True
@@ -309,19 +420,28 @@ class VmManager:
         """
         Adds a MACVLAN NIC to the VM and configures VLAN on the switch.
         """
+        self.add_macvlan_nic(vm_name, network_id, interface_name)
+        self.configure_switch_vlan(network_id, switch_config)
+
+    def add_macvlan_nic(self, vm_name: str, network_id: int, interface_name: str,
+                        hwaddr: Optional[str] = None) -> None:
+        """
+        Adds the MACVLAN NIC on the user VLAN to the VM (hwaddr fixes its MAC).
+        """
         command = [
-            "lxc", "config", "device", "add", vm_name, 'eth2', "nic",
+            "lxc", "config", "device", "add", vm_name, MACVLAN_DEVICE, "nic",
             "nictype=macvlan", f"parent={interface_name}", f"vlan={network_id}"
         ]
-        self.run_command(command, f"Adding eth2 NIC to VM '{vm_name}' with MACVLAN (VLAN {network_id})")
-        device = switch_config
-        switch = SwitchManager(
-            device_type=device['device_type'],
-            ip=device['ip'],
-            port=device['port'],
-            password=device['password']
-        )
-        switch.configure_vlan(network_id, f"vlan{network_id}")
+        if hwaddr:
+            command.append(f"hwaddr={hwaddr}")
+        self.run_command(command, f"Adding {MACVLAN_DEVICE} NIC to VM '{vm_name}' with MACVLAN (VLAN {network_id})")
+
+    def configure_switch_vlan(self, network_id: int, switch_config: dict) -> None:
+        """
+        Creates the user VLAN on the testbed switch.
+        """
+        with SWITCH_SESSIONS.session(switch_config) as switch:
+            switch.configure_vlan(network_id, f"vlan{network_id}")
 
     def delete_macvlan_for_vm(self, macvlan_manager: MacVlan, macvlan_name: str) -> None:
         """
@@ -337,9 +457,9 @@ class VmManager:
         """
         Attaches a MACVLAN interface to the VM.
         """
-        command = f"lxc config device add {vm_name} eth1 nic nictype=macvlan parent={macvlan_name}"
+        command = ["lxc", "config", "device", "add", vm_name, "eth1", "nic", "nictype=macvlan", f"parent={macvlan_name}"]
         try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
+            result = get_lxd().run(command, check=True)
             logging.info("Attached MACVLAN. STDOUT: %s", result.stdout)
         except subprocess.CalledProcessError as e:
             logging.error("Failed to attach MACVLAN to VM %s. Error: %s", vm_name, e)
@@ -352,161 +472,71 @@ class VmManager:
         """
         Installs and configures a DHCP server inside the VM.
         """
-        install_command = ["lxc", "exec", vm_name, "--", "sudo", "apt", "install", "-y", "isc-dhcp-server"]
-        self.run_command(install_command, "Install DHCP server")
-        ip = IpAddr()
-        push_rpi_config = ["lxc", "file", "push",RPI4_CONFIG_FILE_PATH, f"{vm_name}/etc/dhcp/"]
-        self.run_command(push_rpi_config, "Copy rpi config")
-        push_jtx_config = ["lxc", "file", "push",JTX2_CONFIG_FILE_PATH, f"{vm_name}/etc/dhcp/"]
-        self.run_command(push_jtx_config, "push_jtx_config")
-        ip.update_dhcp_configuration(DHCP_CONFIG_FILE_PATH, nfs_ip_addr)
-        push_cmd = ["lxc", "file", "push",DHCP_CONFIG_FILE_PATH, f"{vm_name}/root/"]
-        self.run_command(push_cmd, "Copy DHCP config")
-        lxc_cmd = f"lxc exec {vm_name} -- sh -c \"sudo cat /root/dhcpConfig.txt >> /etc/dhcp/dhcpd.conf\""
-        try:
-            subprocess.run(lxc_cmd, shell=True, capture_output=True, text=True, check=True)
-            logging.info("DHCP config appended.")
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to update DHCP config: %s", e)
-        for action in [("restart", "Restart DHCP server"), ("enable", "Enable DHCP server")]:
-            cmd = ["lxc", "exec", vm_name, "--", "sudo", "systemctl", action[0], "isc-dhcp-server"]
-            self.run_command(cmd, action[1])
-
-    def create_nfs_server(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str) -> None:
+        self.apt_install(vm_name, ["isc-dhcp-server"])
+        bundle = VmBundle(f"dhcp-server {vm_name}")
+        for table in DHCP_HOST_TABLES:
+            bundle.add_file(os.path.join(CONFIG_DIR, table), f"/etc/dhcp/{table}")
+        # The subnet lives in its own file: rewriting it never duplicates it in dhcpd.conf
+        bundle.add_bytes(render_dhcpd_subnet(nfs_ip_addr), DHCPD_SUBNET_FILE)
+        include = f'include "{DHCPD_SUBNET_FILE}";'
+        bundle.run(f"grep -qxF {shlex.quote(include)} {DHCPD_CONF_FILE} || "
+                   f"echo {shlex.quote(include)} >> {DHCPD_CONF_FILE}", "Include the user subnet")
+        bundle.run(["systemctl", "restart", "isc-dhcp-server"], "Restart DHCP server")
+        bundle.run(["systemctl", "enable", "isc-dhcp-server"], "Enable DHCP server")
+        bundle.execute(vm_name)
+
+    def _setup_nfs_root(self, vm_name: str, nfs_root: str, driver_path: str,
+                           strip: int, cache: bool, shared: bool = False) -> None:
+        """
+        Creates, fills and exports the NFS root. With the shared rootfs server
+        the root filesystem is an NFS mount of its read-only copy, with the
+        rootfs cache it is a copy of the cached volume, otherwise the tarball
+        is streamed straight into tar in the VM (no copy on the VM disk).
+        """
+        # Prefer the zstd conversion of the upstream tarball when there is one
+        driver_path = preferred_tarball(driver_path)
+        extract = extractor(driver_path, strip)
+        cache = cache and not shared
+        if shared:
+            SHARED_ROOTFS.attach(vm_name, nfs_root, driver_path, extract)
+        elif cache:
+            ROOTFS_CACHE.attach(vm_name, nfs_root, driver_path, extract)
+        else:
+            prepare = VmBundle(f"nfs-root {nfs_root}")
+            prepare.mkdir(nfs_root).mkdir(f"{nfs_root}/rootfs")
+            prepare.run(["chown", "-R", "nobody:nogroup", nfs_root], "Change ownership of NFS folder")
+            prepare.execute(vm_name)
+            get_lxd().exec_stream(vm_name, extract("-", f"{nfs_root}/rootfs"), driver_path,
+                                  f"Extract {os.path.basename(driver_path)} in {vm_name}", check=True)
+        bundle = VmBundle(f"nfs-server {nfs_root}")
+        if cache or shared:
+            bundle.run(["chown", "nobody:nogroup", nfs_root], "Change ownership of NFS folder")
+        bundle.run(["chmod", "755", nfs_root], "Set permissions for NFS folder")
+        bundle.run(["systemctl", "restart", "nfs-kernel-server"], "Restart NFS server")
+        bundle.run(["systemctl", "enable", "nfs-kernel-server"], "Enable NFS server")
+        bundle.execute(vm_name)
+
+    def create_nfs_server(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str,
+                          cache: bool = ROOTFS_CACHE_ENABLED, shared: bool = SHARED_ROOTFS_ENABLED) -> None:
         """
         Configures the NFS server inside the VM.
         """
-        vmcmd = ["lxc", "exec", vm_name, "--", "sudo"]
-        for folder in [nfs_root, f"{nfs_root}/rootfs"]:
-            self.run_command(vmcmd + ["mkdir", folder],
-                         f"Create folder {folder} in VM {vm_name}")
-            
-        vmcmd_no_sudo = ["lxc", "exec", vm_name, "--"]
-        self.run_command(vmcmd_no_sudo + ["chown", "-R", "nobody:nogroup", f"{nfs_root}"],
-                         "Change ownership of NFS folder")
-        self.run_command(vmcmd_no_sudo + ["sudo", "chmod", "755", f"{nfs_root}"],
-                         "Set permissions for NFS folder")
-        tarball_cmd = ['lxc', 'file', 'push', driver_path, f'{vm_name}/root/']
-        self.run_command(tarball_cmd, "Push rootfs tarball")
-        if nfs_root == ROOT_FS_3274 :
-            extract_cmd = ['lxc', 'exec', vm_name, '--', 'tar', 'xpzf', f'/root/{driver}','-C', f'{nfs_root}/rootfs'] #fro nano
-        else :
-            extract_cmd = [
-            'lxc', 'exec', vm_name, '--', 'tar', 'xpzf', f'/root/{driver}',
-            '--strip-components=1', '-C', f'{nfs_root}/rootfs'
-            ]
-
-        self.run_command(extract_cmd, "Extract rootfs tarball")
-
-        # Delete the driver tarball from the VM after extraction
-        delete_cmd = ['lxc', 'exec', vm_name, '--', 'rm', '-f', f'/root/{driver}']
-        self.run_command(delete_cmd, "Delete driver tarball after extraction")
-
-        for action in [("restart", "Restart NFS server"), ("enable", "Enable NFS server")]:
-            cmd = ["lxc", "exec", vm_name, "--", "sudo", "systemctl", action[0], "nfs-kernel-server"]
-            self.run_command(cmd, action[1])
-
-    def create_nfs_server_rpi(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str) -> None:
+        strip = 0 if nfs_root == ROOT_FS_3274 else 1  # the nano tarball has no top-level folder
+        self._setup_nfs_root(vm_name, nfs_root, driver_path, strip, cache, shared)
+
+    def create_nfs_server_rpi(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str,
+                              cache: bool = ROOTFS_CACHE_ENABLED, shared: bool = SHARED_ROOTFS_ENABLED) -> None:
         """
         Configures the NFS server inside the VM.
         """
-        vmcmd = ["lxc", "exec", vm_name, "--", "sudo"]
-        vmcmd_no_sudo = ["lxc", "exec", vm_name, "--"]
+        self._setup_nfs_root(vm_name, nfs_root, driver_path, 1, cache, shared)
 
-        for folder in [nfs_root, f"{nfs_root}/rootfs"]:
-            self.run_command(vmcmd + ["mkdir", folder],
-                         f"Create folder {folder} in VM {vm_name}")
-        
-        self.run_command(vmcmd_no_sudo + ["chown", "-R", "nobody:nogroup", f"{nfs_root}"],
-                         "Change ownership of NFS folder")
-        self.run_command(vmcmd_no_sudo + ["sudo", "chmod", "755", f"{nfs_root}"],
-                         "Set permissions for NFS folder")
-        tarball_cmd = ['lxc', 'file', 'push', driver_path, f'{vm_name}/root/']
-        self.run_command(tarball_cmd, "Push rootfs tarball")
-
-        extract_cmd = [
-        'lxc', 'exec', vm_name, '--', 'tar', '-xf', f'/root/{driver}',
-        '--strip-components=1', '-C', f'{nfs_root}/rootfs'
-        ]
-        """extract_cmd = [
-        'lxc', 'exec', vm_name, '--', 'tar', '-xf', f'/root/{driver}',
-        '-C', f'{nfs_root}/'
-        ]"""
-        self.run_command(extract_cmd, "Extract rootfs tarball")
-
-        # Delete the driver tarball from the VM after extraction
-        delete_cmd = ['lxc', 'exec', vm_name, '--', 'rm', '-f', f'/root/{driver}']
-        self.run_command(delete_cmd, "Delete driver tarball after extraction")
-
-        """export_line = f"{nfs_root} " \
-                  "*(rw,sync,no_subtree_check,no_root_squash,crossmnt)"
-        self.run_command(
-            ["lxc", "exec", vm_name, "--", "bash", "-c",
-            f"echo '{export_line}' >> /etc/exports"],
-            "Add NFS export to /etc/exports"
-        )
-
-        # NEW: exportfs -a (re‑load exports table)
-        self.run_command(
-            ["lxc", "exec", vm_name, "--", "sudo", "exportfs", "-a"],
-            "Reload NFS exports
-        )"""
-         
-
-        for action in [("restart", "Restart NFS server"), ("enable", "Enable NFS server")]:
-            cmd = ["lxc", "exec", vm_name, "--", "sudo", "systemctl", action[0], "nfs-kernel-server"]
-            self.run_command(cmd, action[1])
-
-    def create_nfs_server_jtx2(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str) -> None:
+    def create_nfs_server_jtx2(self, vm_name: str, nfs_root: str ,driver:str ,driver_path:str,
+                               cache: bool = ROOTFS_CACHE_ENABLED, shared: bool = SHARED_ROOTFS_ENABLED) -> None:
         """
         Configures the NFS server inside the VM.
         """
-        vmcmd = ["lxc", "exec", vm_name, "--", "sudo"]
-        vmcmd_no_sudo = ["lxc", "exec", vm_name, "--"]
-
-        for folder in [nfs_root, f"{nfs_root}/rootfs"]:
-            self.run_command(vmcmd + ["mkdir", folder],
-                         f"Create folder {folder} in VM {vm_name}")
-        
-        self.run_command(vmcmd_no_sudo + ["chown", "-R", "nobody:nogroup", f"{nfs_root}"],
-                         "Change ownership of NFS folder")
-        self.run_command(vmcmd_no_sudo + ["sudo", "chmod", "755", f"{nfs_root}"],
-                         "Set permissions for NFS folder")
-        tarball_cmd = ['lxc', 'file', 'push', driver_path, f'{vm_name}/root/']
-        self.run_command(tarball_cmd, "Push rootfs tarball")
-
-        extract_cmd = [
-        'lxc', 'exec', vm_name, '--', 'tar', '-xf', f'/root/{driver}',
-        '--strip-components=1', '-C', f'{nfs_root}/rootfs'
-        ]
-        """extract_cmd = [
-        'lxc', 'exec', vm_name, '--', 'tar', '-xf', f'/root/{driver}',
-        '-C', f'{nfs_root}/'
-        ]"""
-        self.run_command(extract_cmd, "Extract rootfs tarball")
-
-        # Delete the driver tarball from the VM after extraction
-        delete_cmd = ['lxc', 'exec', vm_name, '--', 'rm', '-f', f'/root/{driver}']
-        self.run_command(delete_cmd, "Delete driver tarball after extraction")
-
-        """export_line = f"{nfs_root} " \
-                  "*(rw,sync,no_subtree_check,no_root_squash,crossmnt)"
-        self.run_command(
-            ["lxc", "exec", vm_name, "--", "bash", "-c",
-            f"echo '{export_line}' >> /etc/exports"],
-            "Add NFS export to /etc/exports"
-        )
-
-        # NEW: exportfs -a (re‑load exports table)
-        self.run_command(
-            ["lxc", "exec", vm_name, "--", "sudo", "exportfs", "-a"],
-            "Reload NFS exports"
-        )
-         """
-
-        for action in [("restart", "Restart NFS server"), ("enable", "Enable NFS server")]:
-            cmd = ["lxc", "exec", vm_name, "--", "sudo", "systemctl", action[0], "nfs-kernel-server"]
-            self.run_command(cmd, action[1])
+        self._setup_nfs_root(vm_name, nfs_root, driver_path, 1, cache, shared)
 
 
     # --------------------------------------------------------------------------
@@ -525,9 +555,8 @@ class VmManager:
         """
         Installs required packages and prepares the environment inside the VM.
         """
+        self.apt_install(vm_name, ["nbd-server"])
         commands = [
-            ["apt", "update"],
-            ["apt", "install", "-y", "nbd-server"],
             ["modprobe", "nbd"],
             ["sh", "-c", "echo 'nbd' >> /etc/modules"]
         ]
@@ -538,168 +567,110 @@ class VmManager:
         logging.info("Created /root/nbd_jetson directory in VM %s", vm_name)
         self.run_lxc_command(vm_name, ["chmod", "755", "/root/nbd_jetson"])"""
  
-    def _update_config_file(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
-        """
-        Updates /etc/nbd-server/config by reading the current config and adding sections
-        for any nodes that are missing. For each missing node:
-        - Ensures the base image (/root/nbd_jetson.img) exists.
-        - Creates a node-specific folder (/root/nbd_jetson_<node>).
-        - Copies the base image into that folder (as nbd_jetson.img) if not already present.
-        - Appends a configuration section for the node.
-        """
-
-        # Read the current configuration file.
-        base_image_path = ""
-        result = self.run_lxc_command(vm_name, ["cat", "/etc/nbd-server/config"])
-        existing_config = result.stdout
-     
-
-        new_config_content = ""
-        for node in nodes:
-
-            if "j20" in node or "j40" or "jagx32" in node:
-               base_image_path = BASE_IMAGE_J20_J40 
-               base_image_name = NBD_IMAGE_NAME_J20_J40
-            elif "j10"  in node:
-                 base_image_path = BASE_IMAGE_J10
-                 base_image_name = NBD_IMAGE_NAME_J10
-            elif "jtx2" in node :
-                 base_image_path = BASE_IMAGE_JTX
-                 base_image_name = NBD_IMAGE_NAME_JTX
-
-            node_section = f"[nbd_jetson_{node}]"
-            # If the node section already exists, skip processing for this node.
-            if node_section in existing_config:
-                logging.info("Configuration for nbd %s already exists.", node)
+    def _ensure_nbd_base_image(self, vm_name: str, base_image_path: str) -> str:
+        """
+        Streams an NBD base image into NBD_BASE_DIR of the VM once, and again
+        only when the host image changes. Returns its path in the VM.
+        """
+        stat = os.stat(base_image_path)
+        stamp = f"{stat.st_size}:{int(stat.st_mtime)}"
+        base_image = f"{NBD_BASE_DIR}/{os.path.basename(base_image_path)}"
+        result = get_lxd().exec(vm_name, ["cat", f"{base_image}.stamp"])
+        if result.returncode == 0 and result.stdout.strip() == stamp:
+            return base_image
+        self.run_lxc_command(vm_name, ["mkdir", "-p", NBD_BASE_DIR])
+        get_lxd().exec_stream(vm_name, ["dd", f"of={base_image}", "bs=4M", "conv=sparse", "status=none"],
+                              base_image_path, f"Stream NBD base image to {vm_name}", check=True)
+        # A trailing run of zeros is skipped by conv=sparse: restore the full size
+        self.run_lxc_command(vm_name, ["bash", "-c", f"truncate -s {stat.st_size} {base_image} && "
+                                       f"chmod 444 {base_image} && echo {stamp} > {base_image}.stamp"])
+        return base_image
+
+    def supports_reflink(self, vm_name: str, directory: str = NBD_BASE_DIR) -> bool:
+        """
+        Checks whether the filesystem of directory in the VM can share blocks
+        between files (cp --reflink=always), as btrfs and XFS do; ext4 cannot.
+        """
+        probe = f"{directory}/.reflink-probe"
+        result = get_lxd().exec(vm_name, ["bash", "-c", f"mkdir -p {directory} && printf x > {probe} && "
+                                          f"cp --reflink=always {probe} {probe}.copy; status=$?; "
+                                          f"rm -f {probe} {probe}.copy; exit $status"])
+        return result.returncode == 0
+
+    def apply_nbd_config(self, vm_name: str, nfs_server_ip: str, nodes: list,
+                         keep_existing: bool = True) -> bool:
+        """
+        Brings /etc/nbd-server/config to the desired state in one pass.
+
+        The desired exports are the given nodes (plus the ones already
+        exported when keep_existing is set); each node gets the base image
+        of its model from the NFS node-config registry, or an empty NBD_SIZE
+        scratch disk when its model has none. Missing node images are
+        created as thin copies or sparse files, the whole config is rendered
+        and written atomically, and nbd-server is only reloaded when the
+        content changed.
+
+        Returns:
+            True if the configuration changed.
+        """
+        result = get_lxd().exec(vm_name, ["cat", NBD_CONFIG_FILE])
+        current_config = result.stdout if result.returncode == 0 else ""
+        desired = list(nodes)
+        if keep_existing:
+            desired += [node for node in parse_exported_nodes(current_config) if node not in desired]
+
+        node_images = load_node_images()
+        exports = {}
+        copies = []
+        images = VmBundle(f"nbd-images {vm_name}")
+        for node in desired:
+            base_image_path = node_base_image(node, node_images)
+            if base_image_path is None:
+                # No base image for this model: an empty ext4 scratch disk,
+                # sparse so only the blocks the node writes take space
+                scratch_image = f"{node_folder(node)}/{NBD_EXPORT_PREFIX}{node}.img"
+                exports[node] = scratch_image
+                images.run(f"[ -e {scratch_image} ] || {{ mkdir -p {node_folder(node)} && "
+                           f"truncate -s {NBD_SIZE}M {scratch_image} && mkfs.ext4 -q {scratch_image}; }}",
+                           f"NBD scratch image for {node}")
                 continue
-    
-            # Create the node-specific folder under /root.
-            node_folder = f"/root/nbd_jetson_{node}"
-            self.run_lxc_command(vm_name, ["mkdir", "-p", node_folder])
-            
-            # Define the node image path.
-            node_image_path = f"{node_folder}/{base_image_name}"
-            push_command = ["lxc", "file", "push", base_image_path, f"{vm_name}{node_image_path}"]
-            self.run_command(push_command,"push nbd images ")
-            
-            # Append the node-specific configuration.
-            new_config_content += f"[nbd_jetson_{node}]\n"
-            new_config_content += f"exportname = {node_image_path}\n"
-            new_config_content += "readonly = false\n"
-            new_config_content += f"listenaddr = {nfs_server_ip}\n\n"
-
-            # Append new sections to the configuration file if any.
-            if new_config_content:
-                self.run_lxc_command(vm_name, ["sh", "-c", f"echo '{new_config_content}' >> /etc/nbd-server/config"])
-
-
-    def _update_config_file_1(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
-        """
-        Updates /etc/nbd-server/config with configuration sections for nodes
-        that are missing. Checks if f"[nbd_jetson_<node>]\n" exists before appending.
-        """
-     
-        result = self.run_lxc_command(
-                vm_name, ["cat", "/etc/nbd-server/config"]
-            )
-        current_config = result.stdout
-   
-        new_sections = ""
-        for node in nodes:
-            header = f"[nbd_jetson_{node}]\n"
-            if header not in current_config:
-                section = (
-                    header +
-                    f"exportname = /root/nbd_jetson/nbd_jetson_{node}.img\n" +
-                    "readonly = false\n" +
-                    f"listenaddr = {nfs_server_ip}\n\n"
-                )
-                new_sections += section
-            else:
-                logging.info("Configuration for node %s already exists.", node)
-        
-        if new_sections:
-            cmd = ["sh", "-c", f"echo '{new_sections}' >> /etc/nbd-server/config"]
-            self.run_lxc_command(vm_name, cmd)
-            logging.info("Updated config file with new sections:\n%s", new_sections)
-        else:
-            logging.info("No new config sections needed in /etc/nbd-server/config.")
-
-    def _create_and_format_disk_image(self, vm_name: str, node: str) -> None:
-        """
-        Creates a disk image for the node and formats it as ext4 if it does not already exist.
-        """
-        image_path = f"/root/nbd_jetson/nbd_jetson_{node}.img"
-
-        # Check if the disk image exists by trying to execute the test command.
-        try:
-            self.run_lxc_command(vm_name, ["test", "-f", image_path])
-            print(f"Disk image already exists: {image_path}, skipping creation.")
-            return
-        except Exception:
-            # The test command fails (expected when file does not exist).
-            print(f"Disk image not found, creating new disk image: {image_path}")
-
-        # Create disk image using the dd command.
-        dd_cmd = ["dd", "if=/dev/zero", f"of={image_path}", "bs=1M", f"count={NBD_SIZE}"]
-        self.run_lxc_command(vm_name, dd_cmd)
-
-        # Format the disk image as ext4.
-        self.run_lxc_command(vm_name, ["mkfs.ext4", image_path])
-
-    def _restart_nbd_server(self, vm_name: str) -> None:
-        """
-        Restarts the nbd-server service to apply the new configuration.
-        """
-        self.run_lxc_command(vm_name, ["systemctl", "restart", "nbd-server"])
-
-    def configure_nbd_on_lxc_vm_1(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
-            """
-            Configures nbprofile inside the LXC VM based on the provided nodes.
-            Each node gets its own configuration section and disk image.
-            """
-            logging.info("Setting up nbprofile inside VM %s for nodes: %s", vm_name, nodes)
-            
-            # Install required packages and prepare the environment.
-            self._install_nbd_packages(vm_name)
-            current_config = "[generic]\nallowlist = true\n\n"
-            self.run_lxc_command(
-                vm_name, ["sh", "-c", f"echo '{current_config}' > /etc/nbd-server/config"]
-            )
-            
-            # Update the configuration file with sections for nodes that are missing.
-            self._update_config_file(vm_name, nfs_server_ip, nodes)
-            
-            # Create and format disk image for each node.
-            for node in nodes:
-                self._create_and_format_disk_image(vm_name, node)
-            
-            # Restart nbd-server to apply changes.
-            self._restart_nbd_server(vm_name)
-            
-            logging.info("nbprofile setup completed in VM %s", vm_name)
+            node_image_path = f"{node_folder(node)}/{os.path.basename(base_image_path)}"
+            exports[node] = node_image_path
+            copies.append(node)
+            # Thin copy of the shared base image: reflink where the filesystem
+            # supports it, sparse otherwise (only the used blocks are written)
+            base_image = self._ensure_nbd_base_image(vm_name, base_image_path)
+            images.run(f"[ -e {node_image_path} ] || {{ mkdir -p {node_folder(node)} && "
+                       f"cp --reflink=auto --sparse=always {base_image} {node_image_path}; }}",
+                       f"NBD image for {node}")
+        if images.steps:
+            if copies and not self.supports_reflink(vm_name):
+                logging.warning("The root filesystem of VM %s has no reflink support: the NBD images of %s are "
+                                "full copies of the used blocks of their base image. Use a btrfs or XFS LXD "
+                                "storage pool for thin copies.", vm_name, ", ".join(copies))
+            images.execute(vm_name)
+
+        config = render_nbd_config(exports, nfs_server_ip)
+        if content_hash(config) == content_hash(current_config):
+            logging.info("nbd-server config of VM %s unchanged.", vm_name)
+            return False
+        bundle = VmBundle(f"nbd-config {vm_name}")
+        bundle.add_bytes(config, f"{NBD_CONFIG_FILE}.tmp")
+        bundle.run(["mv", "-f", f"{NBD_CONFIG_FILE}.tmp", NBD_CONFIG_FILE])
+        bundle.run(["systemctl", "reload-or-restart", "nbd-server"])
+        bundle.execute(vm_name)
+        logging.info("nbd-server config of VM %s now exports: %s", vm_name, ", ".join(sorted(exports)))
+        return True
 
     def configure_nbd_on_lxc_vm(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
             """
             Configures nbprofile inside the LXC VM for the provided nodes.
-            
-            For each node:
-            - Creates a folder named /root/nbd_jetson_<node>.
-            - Copies a common base image (/root/nbd_jetson.img) into that folder as nbd_jetson.img.
-            - Adds a configuration section for the node pointing to its node-specific image.
-            
-            The base image is created (using dd and formatted with mkfs.ext4) if it does not exist.
+
+            Each node gets a folder /root/nbd_jetson_<node> holding a thin copy
+            of the base image of its model, exported in its own config section.
             """
             logging.info("Setting up nbprofile inside VM %s for nodes: %s", vm_name, nodes)
-            
-
-            
-            # Update the configuration file with sections for nodes that are missing.
-            self._update_config_file(vm_name, nfs_server_ip, nodes)
-
-            # Restart nbd-server to apply changes.
-            self._restart_nbd_server(vm_name)
-            
+            self.apply_nbd_config(vm_name, nfs_server_ip, nodes)
             logging.info("nbprofile setup completed in VM %s", vm_name)
 
 
@@ -708,27 +679,15 @@ class VmManager:
          Install and configure tftpd-hpa inside an LXC container.
 
         """
-        self.run_lxc_command(vm_name, ["apt", "install", "-y", "tftpd-hpa"])
-        base_dir = "/var/lib/tftpboot"
-               #  Create tftpboot directory and set permission
-        self.run_lxc_command(vm_name, ["mkdir", "-p", base_dir])
-        self.run_lxc_command(vm_name, ["chown", "-R", "tftp:tftp", base_dir])
-        self.run_lxc_command(vm_name, ["chmod", "-R", "755", base_dir])
-
-        #  Write tftpd-hpa default config with the correct directory
-        config_script = f"""
-cat << 'EOF' > /etc/default/tftpd-hpa
-TFTP_USERNAME="tftp"
-TFTP_DIRECTORY="{ base_dir }"
-TFTP_ADDRESS=":69"
-TFTP_OPTIONS="--secure"
-EOF
-"""
-        self.run_lxc_command(vm_name, ["bash", "-c", config_script])
-
+        self.apt_install(vm_name, ["tftpd-hpa"])
+        bundle = VmBundle(f"tftp-server {vm_name}")
+        bundle.mkdir(TFTP_ROOT, owner="tftp:tftp", mode="755")
+        #  tftpd-hpa default config with the correct directory
+        bundle.add_bytes(render_tftpd_config(TFTP_ROOT), TFTPD_CONFIG_FILE)
         #  Restart and enable the service
-        self.run_lxc_command(vm_name, ["systemctl", "restart", "tftpd-hpa"])
-        self.run_lxc_command(vm_name, ["systemctl", "enable", "tftpd-hpa"])
+        bundle.run(["systemctl", "restart", "tftpd-hpa"])
+        bundle.run(["systemctl", "enable", "tftpd-hpa"])
+        bundle.execute(vm_name)
         logging.info(
             "tftpd-hpa and filesystem setup completed in LXC VM '%s",
             vm_name
@@ -740,34 +699,36 @@ EOF
         Install and configure tftpd-hpa inside an LXC container for Raspberry Pi devices.
         """
 
-        base_dir = "/var/lib/tftpboot"
+        base_dir = TFTP_ROOT
        #  Create version-specific subdirectory
         version_dir = f"{base_dir}/{rpi_version}"
 
         # Check if version_dir already exists; if so, skip setup
-        try:
-            self.run_lxc_command(vm_name, ["bash", "-c", f"test -d '{version_dir}'"])
+        if self.folder_exists(vm_name, version_dir):
             logging.info(
                 "TFTP setup skipped: version directory '%s' already exists in VM '%s'",
                 version_dir, vm_name
             )
             return
-        except subprocess.CalledProcessError:
-            # Directory does not exist, continue setup
-            pass
-        #  Create tftpboot directory and set permission
-        self.run_lxc_command(vm_name, ["mkdir", "-p", version_dir])
-        self.run_lxc_command(vm_name, ["chown", "-R", "tftp:tftp", version_dir ])
-        self.run_lxc_command(vm_name, ["chmod", "-R", "755", version_dir ])
-
-        #  Download and extract the RPi filesystem tarball
-        tarball_url = f"http://{DRIVER_SERVER_IP}/{rpi_version}.tar.gz"
-        local_tar = f"/root/{rpi_version}.tar.gz"
-        self.run_lxc_command(vm_name, ["wget", "-O", local_tar, tarball_url])
-        self.run_lxc_command(vm_name, ["tar", "-xf", local_tar, "-C", base_dir])
-                #  Restart and enable the service
-        self.run_lxc_command(vm_name, ["systemctl", "restart", "tftpd-hpa"])
-        self.run_lxc_command(vm_name, ["systemctl", "enable", "tftpd-hpa"])
+        archive = rpi_boot_archive(rpi_version)
+        bundle = VmBundle(f"tftp-{rpi_version} {vm_name}")
+        bundle.mkdir(version_dir, owner="tftp:tftp", mode="755")
+        if ARTIFACT_CACHE_ENABLED:
+            #  Stream the host copy of the boot files into tar
+            local_archive = ARTIFACT_CACHE.fetch(archive)
+            bundle.execute(vm_name)
+            get_lxd().exec_stream(vm_name, ["tar", "-xzf", "-", "-C", base_dir], local_archive,
+                                  f"Extract {archive} in {vm_name}", check=True)
+            bundle = VmBundle(f"tftp-{rpi_version} {vm_name}")
+        else:
+            #  Download and extract the RPi filesystem tarball (piped, no local copy)
+            tarball_url = f"http://{DRIVER_SERVER_IP}/{archive}"
+            bundle.run(f"set -o pipefail; wget -qO- {shlex.quote(tarball_url)} | tar -xzf - -C {base_dir}",
+                       "Download and extract the boot files")
+        #  Restart and enable the service
+        bundle.run(["systemctl", "restart", "tftpd-hpa"])
+        bundle.run(["systemctl", "enable", "tftpd-hpa"])
+        bundle.execute(vm_name)
         logging.info(
             "tftpd-hpa and filesystem setup completed in LXC VM '%s' for RPi version '%s'",
             vm_name,
@@ -780,42 +741,34 @@ EOF
         Install and configure tftpd-hpa inside an LXC container for Jtx2 (Jetsons) devices.
         """
 
-        base_dir = "/var/lib/tftpboot"
+        base_dir = TFTP_ROOT
        #  Create version-specific subdirectory
         jt_dirctory =f"{base_dir}/t186"
         tftp_jtx2_directory = f"{jt_dirctory}/jp3274"
 
 
         # Check if version_dir already exists; if so, skip setup
-        try:
-            self.run_lxc_command(vm_name, ["bash", "-c", f"test -d '{tftp_jtx2_directory }'"])
+        if self.folder_exists(vm_name, tftp_jtx2_directory):
             logging.info(
                 "TFTP setup skipped: version directory '%s' already exists in VM '%s'",
                 tftp_jtx2_directory , vm_name
             )
             return
-        except subprocess.CalledProcessError:
-            # Directory does not exist, continue setup
-            pass
-
-        self.run_lxc_command(vm_name, ["mkdir", "-p",  jt_dirctory])
-        self.run_lxc_command(vm_name, ["chown", "-R", "tftp:tftp",  jt_dirctory])
-        self.run_lxc_command(vm_name, ["chmod", "-R", "755",  jt_dirctory])
-        self.run_lxc_command(vm_name, ["mkdir", "-p",   tftp_jtx2_directory])
-        self.run_lxc_command(vm_name, ["chown", "-R", "tftp:tftp",   tftp_jtx2_directory])
-        self.run_lxc_command(vm_name, ["chmod", "-R", "755",   tftp_jtx2_directory])
-
 
+        bundle = VmBundle(f"tftp-jtx2 {vm_name}")
+        bundle.mkdir(jt_dirctory, owner="tftp:tftp", mode="755")
+        bundle.mkdir(tftp_jtx2_directory, owner="tftp:tftp", mode="755")
         #  Restart and enable the service
-        self.run_lxc_command(vm_name, ["systemctl", "restart", "tftpd-hpa"])
-        self.run_lxc_command(vm_name, ["systemctl", "enable", "tftpd-hpa"])
-
-        #  Download and extract the RPi filesystem tarball
-        image_url = f"http://{DRIVER_SERVER_IP}/jtx2/Image"
-        tegra_url = f"http://{DRIVER_SERVER_IP}/jtx2/tegra186-p3636-0001-p3509-0000-a01.dtb"
-
-        self.run_lxc_command(vm_name, ["wget", "-P",  tftp_jtx2_directory, image_url])
-        self.run_lxc_command(vm_name, ["wget", "-P",  tftp_jtx2_directory, tegra_url])
+        bundle.run(["systemctl", "restart", "tftpd-hpa"])
+        bundle.run(["systemctl", "enable", "tftpd-hpa"])
+        #  Install the kernel image and device tree
+        for name in (JTX2_KERNEL, JTX2_DTB):
+            target = f"{tftp_jtx2_directory}/{os.path.basename(name)}"
+            if ARTIFACT_CACHE_ENABLED:
+                bundle.add_file(ARTIFACT_CACHE.fetch(name), target)
+            else:
+                bundle.run(["wget", "-O", target, f"http://{DRIVER_SERVER_IP}/{name}"])
+        bundle.execute(vm_name)
 
 
         logging.info(
@@ -827,13 +780,21 @@ EOF
     def update_nbd_config(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
                     # Update the configuration file with sections for nodes that are missing.
             logging.info("Setting up nbprofile inside VM %s for new nodes: %s", vm_name, nodes)
-            self._update_config_file(vm_name, nfs_server_ip, nodes)
-            
-            # Restart nbd-server to apply changes.
-            self._restart_nbd_server(vm_name)
-            
+            self.apply_nbd_config(vm_name, nfs_server_ip, nodes)
             logging.info("nbprofile setup completed in VM %s", vm_name)
 
+    def remove_nbd_nodes(self, vm_name: str, nfs_server_ip: str, nodes: list) -> None:
+        """
+        Drops the exports of nodes from the nbd-server config and deletes
+        their node images; the other exports are kept as they are.
+        """
+        result = get_lxd().exec(vm_name, ["cat", NBD_CONFIG_FILE])
+        current_config = result.stdout if result.returncode == 0 else ""
+        remaining = [node for node in parse_exported_nodes(current_config) if node not in nodes]
+        self.apply_nbd_config(vm_name, nfs_server_ip, remaining, keep_existing=False)
+        self.run_lxc_command(vm_name, ["rm", "-rf"] + [node_folder(node) for node in nodes])
+        logging.info("Removed NBD exports of %s in VM %s", nodes, vm_name)
+
 
 
     def add_torch_script(self, vm_name: str, src_script_path: str) -> None:
@@ -841,7 +802,7 @@ EOF
         Adds a torch installation script to the VM.
         """
         try:
-            subprocess.run(['lxc', 'file', 'push', src_script_path, f'{vm_name}/root/install_torch'],
+            get_lxd().run(['lxc', 'file', 'push', src_script_path, f'{vm_name}/root/install_torch'],
                            check=True)
             logging.info("Torch script copied to VM %s", vm_name)
         except subprocess.CalledProcessError as e:
@@ -851,9 +812,9 @@ EOF
     # --------------------------------------------------------------------------
     # 8. SSH Key Management
     # --------------------------------------------------------------------------
-    def add_ssh_key_to_lxd(self, username: str, lxd_vm_name: str) -> None:
+    def get_user_ssh_keys(self, username: str) -> list[str]:
         """
-        Adds SSH public keys to the VM's authorized_keys file.
+        Returns the SSH public keys of a user from the Redis user index.
         """
         index_name = REDIS_USER_INDEX
         redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
@@ -864,34 +825,30 @@ EOF
         ssh_keys = user_data.get('user', {}).get('sshKeys', [])
         if not ssh_keys:
             raise ValueError("No SSH keys found for the user")
+        return ssh_keys
+
+    def add_ssh_key_to_lxd(self, username: str, lxd_vm_name: str) -> None:
+        """
+        Adds SSH public keys to the VM's authorized_keys file.
+        """
+        ssh_keys = self.get_user_ssh_keys(username)
         ssh_dir = "/root/.ssh"
         authorized_keys_file = f"{ssh_dir}/authorized_keys"
-        subprocess.run(
-            ['lxc', 'exec', lxd_vm_name, '--', 'bash', '-c',
-             f'if [ ! -d "{ssh_dir}" ]; then mkdir -p "{ssh_dir}"; fi'], check=True)
-        try:
-            result = subprocess.run(
-                ['lxc', 'exec', lxd_vm_name, '--', 'bash', '-c', f'cat {authorized_keys_file}'],
-                capture_output=True, text=True, check=True)
-            existing_keys = result.stdout.splitlines()
-        except subprocess.CalledProcessError:
-            existing_keys = []
-        new_keys = [key for key in ssh_keys if key not in existing_keys]
-        if new_keys:
-            keys_to_add = "\n".join(new_keys)
-            subprocess.run(
-                ['lxc', 'exec', lxd_vm_name, '--', 'bash', '-c',
-                 f'echo "{keys_to_add}" >> {authorized_keys_file}'], check=True)
-            logging.info("Added new SSH keys to %s in VM %s", authorized_keys_file, lxd_vm_name)
-        else:
-            logging.info("No new SSH keys to add in VM %s", lxd_vm_name)
+        bundle = VmBundle(f"ssh-keys {lxd_vm_name}")
+        bundle.mkdir(ssh_dir)
+        bundle.run(["touch", authorized_keys_file])
+        # Append only the keys that are not there yet
+        for key in ssh_keys:
+            bundle.run(f"grep -qxF {shlex.quote(key)} {authorized_keys_file} || "
+                       f"echo {shlex.quote(key)} >> {authorized_keys_file}", "Add SSH key")
         for cmd in [
             ['chmod', '700', ssh_dir],
             ['chmod', '600', authorized_keys_file],
             ['chown', 'root:root', ssh_dir],
             ['chown', 'root:root', authorized_keys_file]
         ]:
-            subprocess.run(['lxc', 'exec', lxd_vm_name, '--'] + cmd, check=True)
+            bundle.run(cmd)
+        bundle.execute(lxd_vm_name)
         logging.info("SSH key verification and update complete for VM %s", lxd_vm_name)
 
 
@@ -911,12 +868,10 @@ EOF
         # === Folder Creation Directory (Used for Creating Folders) ===
         base_folder_creation_dir = f"{nfs_root}/rootfs/home/mmtc"
 
-        # === File Pushing Directory (Used for Pushing Files) ===
-        base_file_pushing_dir = f"{vm_name}{nfs_root}/rootfs/home/mmtc"
-
         # Ensure the main scripts directory exists (folder creation directory)
         scripts_root = f"{base_folder_creation_dir}/scripts"
-        self.run_command(["lxc", "exec", vm_name, "--", "mkdir", "-p", scripts_root], "Ensuring scripts root directory exists")
+        bundle = VmBundle(f"user-files {vm_name}")
+        bundle.mkdir(scripts_root)
 
         # Define corrected folder structure inside `/root/nfsroot/rootfs/home/mmtc/scripts/`
         directories = {
@@ -927,21 +882,21 @@ EOF
         }
 
         # Ensure required subdirectories exist inside `/root/nfsroot/rootfs/home/mmtc/`
-        for key, path in directories.items():
-            self.run_command(["lxc", "exec", vm_name, "--", "mkdir", "-p", path], f"Creating {key} directory in VM")
+        for path in directories.values():
+            bundle.mkdir(path)
 
         # Define files and their corresponding directories (for file pushing)
         files_to_push = [
-            ("Dockerfile", "setup", "Push Dockerfile to setup directory"),
-            ("lib_setup.sh", "setup", "Push Jetson setup script"),
-            ("jetson_setup.sh", "setup", "Push Jetson setup script"),
-            ("restart_services.sh", "system", "Push system restart script"),
-            ("configure_PPP.sh", "network", "Push network configuration script"),
-            ("fan_control.py", "fan", "Push fan control script")
+            ("Dockerfile", "setup"),
+            ("lib_setup.sh", "setup"),
+            ("jetson_setup.sh", "setup"),
+            ("restart_services.sh", "system"),
+            ("configure_PPP.sh", "network"),
+            ("fan_control.py", "fan")
         ]
 
-        # Loop through each file and push it to the appropriate directory (file pushing directory)
-        for file_name, folder, description in files_to_push:
+        # Add each file to the bundle under the appropriate directory
+        for file_name, folder in files_to_push:
             # Determine the correct file path
             if file_name in ["lib_setup.sh", "Dockerfile", "jetson_setup.sh"]:
                 full_user_script_path = os.path.join(USER_SCRIPT_PATH,user_script_path_jp)
@@ -949,17 +904,12 @@ EOF
                 full_user_script_path = user_script_path
 
             file_path = os.path.join(full_user_script_path, file_name)
-            #target_dir = directories[folder].replace(base_folder_creation_dir, base_file_pushing_dir)
-            target_dir = os.path.join( directories[folder].replace(base_folder_creation_dir, base_file_pushing_dir), file_name)
-
+            bundle.add_file(file_path, os.path.join(directories[folder], file_name))
 
-            # Build and execute the command to push the file
-            push_command = ["lxc", "file", "push", file_path, target_dir]
-            self.run_command(push_command, description)
-
-        # Create a README in the VM after pushing all files
-        VmManager.create_readme_in_vm_j20_j40(vm_name, nfs_ip_addr, nfs_root)
-        VmManager.create_readme_in_vm_nano_jtx(vm_name, nfs_ip_addr, nfs_root)
+        # READMEs travel in the same bundle as the scripts
+        bundle.add_bytes(VmManager.readme_j20_j40(nfs_ip_addr), f"{base_folder_creation_dir}/README_j20_j40.md")
+        bundle.add_bytes(VmManager.readme_nano_jtx(nfs_ip_addr), f"{base_folder_creation_dir}/README_j10_jtx.md")
+        bundle.execute(vm_name)
 
         print("All files successfully pushed and organized in the VM.")
 
@@ -971,59 +921,83 @@ EOF
         """
         Installs necessary libraries and scripts in the VM for iot  devices.
         """
-
-        self.run_command(["lxc", "exec", vm_name, "--", "sudo", "apt", "update"], "Update apt")
-        install_binutils = ["lxc", "exec", vm_name, "--", "apt", "install", "-y", "binutils"]
-        self.run_lxc_command(vm_name, ["apt", "install", "bzip2"])
-        self.run_command(install_binutils, "Install binutils")
-        install_nfs = ["lxc", "exec", vm_name, "--", "sudo", "apt", "install", "-y", "nfs-kernel-server"]
-        self.run_command(install_nfs, "Install NFS server")
+        self.update_apt(vm_name)
+        self.install_base_packages(vm_name)
         # install tftp sever 
         self.setup_tftp_server(vm_name)
+        self.push_user_tools(vm_name)
+        self.setup_nbd_server(vm_name)
+        #self.add_torch_script(vm_name, "install_torch.sh")
+
+    def update_apt(self, vm_name: str) -> None:
+        """
+        Refreshes the apt package lists in the VM.
+        """
+        # cloud-init writes the apt proxy and may still be installing packages
+        get_lxd().exec(vm_name, ["cloud-init", "status", "--wait"])
+        self.run_command(["lxc", "exec", vm_name, "--", "sudo", "apt", "update"], "Update apt")
+
+    def install_base_packages(self, vm_name: str) -> None:
+        """
+        Installs the archive tools (with the parallel decompressors) and the NFS server.
+        """
+        self.apt_install(vm_name, ["binutils", "bzip2", "nfs-kernel-server"] + PARALLEL_PACKAGES)
+
+    def push_user_tools(self, vm_name: str) -> None:
+        """
+        Pushes the 5gmmtctool CLI and its README to /root.
+        """
         # 1. Push the CLI script
         push_5gmmtctool = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, "5gmmtctool"), f"{vm_name}/root/"]
         self.run_command(push_5gmmtctool, "Push 5gmmtctool")
         # 2. Push the README
         push_readme = ["lxc", "file", "push",os.path.join(USER_SCRIPT_PATH, "VM_README.txt"),f"{vm_name}/root/"]
         self.run_command(push_readme, "Push VM_README.txt")
+
+    def setup_nbd_server(self, vm_name: str) -> None:
+        """
+        Installs nbd-server and writes an empty (generic only) configuration.
+        """
         # Install required packages and prepare the environment.    
         self._install_nbd_packages(vm_name)
-        current_config = "[generic]\nallowlist = true\n\n"
-        self.run_lxc_command(
-         vm_name, ["sh", "-c", f"echo '{current_config}' > /etc/nbd-server/config"])
-        #self.add_torch_script(vm_name, "install_torch.sh")
-        
-    
+        bundle = VmBundle(f"nbd-config {vm_name}")
+        bundle.add_bytes(render_nbd_config({}), NBD_CONFIG_FILE)
+        bundle.execute(vm_name)
 
-            
     def configure_nfs_jetson(self ,vm_name: str, nfs_ip_addr: str ,nfs_root:str ,driver :str, user_script_path_jp :str,driver_path:str):
-        if self.folder_exists(vm_name, nfs_root):
+        if not self.folder_exists(vm_name, nfs_root):
+            self.create_nfs_server(vm_name, nfs_root,driver,driver_path)
+        elif not self.golden_rootfs_pending(vm_name, nfs_root):
             print(f"Folder {nfs_root} already exists in  {vm_name}. Skipping configuration steps.")
             return
-        self.create_nfs_server(vm_name, nfs_root,driver,driver_path)
         push_nfs_setup = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, JETSON_SETUP_NFS), f"{vm_name}/root/"]
         self.run_command(push_nfs_setup, "Push NFS setup script")
         self.push_files_to_vm(vm_name,nfs_root,USER_SCRIPT_PATH,nfs_ip_addr,user_script_path_jp)
-        time.sleep(7)
+        self.wait_for_service(vm_name, "nfs-kernel-server")
+        self.run_lxc_command(vm_name, ["rm", "-f", os.path.join(nfs_root, GOLDEN_ROOTFS_MARKER)])
 
     def configure_nfs_raspberry(self ,vm_name: str,nfs_root:str ,driver :str,driver_path:str):
-        if self.folder_exists(vm_name, nfs_root):
+        if not self.folder_exists(vm_name, nfs_root):
+            self.create_nfs_server_rpi(vm_name, nfs_root,driver,driver_path)
+        elif not self.golden_rootfs_pending(vm_name, nfs_root):
             print(f"Folder {nfs_root} already exists in  {vm_name}. Skipping configuration steps.")
             return
-        self.create_nfs_server_rpi(vm_name, nfs_root,driver,driver_path)
         push_nfs_setup = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, RPI4_SETUP_NFS), f"{vm_name}/root/"]
         self.run_command(push_nfs_setup, "Push NFS setup script")
-        time.sleep(5)
+        self.wait_for_service(vm_name, "nfs-kernel-server")
+        self.run_lxc_command(vm_name, ["rm", "-f", os.path.join(nfs_root, GOLDEN_ROOTFS_MARKER)])
 
     def configure_nfs_jtx2(self ,vm_name: str,nfs_ip_addr: str ,nfs_root:str ,driver :str,user_script_path_jp :str,driver_path:str):
-        if self.folder_exists(vm_name, nfs_root):
+        if not self.folder_exists(vm_name, nfs_root):
+            self.create_nfs_server_jtx2(vm_name, nfs_root,driver,driver_path)
+        elif not self.golden_rootfs_pending(vm_name, nfs_root):
             print(f"Folder {nfs_root} already exists in  {vm_name}. Skipping configuration steps.")
             return
-        self.create_nfs_server_jtx2(vm_name, nfs_root,driver,driver_path)
         push_nfs_setup = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, RPI4_SETUP_NFS), f"{vm_name}/root/"]
         self.run_command(push_nfs_setup, "Push NFS setup script")
         self.push_files_to_vm(vm_name,nfs_root,USER_SCRIPT_PATH,nfs_ip_addr,user_script_path_jp)
-        time.sleep(5)
+        self.wait_for_service(vm_name, "nfs-kernel-server")
+        self.run_lxc_command(vm_name, ["rm", "-f", os.path.join(nfs_root, GOLDEN_ROOTFS_MARKER)])
 
 
     
@@ -1032,19 +1006,59 @@ EOF
         """
         Installs the 5gmmtctool and updates DHCP configuration.
         """
-        ip = IpAddr()
-        ip.update_dhcp_configuration(DHCP_CONFIG_FILE_PATH, nfs_ip_addr)
-        push_cmd = ["lxc", "file", "push", DHCP_CONFIG_FILE_PATH, f"{vm_name}/root/"]
-        self.run_command(push_cmd, "Push DHCP configuration")
-        push_tool = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, "5gmmtctool"), f"{vm_name}/root/"]
-        self.run_command(push_tool, "Push 5gmmtctool")
+        bundle = VmBundle(f"5gmmtctool {vm_name}")
+        bundle.add_bytes(render_dhcpd_subnet(nfs_ip_addr), "/root/dhcpConfig.txt")
+        bundle.add_file(os.path.join(USER_SCRIPT_PATH, "5gmmtctool"), "/root/5gmmtctool")
+        bundle.execute(vm_name)
 
     # --------------------------------------------------------------------------
     # 10. NFS Jetson Setup
     # --------------------------------------------------------------------------
-    def setup_nfs_jetson(self, vm_name: str, nfsroot_v: str, device_names: list[str]) -> None:
+    @staticmethod
+    def _nfs_mode_env(mode: str) -> list[str]:
+        """
+        lxc exec options selecting the device root mode of the NFS setup scripts.
+        """
+        if mode not in ("copy", "overlay"):
+            raise ValueError(f"Unknown NFS root mode '{mode}' (expected 'copy' or 'overlay')")
+        return ["--env", f"NFS_ROOT_MODE={mode}"]
+
+    def _prepare_nfs_roots(self, vm_name: str, nfsroot_v: str, device_names: list[str],
+                           profile: str, mode: str) -> dict:
+        """
+        Prepares the device roots with nfs_root_prepare.py: all devices in
+        parallel, /etc/exports written and re-exported once.
+
+        Returns:
+            The script summary: per-device status, mode and seconds.
+
+        Raises:
+            subprocess.CalledProcessError: If the script failed for any device.
+        """
+        script_path = "/root/" + NFS_ROOT_PREPARE
+        self.run_command(["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, NFS_ROOT_PREPARE),
+                          f"{vm_name}{script_path}"], "Push NFS root preparation script")
+        command = ["python3", script_path, "--profile", profile, "--mode", mode,
+                   "--workers", str(NFS_PREPARE_WORKERS), nfsroot_v] + device_names
+        logging.info("Preparing NFS roots in VM %s for %s", vm_name, device_names)
+        result = get_lxd().exec(vm_name, command)
+        lines = result.stdout.strip().splitlines()
+        summary = json.loads(lines[-1]) if lines and lines[-1].startswith("{") else {}
+        for device in summary.get("devices", []):
+            logging.info("NFS root of %s %s (%s) in %ss", device["device"], device["status"],
+                         device["mode"], device["seconds"])
+        if result.returncode != 0:
+            logging.error("NFS root preparation failed in VM %s: %s", vm_name,
+                          summary.get("errors") or result.stderr)
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        logging.info("Prepared %d NFS roots in VM %s in %ss", len(device_names), vm_name, summary.get("seconds"))
+        return summary
+
+    def setup_nfs_jetson(self, vm_name: str, nfsroot_v: str, device_names: list[str],
+                         mode: str = NFS_ROOT_MODE) -> None:
         """
         Executes the NFS setup script inside the VM with provided nfsroot_v and device names.
+        mode is "copy" (unique dirs copied per device) or "overlay" (overlayfs per device).
         
         Usage:
         setup_nfs_jetson("<VM_NAME>", "<nfsroot-v>", ["device1", "device2", ...])
@@ -1059,9 +1073,13 @@ EOF
         args = " ".join([nfsroot_v] + device_names)
         
         try:
-            subprocess.run(["lxc", "exec", vm_name, "--", "chmod", "+x", script_path], check=True)
+            if NFS_PREPARE_ENGINE == "python":
+                self._prepare_nfs_roots(vm_name, nfsroot_v, device_names, "jetson", mode)
+                return
+            get_lxd().run(["lxc", "exec", vm_name, "--", "chmod", "+x", script_path], check=True)
             logging.info("Executing NFS setup script in VM %s %s", vm_name ,nfsroot_v)
-            subprocess.run(["lxc", "exec", vm_name, "--", "bash", "-c", f"{script_path} {args}"], check=True)
+            get_lxd().run(["lxc", "exec", vm_name] + self._nfs_mode_env(mode) + ["--", "bash", "-c", f"{script_path} {args}"],
+                          check=True)
             logging.info("NFS setup script executed successfully in VM %s", vm_name)
         except subprocess.CalledProcessError as e:
             logging.error("Error executing NFS setup in VM %s: %s", vm_name, e)
@@ -1070,7 +1088,8 @@ EOF
     # --------------------------------------------------------------------------
     # 10. NFS rasspbery setup
     # --------------------------------------------------------------------------
-    def setup_nfs_rpi(self, vm_name: str, nfs_version: str, device_names: list[str]) -> None:
+    def setup_nfs_rpi(self, vm_name: str, nfs_version: str, device_names: list[str],
+                      mode: str = NFS_ROOT_MODE) -> None:
         """
             Executes the NFS setup script for Raspberry Pi inside the specified VM.
 
@@ -1078,6 +1097,7 @@ EOF
                 vm_name (str): Name of the LXC container (VM).
                 nfs_version (str): Version tag of the NFS root (e.g., "v2").
                 device_names (list[str]): List of device identifiers (e.g., hostnames or MACs).
+                mode (str): Device root mode, "copy" or "overlay".
 
             Usage:
                 setup_nfs_raspberry("my_vm", "v2", ["raspi-1", "raspi-2"])
@@ -1091,15 +1111,18 @@ EOF
         args = " ".join([ nfs_version] + device_names)
 
         try:
+            if NFS_PREPARE_ENGINE == "python":
+                self._prepare_nfs_roots(vm_name, nfs_version, device_names, "rpi", mode)
+                return
             # Ensure script is executable
-            subprocess.run(["lxc", "exec", vm_name, "--", "chmod", "+x", script_path], check=True)
+            get_lxd().run(["lxc", "exec", vm_name, "--", "chmod", "+x", script_path], check=True)
 
             # Execute the script with arguments inside the VM
             logging.info("Executing Raspberry Pi NFS setup script in VM '%s' with NFS version '%s' and devices %s",
                         vm_name, nfs_version, device_names)
 
-            subprocess.run(
-                ["lxc", "exec", vm_name, "--", "bash", "-c", f"{script_path} {args}"],
+            get_lxd().run(
+                ["lxc", "exec", vm_name] + self._nfs_mode_env(mode) + ["--", "bash", "-c", f"{script_path} {args}"],
                 check=True
             )
 
@@ -1111,7 +1134,8 @@ EOF
     def setup_nfs_jtx2(self ,
         vm_name: str,
         nfs_version: str,
-        device_names: list[str]
+        device_names: list[str],
+        mode: str = NFS_ROOT_MODE
     ) -> None:
         """
         Executes the NFS setup script for JTX2 inside the specified LXC VM.
@@ -1120,6 +1144,7 @@ EOF
             vm_name (str): Name of the LXC container.
             nfs_version (str): Version tag of the NFS root (e.g., "v2").
             device_names (List[str]): List of device identifiers.
+            mode (str): Device root mode, "copy" or "overlay".
             script_name (str): Name of the setup script (defaults to JTX2_SETUP_NFS).
 
         Logs an error and returns if any argument is missing or if execution fails.
@@ -1134,8 +1159,11 @@ EOF
         args = [str(script_path), nfs_version] + device_names
 
         try:
+            if NFS_PREPARE_ENGINE == "python":
+                self._prepare_nfs_roots(vm_name, nfs_version, device_names, "rpi", mode)
+                return
             # Ensure script is executable
-            subprocess.run(
+            get_lxd().run(
                 ["lxc", "exec", vm_name, "--", "chmod", "+x", str(script_path)],
                 check=True
             )
@@ -1146,8 +1174,8 @@ EOF
             )
 
             # Execute the script inside the VM
-            subprocess.run(
-                ["lxc", "exec", vm_name, "--", "bash", "-c", " ".join(args)],
+            get_lxd().run(
+                ["lxc", "exec", vm_name] + self._nfs_mode_env(mode) + ["--", "bash", "-c", " ".join(args)],
                 check=True
             )
 
@@ -1155,13 +1183,52 @@ EOF
 
         except subprocess.CalledProcessError as e:
             logging.error("Error during NFS setup for JTX2 in VM '%s': %s", vm_name, e)
+
+    def exported_nodes(self, vm_name: str) -> list[str]:
+        """
+        Returns the nodes the VM serves: device roots in /etc/exports
+        (/root/<nfsroot-v>/<device>/rootfs) and nbd-server exports.
+        """
+        nodes = []
+        result = get_lxd().exec(vm_name, ["cat", "/etc/exports"])
+        for line in result.stdout.splitlines() if result.returncode == 0 else []:
+            parts = line.split()[0].strip("/").split("/") if line.strip() else []
+            if len(parts) == 4 and parts[0] == "root" and parts[3] == "rootfs":
+                nodes.append(parts[2])
+        result = get_lxd().exec(vm_name, ["cat", NBD_CONFIG_FILE])
+        if result.returncode == 0:
+            nodes += parse_exported_nodes(result.stdout)
+        return list(dict.fromkeys(nodes))
+
+    def remove_nfs_roots(self, vm_name: str, nfsroot_v: str, device_names: list[str]) -> None:
+        """
+        Tears down the device roots of /root/<nfsroot_v>: exports removed and
+        re-exported once, then mounts (overlay or rootfs_shared bind) released
+        and device directories deleted. The shared rootfs is left untouched.
+        """
+        nfs_root = f"/root/{nfsroot_v}"
+        bundle = VmBundle(f"nfs-remove {vm_name}")
+        for device in device_names:
+            device_dir = f"{nfs_root}/{device}"
+            # Export lines of both engines: "<root> *(...)" and the bash script comment
+            bundle.run(["sed", "-i", "-e", rf"\#^{device_dir}/rootfs #d",
+                        "-e", rf"/^# Configuring NFS exports {device} \.\.\.$/d", "/etc/exports"])
+        bundle.run(["exportfs", "-ra"])
+        for device in device_names:
+            device_dir = f"{nfs_root}/{device}"
+            # Deepest mounts first; the directory is only deleted once nothing is mounted in it
+            bundle.run(f"findmnt -rn -o TARGET | grep '^{device_dir}/' | sort -r | xargs -r -n1 umount -l; "
+                       f"findmnt -rn -o TARGET | grep -q '^{device_dir}/' || "
+                       f"rm -rf --one-file-system {device_dir}", f"Remove NFS root of {device}")
+        bundle.execute(vm_name)
+        logging.info("Removed NFS roots of %s in VM %s", device_names, vm_name)
         # --------------------------------------------------------------------------
     # 11. Utility: README Creation
     # --------------------------------------------------------------------------
     @staticmethod
-    def create_readme_in_vm_j20_j40(vm_name: str, nfs_ip_addr: str, rootfs:str)  -> None:
+    def readme_j20_j40(nfs_ip_addr: str) -> str:
         """
-        Creates a README.md file inside the VM with setup instructions.
+        Returns the README_j20_j40.md setup instructions for the given NFS server.
         """
     
         nfs_ip = nfs_ip_addr.split('/')[0]
@@ -1204,28 +1271,22 @@ Manage Jetson fan speed:
 ./scripts/fan/fan_control.py
 
 """    
-        touch_cmd = f'lxc exec {vm_name} -- bash -c "touch {rootfs}/rootfs/home/mmtc/README_j20_j40.md"'
-        try:
-            subprocess.run(touch_cmd, shell=True, check=True)
-            logging.info("Created README_j20_j40.md in VM %s", vm_name)
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to create README_j20_j40.md: %s", e)
-            raise
-        write_cmd = (
-            f'lxc exec {vm_name} -- bash -c "cat > {rootfs}/rootfs/home/mmtc/README_j20_j40.md << \'EOF\'\n'
-            f'{content}\nEOF"'
-        )
-        try:
-            subprocess.run(write_cmd, shell=True, check=True)
-            logging.info("Populated README_j20_j40.md in VM %s", vm_name)
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to write to README_j20_j40.md: %s", e)
-            raise
+        return content
+
     @staticmethod
-    def create_readme_in_vm_nano_jtx(vm_name: str, nfs_ip_addr: str, rootfs:str)  -> None:
+    def create_readme_in_vm_j20_j40(vm_name: str, nfs_ip_addr: str, rootfs:str)  -> None:
         """
         Creates a README.md file inside the VM with setup instructions.
         """
+        target = f"{rootfs}/rootfs/home/mmtc/README_j20_j40.md"
+        VmBundle(f"readme {vm_name}").add_bytes(VmManager.readme_j20_j40(nfs_ip_addr), target).execute(vm_name)
+        logging.info("Created README_j20_j40.md in VM %s", vm_name)
+
+    @staticmethod
+    def readme_nano_jtx(nfs_ip_addr: str) -> str:
+        """
+        Returns the README_j10_jtx.md setup instructions for the given NFS server.
+        """
     
         nfs_ip = nfs_ip_addr.split('/')[0]
         content = f"""
@@ -1272,23 +1333,16 @@ Manage Jetson fan speed:
 ./scripts/fan/fan_control.py
 
 """    
-        touch_cmd = f'lxc exec {vm_name} -- bash -c "touch {rootfs}/rootfs/home/mmtc/README_j10_jtx.md"'
-        try:
-            subprocess.run(touch_cmd, shell=True, check=True)
-            logging.info("Created README_j10_jtx.md in VM %s", vm_name)
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to create README_j10_jtx.md: %s", e)
-            raise
-        write_cmd = (
-            f'lxc exec {vm_name} -- bash -c "cat > {rootfs}/rootfs/home/mmtc/README_j10_jtx.md << \'EOF\'\n'
-            f'{content}\nEOF"'
-        )
-        try:
-            subprocess.run(write_cmd, shell=True, check=True)
-            logging.info("Populated README_j10_jtx.md in VM %s", vm_name)
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to write to README_j10_jtx.md: %s", e)
-            raise
+        return content
+
+    @staticmethod
+    def create_readme_in_vm_nano_jtx(vm_name: str, nfs_ip_addr: str, rootfs:str)  -> None:
+        """
+        Creates a README.md file inside the VM with setup instructions.
+        """
+        target = f"{rootfs}/rootfs/home/mmtc/README_j10_jtx.md"
+        VmBundle(f"readme {vm_name}").add_bytes(VmManager.readme_nano_jtx(nfs_ip_addr), target).execute(vm_name)
+        logging.info("Created README_j10_jtx.md in VM %s", vm_name)
 # --------------------------------------------------------------------------
 # 12. External Function: Jetson Setup
 # --------------------------------------------------------------------------
@@ -1361,8 +1415,6 @@ vm_manager = VmManager()
 #vm_manager.run_command(push_command,"push ")
 #vm_manager.push_files_to_vm(vm_name="mehdi",nfs_root='/root/nfsroot-jp-3274',user_script_path=USER_SCRIPT_PATH , nfs_ip_addr="10.111.67.4",user_script_path_jp="jetson/jp3274/")
 #vm_manager.create_readme_in_vm("mehdi",  nfs_ip_addr="10.111.67.4", rootfs='/root/nfsroot-jp-3274')
-#ip = IpAddr()
-#ip.update_dhcp_configuration(DHCP_CONFIG_FILE_PATH,"10.111.100.6/24")
 """push_nfs_setup = ["lxc", "file", "push", os.path.join(USER_SCRIPT_PATH, RPI4_SETUP_NFS), f"{"mehdi"}/root/"]
 VmManager.run_command(push_nfs_setup, "Push NFS setup script")"""
 #vm_manager.setup_nfs_rpi("mehdi","nfsroot_rpi4",['rpi4-3'])
@@ -0,0 +1,131 @@
+import argparse
+import json
+import logging
+import time
+from typing import Iterable
+
+from config import GOLDEN_IMAGE_ROOT_SIZE, GOLDEN_IMAGE_ROOTFS, GOLDEN_IMAGE_VERSION, NODE_CONFIG_PATH
+from scripts.apt_cache import APT_CACHE, APT_PROXY_CONF, APT_PROXY_DETECT
+from scripts.create_env_vm import GOLDEN_ROOTFS_MARKER, GOLDEN_VERSION_FILE, VmManager
+from scripts.lxd_backend import get_lxd
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Only the package: the DHCP config depends on the user network
+GOLDEN_PACKAGES = ["isc-dhcp-server"]
+
+
+class GoldenImageBuilder:
+    """
+    Builds the versioned golden LXD image user VMs are launched from.
+
+    A throwaway VM is launched from the stock ubuntu image, gets every
+    package and service a user environment needs (and optionally the node
+    root filesystems, already extracted), and is published as
+    "<GOLDEN_IMAGE_ALIAS>-<ubuntu version>-v<GOLDEN_IMAGE_VERSION>".
+    """
+
+    def __init__(self, vm_manager: VmManager = None):
+        self.vm_manager = vm_manager or VmManager()
+
+    def _rootfs_configs(self, patterns: Iterable[str]) -> dict[str, tuple[str, dict]]:
+        """
+        Maps each rootfs path to (pattern, node config); patterns sharing a
+        rootfs (j20/j40/...) are extracted once.
+        """
+        with open(NODE_CONFIG_PATH, "r") as file:
+            configs = json.load(file)
+        rootfs = {}
+        for pattern in patterns:
+            if pattern not in configs:
+                raise ValueError(f"Unknown node pattern '{pattern}' in {NODE_CONFIG_PATH}")
+            rootfs.setdefault(configs[pattern]["rootfs"], (pattern, configs[pattern]))
+        return rootfs
+
+    def _extract_rootfs(self, vm_name: str, pattern: str, cfg: dict) -> None:
+        vm = self.vm_manager
+        # Attached cache volumes and shared NFS mounts are not part of a published image: extract in place
+        if pattern.startswith("rpi"):
+            vm.create_nfs_server_rpi(vm_name, cfg["rootfs"], cfg["driver"], cfg["driver_path"], cache=False, shared=False)
+        elif pattern.startswith("jtx"):
+            vm.create_nfs_server_jtx2(vm_name, cfg["rootfs"], cfg["driver"], cfg["driver_path"], cache=False, shared=False)
+        else:
+            vm.create_nfs_server(vm_name, cfg["rootfs"], cfg["driver"], cfg["driver_path"], cache=False, shared=False)
+        # Tell configure_nfs_* the rootfs is ready but still needs the user files
+        vm.run_lxc_command(vm_name, ["touch", f"{cfg['rootfs']}/{GOLDEN_ROOTFS_MARKER}"])
+
+    def _provision(self, vm_name: str, rootfs_patterns: Iterable[str]) -> None:
+        vm = self.vm_manager
+        vm.update_apt(vm_name)
+        vm.install_base_packages(vm_name)
+        vm.setup_tftp_server(vm_name)
+        vm.setup_nbd_server(vm_name)
+        vm.apt_install(vm_name, GOLDEN_PACKAGES)
+        for pattern, cfg in self._rootfs_configs(rootfs_patterns).values():
+            self._extract_rootfs(vm_name, pattern, cfg)
+        vm.run_lxc_command(vm_name, ["sh", "-c", f"echo {GOLDEN_IMAGE_VERSION} > {GOLDEN_VERSION_FILE}"])
+        # Every VM launched from the image must get its own identity and run cloud-init again
+        vm.run_lxc_command(vm_name, ["apt-get", "clean"])
+        # The apt proxy is handed to each VM at launch, never baked in
+        vm.run_lxc_command(vm_name, ["rm", "-f", APT_PROXY_CONF, APT_PROXY_DETECT])
+        vm.run_lxc_command(vm_name, ["cloud-init", "clean", "--logs"])
+        vm.run_lxc_command(vm_name, ["truncate", "-s", "0", "/etc/machine-id"])
+
+    def build(self, ubuntu_version: str, rootfs_patterns: Iterable[str] = (), force: bool = False) -> dict:
+        """
+        Builds and publishes the golden image for an Ubuntu version.
+
+        Args:
+            ubuntu_version: Base release, e.g. "22.04".
+            rootfs_patterns: Node patterns from nfs_node_configs.json whose
+                root filesystem is pre-extracted into the image.
+            force: Rebuild even if the current version is already published.
+
+        Returns:
+            A dict with the image alias, version and build time in seconds.
+        """
+        vm = self.vm_manager
+        alias = vm.golden_image_alias(ubuntu_version)
+        if vm.image_exists(alias) and not force:
+            logging.info("Golden image %s already exists.", alias)
+            return {"alias": alias, "version": GOLDEN_IMAGE_VERSION, "build_time": 0}
+
+        builder = f"golden-build-{ubuntu_version.replace('.', '')}"
+        start = time.time()
+        get_lxd().run(["lxc", "delete", builder, "--force"])
+        vm.run_command(["lxc", "launch", f"ubuntu:{ubuntu_version}", builder, "--vm",
+                        "--device", f"root,size={GOLDEN_IMAGE_ROOT_SIZE}",
+                        "-c", "limits.cpu=4", "-c", "limits.memory=4GiB"] + APT_CACHE.launch_options(),
+                       f"Launch golden image builder {builder}")
+        try:
+            vm.wait_for_agent(builder)
+            self._provision(builder, rootfs_patterns)
+            vm.stop_vm(builder)
+            if vm.image_exists(alias):
+                vm.run_command(["lxc", "image", "alias", "delete", alias], f"Drop old alias {alias}")
+            vm.run_command(["lxc", "publish", builder, "--alias", alias,
+                            f"version={GOLDEN_IMAGE_VERSION}", f"ubuntu={ubuntu_version}",
+                            f"description=Testbed golden image {alias}"],
+                           f"Publish golden image {alias}")
+        finally:
+            get_lxd().run(["lxc", "delete", builder, "--force"])
+
+        build_time = round(time.time() - start, 2)
+        logging.info("Golden image %s built in %ss", alias, build_time)
+        return {"alias": alias, "version": GOLDEN_IMAGE_VERSION, "build_time": build_time}
+
+
+def build_golden_image(ubuntu_version: str, rootfs_patterns: Iterable[str] = (), force: bool = False) -> dict:
+    return GoldenImageBuilder().build(ubuntu_version, rootfs_patterns, force)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the golden LXD image for user VMs.")
+    parser.add_argument("ubuntu_version", help="Ubuntu release, e.g. 22.04")
+    parser.add_argument("--rootfs", default=GOLDEN_IMAGE_ROOTFS,
+                        help="Comma separated node patterns to pre-extract, e.g. j20,rpi4")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the image exists")
+    args = parser.parse_args()
+    patterns = [p.strip() for p in args.rootfs.split(",") if p.strip()]
+    print(json.dumps(build_golden_image(args.ubuntu_version, patterns, args.force)))
@@ -0,0 +1,156 @@
+import ipaddress
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from config import (
+    USER_NETWORK_ID_MAX,
+    USER_NETWORK_ID_MIN,
+    USER_NETWORK_ID_RESERVED,
+    USER_NETWORK_SUPERNET,
+    USER_SUBNET_PREFIX,
+)
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Host offsets inside a user subnet (same layout as IpAddr)
+NFS_HOST = 4
+DHCP_FIRST_OFFSET = 2    # relative to the NFS address
+DHCP_LAST_OFFSET = 7
+JETSON_HOST = 20
+
+
+@dataclass(frozen=True)
+class UserNetwork:
+    """
+    Every address derived from a user network ID (which is also its VLAN ID).
+    """
+    network_id: int
+    subnet: ipaddress.IPv4Network
+    nfs_ip: ipaddress.IPv4Interface
+    vlan_ip: ipaddress.IPv4Interface
+    dhcp_range: tuple[ipaddress.IPv4Address, ipaddress.IPv4Address]
+    jetson_ip: ipaddress.IPv4Address
+
+    @classmethod
+    def from_id(cls, network_id: int,
+                supernet: str = USER_NETWORK_SUPERNET,
+                prefix: int = USER_SUBNET_PREFIX) -> "UserNetwork":
+        base = ipaddress.ip_network(supernet)
+        subnet = ipaddress.ip_network((base.network_address + network_id * 2 ** (32 - prefix), prefix))
+        if not subnet.subnet_of(base):
+            raise ValueError(f"Network ID {network_id} is outside {supernet}")
+        nfs_address = subnet.network_address + NFS_HOST
+        return cls(
+            network_id=network_id,
+            subnet=subnet,
+            nfs_ip=ipaddress.ip_interface((nfs_address, prefix)),
+            vlan_ip=ipaddress.ip_interface((subnet.network_address + network_id + 2, prefix)),
+            dhcp_range=(nfs_address + DHCP_FIRST_OFFSET, nfs_address + DHCP_LAST_OFFSET),
+            jetson_ip=subnet.network_address + JETSON_HOST,
+        )
+
+    @property
+    def vlan_id(self) -> int:
+        return self.network_id
+
+    def to_dict(self) -> dict:
+        return {
+            "user_network_id": self.network_id,
+            "user_subnet": str(self.subnet),
+            "nfs_ip_addr": str(self.nfs_ip),
+            "vlan_ip_addr": str(self.vlan_ip),
+            "dhcp_range": [str(self.dhcp_range[0]), str(self.dhcp_range[1])],
+            "jetson_ip_addr": str(self.jetson_ip),
+        }
+
+
+def parse_id_ranges(spec: str) -> list[int]:
+    """
+    Parses "10-20,42" into [10, 11, ..., 20, 42].
+    """
+    ids = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        start, _, end = part.partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+class NetworkIdAllocator:
+    """
+    Free-list allocator for user network IDs / VLANs.
+
+    A bitmap records which IDs are taken and a FIFO free-list hands out the
+    next free ID in O(1) (IDs reserved out of order are skipped lazily).
+    """
+
+    def __init__(self, first: int = USER_NETWORK_ID_MIN, last: int = USER_NETWORK_ID_MAX,
+                 used: Iterable[int] = (), reserved: str = USER_NETWORK_ID_RESERVED):
+        self.first = first
+        self.last = last
+        self.lock = threading.Lock()
+        self.used = bytearray(last + 1)
+        self.free = deque(range(first, last + 1))
+        for network_id in parse_id_ranges(reserved):
+            self.reserve(network_id)
+        for network_id in used:
+            self.reserve(network_id)
+
+    def _check(self, network_id: int) -> None:
+        if not self.first <= network_id <= self.last:
+            raise ValueError(f"Choose user_network_id between {self.first} and {self.last}")
+
+    def reserve(self, network_id: int) -> bool:
+        """
+        Marks an ID as taken. Returns False if it already was, or if it is
+        outside the allocator range (e.g. a stored user from an older range:
+        logged and skipped, so seeding never fails).
+        """
+        if not self.first <= network_id <= self.last:
+            logging.warning("Network ID %s is outside %s-%s; not tracked by the allocator.",
+                            network_id, self.first, self.last)
+            return False
+        with self.lock:
+            if self.used[network_id]:
+                return False
+            self.used[network_id] = 1
+            return True
+
+    def reserve_range(self, start: int, end: int) -> None:
+        for network_id in range(start, end + 1):
+            self.reserve(network_id)
+
+    def allocate(self, network_id: Optional[int] = None) -> int:
+        """
+        Takes the requested ID, or the next free one when none is requested.
+
+        Raises:
+            ValueError: If the requested ID is taken or out of range, or the
+                pool is exhausted.
+        """
+        if network_id is not None:
+            self._check(network_id)
+            if not self.reserve(network_id):
+                raise ValueError(f"User number {network_id} is already allocated.")
+            return network_id
+        with self.lock:
+            while self.free:
+                network_id = self.free.popleft()
+                if not self.used[network_id]:
+                    self.used[network_id] = 1
+                    return network_id
+        raise ValueError("No free user network ID left")
+
+    def release(self, network_id: int) -> None:
+        if not self.first <= network_id <= self.last:
+            return
+        with self.lock:
+            if self.used[network_id]:
+                self.used[network_id] = 0
+                self.free.append(network_id)
+
+    def is_free(self, network_id: int) -> bool:
+        return self.first <= network_id <= self.last and not self.used[network_id]
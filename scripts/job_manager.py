@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from config import JOB_HISTORY_SIZE, JOB_MAX_WORKERS
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Job running in the current worker thread (used by set_job_step)
+_current = threading.local()
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobConflict(RuntimeError):
+    """
+    Raised by an exclusive submit when a job is already active for its key.
+    """
+
+    def __init__(self, job_id: str, key: str):
+        super().__init__(f"Job {job_id} is already active for {key}")
+        self.job_id = job_id
+        self.key = key
+
+
+@dataclass
+class Job:
+    job_id: str
+    name: str
+    key: Optional[str] = None
+    state: str = QUEUED
+    step: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QUEUED, RUNNING)
+
+    def elapsed(self) -> float:
+        """
+        Seconds spent running (or waiting, if the job has not started yet).
+        """
+        start = self.started_at or self.created_at
+        end = self.finished_at or time.time()
+        return round(end - start, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "key": self.key,
+            "state": self.state,
+            "step": self.step,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": self.elapsed(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs long blocking operations (VM provisioning) on a bounded worker pool
+    and keeps their state so the API can be polled instead of blocked.
+    """
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, history_size: int = JOB_HISTORY_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.history_size = history_size
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, func: Callable, *args, key: Optional[str] = None,
+               exclusive: bool = False, **kwargs) -> str:
+        """
+        Queues func(*args, **kwargs) and returns the job ID immediately.
+        If an active job already exists for the same key (e.g. a VM name),
+        its ID is returned instead of queueing a duplicate build.
+
+        Raises:
+            JobConflict: If exclusive is set and a job is active for the key
+                (for changes that must not run next to another job).
+        """
+        with self.lock:
+            if key is not None:
+                for job in self.jobs.values():
+                    if job.key == key and job.active:
+                        if exclusive:
+                            raise JobConflict(job.job_id, key)
+                        logging.info("Job %s already active for %s; not queueing again.", job.job_id, key)
+                        return job.job_id
+            job = Job(job_id=uuid.uuid4().hex, name=name, key=key)
+            self.jobs[job.job_id] = job
+            self._prune()
+        self.executor.submit(self._run, job, func, args, kwargs)
+        logging.info("Job %s (%s) queued", job.job_id, name)
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> list[dict]:
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def shutdown(self, wait: bool = False) -> None:
+        self.executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, func: Callable, args: tuple, kwargs: dict) -> None:
+        _current.job = job
+        job.state = RUNNING
+        job.started_at = time.time()
+        logging.info("Job %s (%s) started", job.job_id, job.name)
+        try:
+            job.result = func(*args, **kwargs)
+            # finished_at first: a poller never sees a terminal job without it
+            job.finished_at = time.time()
+            job.state = SUCCEEDED
+            logging.info("Job %s (%s) succeeded in %ss", job.job_id, job.name, job.elapsed())
+        except Exception as e:
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.state = FAILED
+            logging.error("Job %s (%s) failed at step '%s': %s", job.job_id, job.name, job.step, e)
+        finally:
+            _current.job = None
+
+    def _prune(self) -> None:
+        """
+        Drops the oldest finished jobs once the history is full.
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self.jobs[job_id]
+
+
+def set_job_step(step: str) -> None:
+    """
+    Records the current step of the job running in this thread.
+    Does nothing when called outside of a job (e.g. from a script).
+    """
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.step = step
+        logging.info("Job %s: %s", job.job_id, step)
@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import pylxd
+from pylxd.exceptions import LXDAPIException, NotFound
+
+from config import LXD_BACKEND, STREAM_CHUNK_SIZE, STREAM_PROGRESS_INTERVAL
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+
+class ProgressReader:
+    """
+    Reads a host file in STREAM_CHUNK_SIZE chunks for streaming into an exec,
+    logging the progress every STREAM_PROGRESS_INTERVAL seconds. At most one
+    chunk is held in memory whatever the file size.
+    """
+
+    def __init__(self, path: str, description: str, chunk_size: int = STREAM_CHUNK_SIZE,
+                 interval: float = STREAM_PROGRESS_INTERVAL):
+        self.description = description
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.total = os.path.getsize(path)
+        self.sent = 0
+        self.start = self.last_report = time.time()
+        self.file = open(path, "rb")
+
+    def read(self, size: int = -1) -> bytes:
+        size = self.chunk_size if size is None or size < 0 else min(size, self.chunk_size)
+        data = self.file.read(size)
+        self.sent += len(data)
+        now = time.time()
+        if not data or now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+        return data
+
+    def __iter__(self):
+        return iter(self.read, b"")
+
+    def report(self) -> None:
+        elapsed = max(time.time() - self.start, 1e-6)
+        percent = 100 * self.sent / self.total if self.total else 100
+        logging.info("%s: %.0f/%.0f MB (%.0f%%) at %.1f MB/s", self.description, self.sent / 1e6,
+                     self.total / 1e6, percent, self.sent / 1e6 / elapsed)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LxdBackend(ABC):
+    """
+    Execution backend for the LXD operations VmManager needs: exec, file
+    push/pull, instance state and device management.
+
+    run() accepts the same argv as the lxc CLI (["lxc", "exec", vm, "--", ...],
+    ["lxc", "file", "push", src, "vm/path"], ...) and dispatches it to the
+    backend methods, so call sites keep their command lists. Anything it does
+    not recognise is run with the real lxc binary.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def exec(self, vm_name: str, command: list[str], environment: Optional[dict] = None,
+             stdin: Optional[bytes] = None) -> subprocess.CompletedProcess:
+        """
+        Runs a command in the instance; stdin, if given, is fed to it.
+        Returns a CompletedProcess with text stdout/stderr (never raises on
+        a non-zero exit code).
+        """
+
+    @abstractmethod
+    def _exec_reader(self, vm_name: str, command: list[str], reader: ProgressReader) -> subprocess.CompletedProcess:
+        ...
+
+    def exec_stream(self, vm_name: str, command: list[str], source: str, description: Optional[str] = None,
+                    check: bool = False) -> subprocess.CompletedProcess:
+        """
+        Runs a command in the instance with the host file source streamed to
+        its stdin, e.g. a tarball into `tar -x -f -`: the file is never
+        copied to the VM disk.
+
+        Raises:
+            subprocess.CalledProcessError: If check is set and the command failed.
+        """
+        description = description or f"Stream {os.path.basename(source)} to {vm_name}"
+        with ProgressReader(source, description) as reader:
+            result = self._exec_reader(vm_name, command, reader)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        return result
+
+    @abstractmethod
+    def push_file(self, vm_name: str, source: str, target: str) -> None:
+        ...
+
+    @abstractmethod
+    def pull_file(self, vm_name: str, source: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def info(self, vm_name: str) -> Optional[dict]:
+        """
+        Returns {"name", "status", "type"} of an instance, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def start(self, vm_name: str) -> None:
+        ...
+
+    @abstractmethod
+    def stop(self, vm_name: str, force: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, vm_name: str, force: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def add_device(self, vm_name: str, device_name: str, device: dict) -> None:
+        ...
+
+    def state(self, vm_name: str) -> Optional[str]:
+        info = self.info(vm_name)
+        return info["status"] if info else None
+
+    # --------------------------------------------------------------------------
+    # lxc argv compatibility
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _cli(argv: list[str]) -> subprocess.CompletedProcess:
+        return subprocess.run(argv, capture_output=True, text=True)
+
+    @staticmethod
+    def _split_target(target: str) -> tuple[str, str]:
+        vm_name, _, path = target.partition("/")
+        return vm_name, "/" + path
+
+    def _dispatch(self, argv: list[str]) -> Optional[subprocess.CompletedProcess]:
+        """
+        Runs a recognised lxc argv through the backend methods; returns None
+        for commands that must go to the CLI.
+        """
+        args = argv[1:]
+        done = subprocess.CompletedProcess(argv, 0, "", "")
+        if args[0] == "exec" and "--" in args:
+            split = args.index("--")
+            vm_name, options, command = args[1], args[2:split], args[split + 1:]
+            environment = {}
+            while options:
+                option = options.pop(0)
+                if option != "--env" or not options:
+                    return None
+                key, _, value = options.pop(0).partition("=")
+                environment[key] = value
+            result = self.exec(vm_name, command, environment or None)
+            result.args = argv
+            return result
+        if args[:2] == ["file", "push"] and not any(a.startswith("-") for a in args[2:]) and len(args) >= 4:
+            vm_name, path = self._split_target(args[-1])
+            for source in args[2:-1]:
+                target = path + os.path.basename(source) if path.endswith("/") else path
+                self.push_file(vm_name, source, target)
+            return done
+        if args[0] in ("start", "stop", "delete") and len(args) >= 2:
+            force = "--force" in args or "-f" in args
+            for vm_name in (a for a in args[1:] if not a.startswith("-")):
+                if args[0] == "start":
+                    self.start(vm_name)
+                elif args[0] == "stop":
+                    self.stop(vm_name, force)
+                else:
+                    self.delete(vm_name, force)
+            return done
+        if args[:3] == ["config", "device", "add"] and len(args) >= 6:
+            vm_name, device_name, device_type = args[3:6]
+            device = {"type": device_type}
+            device.update(pair.split("=", 1) for pair in args[6:])
+            self.add_device(vm_name, device_name, device)
+            return done
+        return None
+
+    def run(self, argv: list[str], check: bool = False) -> subprocess.CompletedProcess:
+        """
+        Drop-in for subprocess.run(argv, capture_output=True, text=True) on
+        lxc commands.
+
+        Raises:
+            subprocess.CalledProcessError: If check is set and the command failed.
+        """
+        try:
+            result = self._dispatch(argv)
+        except (LXDAPIException, OSError) as e:
+            result = subprocess.CompletedProcess(argv, 1, "", str(e))
+        if result is None:
+            result = self._cli(argv)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv, result.stdout, result.stderr)
+        return result
+
+
+class CliBackend(LxdBackend):
+    """
+    Forks the lxc binary for every operation (the historical behaviour).
+    """
+
+    name = "cli"
+
+    def _checked(self, argv: list[str]) -> subprocess.CompletedProcess:
+        result = self._cli(argv)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv, result.stdout, result.stderr)
+        return result
+
+    def exec(self, vm_name, command, environment=None, stdin=None):
+        env_args = []
+        for key, value in (environment or {}).items():
+            env_args += ["--env", f"{key}={value}"]
+        argv = ["lxc", "exec", vm_name] + env_args + ["--"] + command
+        if stdin is None:
+            return self._cli(argv)
+        result = subprocess.run(argv, capture_output=True, input=stdin)
+        return subprocess.CompletedProcess(argv, result.returncode,
+                                           result.stdout.decode(errors="replace"),
+                                           result.stderr.decode(errors="replace"))
+
+    def _exec_reader(self, vm_name, command, reader):
+        argv = ["lxc", "exec", vm_name, "--"] + command
+        process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = {}
+        # Drain stdout/stderr in the background so a chatty command cannot stall the pipe
+        readers = [threading.Thread(target=lambda key, pipe: output.__setitem__(key, pipe.read()), args=(key, pipe))
+                   for key, pipe in (("stdout", process.stdout), ("stderr", process.stderr))]
+        for thread in readers:
+            thread.start()
+        try:
+            for chunk in reader:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # The command exited early; its return code and stderr tell why
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        process.wait()
+        for thread in readers:
+            thread.join()
+        return subprocess.CompletedProcess(argv, process.returncode,
+                                           output["stdout"].decode(errors="replace"),
+                                           output["stderr"].decode(errors="replace"))
+
+    def push_file(self, vm_name, source, target):
+        self._checked(["lxc", "file", "push", source, f"{vm_name}{target}"])
+
+    def pull_file(self, vm_name, source):
+        result = subprocess.run(["lxc", "file", "pull", f"{vm_name}{source}", "-"], capture_output=True, check=True)
+        return result.stdout
+
+    def info(self, vm_name):
+        result = self._cli(["lxc", "query", f"/1.0/instances/{vm_name}"])
+        if result.returncode != 0:
+            return None
+        instance = json.loads(result.stdout)
+        return {"name": instance["name"], "status": instance["status"], "type": instance["type"]}
+
+    def start(self, vm_name):
+        self._checked(["lxc", "start", vm_name])
+
+    def stop(self, vm_name, force=False):
+        self._checked(["lxc", "stop", vm_name] + (["--force"] if force else []))
+
+    def delete(self, vm_name, force=False):
+        self._checked(["lxc", "delete", vm_name] + (["--force"] if force else []))
+
+    def add_device(self, vm_name, device_name, device):
+        device = dict(device)
+        device_type = device.pop("type")
+        self._checked(["lxc", "config", "device", "add", vm_name, device_name, device_type]
+                      + [f"{key}={value}" for key, value in device.items()])
+
+    def run(self, argv, check=False):
+        result = self._cli(argv)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv, result.stdout, result.stderr)
+        return result
+
+
+class PylxdBackend(LxdBackend):
+    """
+    Talks to the LXD REST API over the unix socket through one shared
+    pylxd.Client, so exec, file transfers and state queries cost one HTTP
+    round trip instead of a process fork.
+    """
+
+    name = "pylxd"
+
+    def __init__(self, client: Optional[pylxd.Client] = None):
+        self.client = client or pylxd.Client()
+
+    def _instance(self, vm_name: str):
+        # Exec and file calls only need the name: skip the GET a lookup costs
+        return pylxd.models.Instance(self.client, name=vm_name)
+
+    def exec(self, vm_name, command, environment=None, stdin=None):
+        result = self._instance(vm_name).execute(command, environment=environment, stdin_payload=stdin)
+        return subprocess.CompletedProcess(command, result.exit_code, result.stdout or "", result.stderr or "")
+
+    def _exec_reader(self, vm_name, command, reader):
+        # pylxd sends an iterable stdin payload chunk by chunk over the stdin websocket
+        result = self._instance(vm_name).execute(command, stdin_payload=reader)
+        return subprocess.CompletedProcess(command, result.exit_code, result.stdout or "", result.stderr or "")
+
+    def push_file(self, vm_name, source, target):
+        stat = os.stat(source)
+        with open(source, "rb") as data:
+            # Same ownership and mode as `lxc file push`, body streamed from disk
+            self._instance(vm_name).files.put(target, data, mode=stat.st_mode & 0o7777,
+                                              uid=stat.st_uid, gid=stat.st_gid)
+
+    def pull_file(self, vm_name, source):
+        return self._instance(vm_name).files.get(source)
+
+    def info(self, vm_name):
+        try:
+            instance = self.client.instances.get(vm_name)
+        except NotFound:
+            return None
+        return {"name": instance.name, "status": instance.status, "type": instance.type}
+
+    def start(self, vm_name):
+        self.client.instances.get(vm_name).start(wait=True)
+
+    def stop(self, vm_name, force=False):
+        self.client.instances.get(vm_name).stop(force=force, wait=True)
+
+    def delete(self, vm_name, force=False):
+        instance = self.client.instances.get(vm_name)
+        if force and instance.status == "Running":
+            instance.stop(force=True, wait=True)
+        instance.delete(wait=True)
+
+    def add_device(self, vm_name, device_name, device):
+        instance = self.client.instances.get(vm_name)
+        instance.devices[device_name] = device
+        instance.save(wait=True)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_lxd(name: str = LXD_BACKEND) -> LxdBackend:
+    """
+    Returns the process-wide backend, created on first use. The pylxd
+    backend falls back to the CLI when the LXD socket is not reachable.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if name == "pylxd":
+                    try:
+                        _backend = PylxdBackend()
+                    except Exception as e:
+                        logging.warning("pylxd backend unavailable (%s), using the lxc CLI", e)
+                        _backend = CliBackend()
+                else:
+                    _backend = CliBackend()
+                logging.info("LXD backend: %s", _backend.name)
+    return _backend
+
+
+def instance_address(name: str) -> Optional[str]:
+    """
+    Returns the first global IPv4 address of an instance, or None when it has none yet.
+    """
+    result = get_lxd().run(["lxc", "query", f"/1.0/instances/{name}/state"], check=True)
+    state = json.loads(result.stdout)
+    for interface, network in (state.get("network") or {}).items():
+        if interface == "lo":
+            continue
+        for address in network.get("addresses", []):
+            if address["family"] == "inet" and address.get("scope") == "global":
+                return address["address"]
+    return None
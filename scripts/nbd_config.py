@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+from config import NODE_CONFIG_PATH
+from config.constants import CONFIG_DIR
+
+# nbd-server configuration file in the user VM
+NBD_CONFIG_FILE = "/etc/nbd-server/config"
+
+# Export (and folder) name of a node: nbd_jetson_<node>
+NBD_EXPORT_PREFIX = "nbd_jetson_"
+
+NBD_GENERIC_SECTION = "[generic]\nallowlist = true\n"
+
+_SECTION = re.compile(rf"^\[{NBD_EXPORT_PREFIX}(.+)\]\s*$", re.MULTILINE)
+
+
+def node_folder(node: str) -> str:
+    return f"/root/{NBD_EXPORT_PREFIX}{node}"
+
+
+def load_node_images(path: str = NODE_CONFIG_PATH) -> dict[str, Optional[str]]:
+    """
+    Maps each node pattern of the NFS node-config registry to its NBD base
+    image file name (None: the node gets an empty scratch image).
+    """
+    with open(path, "r") as file:
+        configs = json.load(file)
+    return {pattern: cfg.get("nbd_image") for pattern, cfg in configs.items()}
+
+
+def node_base_image(node: str, node_images: dict[str, Optional[str]]) -> Optional[str]:
+    """
+    Returns the host path of the NBD base image for a node name, matched
+    like the NFS setup does (first registry pattern contained in the name).
+    """
+    pattern = next((pattern for pattern in node_images if pattern in node), None)
+    image = node_images.get(pattern) if pattern else None
+    return os.path.join(CONFIG_DIR, image) if image else None
+
+
+def parse_exported_nodes(config: str) -> list[str]:
+    """
+    Returns the nodes that have an export section in an nbd-server config.
+    """
+    return _SECTION.findall(config)
+
+
+def render_nbd_config(exports: dict[str, str], listen_addr: Optional[str] = None) -> str:
+    """
+    Renders the whole nbd-server config: the generic section, then one
+    export per node (sorted, so the same state always gives the same text).
+
+    Args:
+        exports: Node name -> image path in the VM.
+        listen_addr: Address the exports listen on.
+    """
+    sections = [NBD_GENERIC_SECTION]
+    for node in sorted(exports):
+        section = f"[{NBD_EXPORT_PREFIX}{node}]\nexportname = {exports[node]}\nreadonly = false\n"
+        if listen_addr:
+            section += f"listenaddr = {listen_addr}\n"
+        sections.append(section)
+    return "\n".join(sections)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
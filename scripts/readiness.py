@@ -0,0 +1,46 @@
+import logging
+import time
+from typing import Callable
+
+from config import READY_INITIAL_INTERVAL, READY_MAX_INTERVAL
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+
+def wait_for(condition: Callable[[], bool], description: str, timeout: float,
+             initial_interval: float = READY_INITIAL_INTERVAL,
+             max_interval: float = READY_MAX_INTERVAL) -> float:
+    """
+    Polls condition with exponential backoff until it returns True.
+
+    An exception raised by the condition counts as "not ready yet". Every
+    wait is logged with the time it actually took so deadlines can be tuned.
+
+    Returns:
+        The number of seconds waited.
+
+    Raises:
+        TimeoutError: If the condition is still false after timeout seconds.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    interval = initial_interval
+    polls = 0
+    while True:
+        polls += 1
+        try:
+            ready = condition()
+        except Exception as e:
+            logging.debug("Readiness check '%s' raised: %s", description, e)
+            ready = False
+        elapsed = time.monotonic() - start
+        if ready:
+            logging.info("Ready: %s after %.2fs (%d polls)", description, elapsed, polls)
+            return elapsed
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logging.error("Timed out after %.2fs (%d polls) waiting for: %s", elapsed, polls, description)
+            raise TimeoutError(f"Timed out after {timeout}s waiting for: {description}")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
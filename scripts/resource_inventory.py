@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from config import RESOURCE_JSON_PATH
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+
+class ResourceInventory:
+    """
+    In-memory view of resource.json with dict indexes on the lookup fields.
+
+    The file is parsed once and only re-read when its mtime, inode or size
+    changes, so lookups on the request path cost one stat() and a dict access.
+    """
+
+    INDEX_FIELDS = ("name", "switch_interface", "model", "usb_instance", "state")
+
+    def __init__(self, path: str = RESOURCE_JSON_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.resources: list[dict] = []
+        self.indexes: dict[str, dict[str, list[dict]]] = {}
+
+    def _refresh(self) -> None:
+        """
+        Reloads the file and rebuilds the indexes if it changed on disk.
+        """
+        stat = os.stat(self.path)
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return
+        with self.lock:
+            if signature == self.signature:
+                return
+            with open(self.path, "r") as file:
+                resources = json.load(file)
+            indexes = {field: {} for field in self.INDEX_FIELDS}
+            for resource in resources:
+                for field in self.INDEX_FIELDS:
+                    value = resource.get(field)
+                    if value is not None:
+                        indexes[field].setdefault(value, []).append(resource)
+            self.resources, self.indexes, self.signature = resources, indexes, signature
+            logging.info("Loaded %d resources from %s", len(resources), self.path)
+
+    def all(self) -> list[dict]:
+        self._refresh()
+        return list(self.resources)
+
+    def find(self, field: str, value) -> list[dict]:
+        """
+        Returns every resource whose indexed field equals value.
+        """
+        if field not in self.INDEX_FIELDS:
+            raise KeyError(f"Field '{field}' is not indexed")
+        self._refresh()
+        return list(self.indexes[field].get(value, []))
+
+    def get(self, field: str, value) -> Optional[dict]:
+        """
+        Returns the first resource whose indexed field equals value, or None.
+        """
+        matches = self.find(field, value)
+        return matches[0] if matches else None
+
+    def get_by_name(self, name: str) -> Optional[dict]:
+        return self.get("name", name)
+
+    def switch_interfaces(self) -> list[str]:
+        self._refresh()
+        return [resource["switch_interface"] for resource in self.resources]
+
+
+# Process-wide inventory shared by the API and the PoE manager
+INVENTORY = ResourceInventory()
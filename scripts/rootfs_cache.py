@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+
+from config import (
+    ROOTFS_CACHE_INDEX_PATH,
+    ROOTFS_CACHE_POOL,
+    ROOTFS_CACHE_PREFIX,
+    ROOTFS_CACHE_VOLUME_SIZE,
+    VM_INTERFACE_TIMEOUT,
+)
+from scripts.lxd_backend import get_lxd
+from scripts.readiness import wait_for
+from scripts.rootfs_extract import ExtractCommand
+from scripts.vm_bundle import VmBundle
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Snapshot every per-VM copy is taken from; a cache volume without it is half-built
+BASE_SNAPSHOT = "base"
+
+
+def disk_path(device_name: str) -> str:
+    """
+    Path of an LXD disk device inside a VM (LXD sets the serial to lxd_<device>).
+    """
+    return f"/dev/disk/by-id/scsi-0QEMU_QEMU_HARDDISK_lxd_{device_name}"
+
+
+class RootfsCache:
+    """
+    Host-side cache of extracted node root filesystems.
+
+    Each rootfs tarball is extracted once into an LXD custom block volume
+    named "<prefix>-<sha256 prefix>" and snapshotted. A VM that needs the
+    rootfs gets a copy of that snapshot (copy-on-write on ZFS/btrfs pools)
+    attached as a disk and mounted at <nfs_root>/rootfs, instead of pushing
+    and extracting the tarball again.
+    """
+
+    def __init__(self, pool: str = ROOTFS_CACHE_POOL, prefix: str = ROOTFS_CACHE_PREFIX,
+                 volume_size: str = ROOTFS_CACHE_VOLUME_SIZE, index_path: str = ROOTFS_CACHE_INDEX_PATH):
+        self.pool = pool
+        self.prefix = prefix
+        self.volume_size = volume_size
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.build_locks: dict[str, threading.Lock] = {}
+
+    # --------------------------------------------------------------------------
+    # Checksums
+    # --------------------------------------------------------------------------
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def checksum(self, tarball: str) -> str:
+        """
+        Returns the sha256 of a tarball. Digests are remembered per path,
+        size and mtime, so a multi-GB tarball is only hashed when it changes.
+        """
+        stat = os.stat(tarball)
+        key = f"{os.path.abspath(tarball)}:{stat.st_size}:{stat.st_mtime_ns}"
+        with self.lock:
+            digest = self._load_index().get(key)
+        if digest:
+            return digest
+        sha = hashlib.sha256()
+        with open(tarball, "rb") as file:
+            for chunk in iter(lambda: file.read(8 * 1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self.lock:
+            index = self._load_index()
+            index[key] = digest
+            self._save_index(index)
+        return digest
+
+    # --------------------------------------------------------------------------
+    # Volumes
+    # --------------------------------------------------------------------------
+    def _lxc(self, command: list[str], description: str) -> subprocess.CompletedProcess:
+        logging.info("%s: %s", description, " ".join(command))
+        return get_lxd().run(command, check=True)
+
+    def volume_exists(self, volume: str) -> bool:
+        return get_lxd().run(["lxc", "storage", "volume", "show", self.pool, volume]).returncode == 0
+
+    def _delete_volume(self, volume: str) -> None:
+        get_lxd().run(["lxc", "storage", "volume", "delete", self.pool, volume])
+
+    def _attach(self, vm_name: str, device_name: str, volume: str) -> str:
+        self._lxc(["lxc", "config", "device", "add", vm_name, device_name, "disk",
+                   f"pool={self.pool}", f"source={volume}"], f"Attach volume {volume} to {vm_name}")
+        device = disk_path(device_name)
+        wait_for(lambda: get_lxd().exec(vm_name, ["test", "-b", device]).returncode == 0,
+                 f"disk {device_name} in VM {vm_name}", VM_INTERFACE_TIMEOUT)
+        return device
+
+    def _build(self, volume: str, digest: str, vm_name: str, tarball: str, extract: ExtractCommand) -> None:
+        """
+        Creates the cache volume and fills it by extracting the tarball in
+        vm_name, which borrows the volume for the duration of the build.
+        """
+        if self.volume_exists(volume):
+            logging.info("Deleting unfinished rootfs cache volume %s", volume)
+            self._delete_volume(volume)
+        self._lxc(["lxc", "storage", "volume", "create", self.pool, volume, "--type=block",
+                   f"size={self.volume_size}", f"user.sha256={digest}",
+                   f"user.source={os.path.basename(tarball)}"], f"Create rootfs cache volume {volume}")
+        device_name = "rootfs-cache-build"
+        staging = f"/mnt/{volume}"
+        try:
+            device = self._attach(vm_name, device_name, volume)
+            bundle = VmBundle(f"rootfs-cache {volume}")
+            bundle.run(["mkfs.ext4", "-q", "-F", "-L", "rootfs", device])
+            bundle.mkdir(staging)
+            bundle.run(["mount", device, staging])
+            bundle.run(["chown", "nobody:nogroup", staging])
+            bundle.execute(vm_name)
+            get_lxd().exec_stream(vm_name, extract("-", staging), tarball,
+                                  f"Extract {os.path.basename(tarball)} into {volume}", check=True)
+            finish = VmBundle(f"rootfs-cache {volume}")
+            finish.run(["umount", staging]).run(["rmdir", staging])
+            finish.execute(vm_name)
+        except Exception:
+            get_lxd().exec(vm_name, ["umount", staging])
+            get_lxd().run(["lxc", "config", "device", "remove", vm_name, device_name])
+            self._delete_volume(volume)
+            raise
+        self._lxc(["lxc", "config", "device", "remove", vm_name, device_name], f"Detach volume {volume}")
+        self._lxc(["lxc", "storage", "volume", "snapshot", self.pool, volume, BASE_SNAPSHOT],
+                  f"Snapshot rootfs cache volume {volume}")
+
+    def ensure(self, vm_name: str, tarball: str, extract: ExtractCommand) -> str:
+        """
+        Returns the cache volume holding the extracted tarball, building it
+        (in vm_name) on the first request.
+        """
+        digest = self.checksum(tarball)
+        volume = f"{self.prefix}-{digest[:16]}"
+        with self.lock:
+            build_lock = self.build_locks.setdefault(volume, threading.Lock())
+        with build_lock:
+            if self.volume_exists(f"{volume}/{BASE_SNAPSHOT}"):
+                logging.info("Rootfs cache hit for %s (%s)", os.path.basename(tarball), volume)
+                return volume
+            logging.info("Rootfs cache miss for %s, building %s", os.path.basename(tarball), volume)
+            self._build(volume, digest, vm_name, tarball, extract)
+        return volume
+
+    def attach(self, vm_name: str, nfs_root: str, tarball: str, extract: ExtractCommand) -> None:
+        """
+        Gives vm_name its own copy of the cached rootfs of tarball, mounted
+        at <nfs_root>/rootfs (and in fstab, so it survives reboots).
+        """
+        volume = self.ensure(vm_name, tarball, extract)
+        name = os.path.basename(nfs_root.rstrip("/")).replace("_", "-")
+        vm_volume = f"{vm_name}--{name}"
+        if not self.volume_exists(vm_volume):
+            self._lxc(["lxc", "storage", "volume", "copy", f"{self.pool}/{volume}/{BASE_SNAPSHOT}",
+                       f"{self.pool}/{vm_volume}"], f"Copy rootfs cache volume {volume}")
+        device = self._attach(vm_name, f"rootfs-{name}", vm_volume)
+        mount_point = f"{nfs_root}/rootfs"
+        bundle = VmBundle(f"rootfs-mount {vm_volume}")
+        bundle.mkdir(mount_point)
+        bundle.run(f"grep -q ' {mount_point} ' /etc/fstab || "
+                   f"echo '{device} {mount_point} ext4 defaults,nofail 0 2' >> /etc/fstab", "Add rootfs to fstab")
+        bundle.run(f"mountpoint -q {mount_point} || mount {mount_point}", "Mount rootfs")
+        bundle.execute(vm_name)
+
+    def release(self, vm_name: str) -> None:
+        """
+        Deletes the rootfs copies of a VM; call once the VM is deleted.
+        """
+        result = get_lxd().run(["lxc", "storage", "volume", "list", self.pool, "--format", "json"])
+        if result.returncode != 0:
+            logging.error("Cannot list volumes of pool %s: %s", self.pool, result.stderr)
+            return
+        for volume in json.loads(result.stdout):
+            if volume.get("type") == "custom" and volume["name"].startswith(f"{vm_name}--"):
+                logging.info("Deleting rootfs volume %s", volume["name"])
+                self._delete_volume(volume["name"])
+
+
+ROOTFS_CACHE = RootfsCache()
@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+
+from config import (
+    SHARED_ROOTFS_DIR,
+    SHARED_ROOTFS_INSTANCE,
+    SHARED_ROOTFS_ROOT_SIZE,
+    SHARED_ROOTFS_UBUNTU_VERSION,
+    VM_AGENT_TIMEOUT,
+)
+from scripts.apt_cache import APT_CACHE
+from scripts.config_templates import render_export_line
+from scripts.lxd_backend import get_lxd, instance_address
+from scripts.readiness import wait_for
+from scripts.rootfs_cache import ROOTFS_CACHE
+from scripts.rootfs_extract import PARALLEL_PACKAGES, ExtractCommand
+from scripts.vm_bundle import VmBundle
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Written in a rootfs directory of the shared server once its extraction completed
+COMPLETE_MARKER = ".complete"
+
+# Read-only export of a shared rootfs
+SHARED_EXPORT_OPTIONS = "ro,no_root_squash,no_subtree_check,insecure"
+
+# User files are pushed here (a writable local dir bind-mounted over the read-only tree)
+USER_HOME = "home/mmtc"
+
+
+class SharedRootfsServer:
+    """
+    Host-wide NFS server holding one read-only copy of each node rootfs.
+
+    A dedicated LXD VM extracts every rootfs tarball once and exports it
+    read-only. A user VM mounts the export at <nfs_root>/rootfs and
+    re-exports it to its nodes, so the multi-GB tree is stored and cached
+    once for all users. Only the per-device writable directories and the
+    user files (a local directory bind-mounted over home/mmtc) stay in
+    the user VM.
+    """
+
+    def __init__(self, instance: str = SHARED_ROOTFS_INSTANCE, root_dir: str = SHARED_ROOTFS_DIR):
+        self.instance = instance
+        self.root_dir = root_dir
+        self.lock = threading.Lock()
+        self.build_locks: dict[str, threading.Lock] = {}
+
+    # --------------------------------------------------------------------------
+    # Server instance
+    # --------------------------------------------------------------------------
+    def ensure_instance(self) -> None:
+        """
+        Launches and provisions the NFS server VM on first use, starts it if stopped.
+        """
+        with self.lock:
+            info = get_lxd().info(self.instance)
+            if info is not None:
+                if info["status"] != "Running":
+                    get_lxd().start(self.instance)
+                return
+            logging.info("Launching shared rootfs server %s", self.instance)
+            get_lxd().run(["lxc", "launch", f"ubuntu:{SHARED_ROOTFS_UBUNTU_VERSION}", self.instance, "--vm",
+                           "--device", f"root,size={SHARED_ROOTFS_ROOT_SIZE}",
+                           "-c", "limits.cpu=4", "-c", "limits.memory=8GiB"] + APT_CACHE.launch_options(), check=True)
+            wait_for(lambda: get_lxd().exec(self.instance, ["true"]).returncode == 0,
+                     f"LXD agent in {self.instance}", VM_AGENT_TIMEOUT)
+            bundle = VmBundle(f"shared-rootfs {self.instance}")
+            bundle.run(["apt-get", "update"])
+            bundle.run(["env", "DEBIAN_FRONTEND=noninteractive", "apt-get", "-o", "DPkg::Lock::Timeout=600",
+                        "install", "-y", "nfs-kernel-server"] + PARALLEL_PACKAGES)
+            bundle.mkdir(self.root_dir)
+            bundle.run(["systemctl", "enable", "--now", "nfs-kernel-server"])
+            bundle.execute(self.instance)
+
+    def address(self) -> str:
+        """
+        Returns the IPv4 address of the server on the LXD bridge.
+        """
+        address = instance_address(self.instance)
+        if address is None:
+            raise RuntimeError(f"Shared rootfs server {self.instance} has no IPv4 address")
+        return address
+
+    # --------------------------------------------------------------------------
+    # Root filesystems
+    # --------------------------------------------------------------------------
+    def _is_complete(self, path: str) -> bool:
+        return get_lxd().exec(self.instance, ["test", "-f", f"{path}/{COMPLETE_MARKER}"]).returncode == 0
+
+    def ensure_rootfs(self, tarball: str, extract: ExtractCommand) -> str:
+        """
+        Returns the export path of the extracted tarball on the server,
+        extracting and exporting it on the first request.
+        """
+        self.ensure_instance()
+        digest = ROOTFS_CACHE.checksum(tarball)
+        path = f"{self.root_dir}/{digest[:16]}"
+        with self.lock:
+            build_lock = self.build_locks.setdefault(path, threading.Lock())
+        with build_lock:
+            if self._is_complete(path):
+                return path
+            logging.info("Extracting %s on shared rootfs server %s", os.path.basename(tarball), self.instance)
+            partial = f"{path}.partial"
+            prepare = VmBundle(f"shared-rootfs {path}")
+            prepare.run(["rm", "-rf", partial, path]).mkdir(partial)
+            prepare.execute(self.instance)
+            get_lxd().exec_stream(self.instance, extract("-", partial), tarball,
+                                  f"Extract {os.path.basename(tarball)} on {self.instance}", check=True)
+            export_line = render_export_line(path, SHARED_EXPORT_OPTIONS)
+            finish = VmBundle(f"shared-rootfs {path}")
+            finish.run(["touch", f"{partial}/{COMPLETE_MARKER}"])
+            finish.run(["mv", partial, path])
+            finish.run(f"grep -qF '{export_line}' /etc/exports || echo '{export_line}' >> /etc/exports",
+                       "Export rootfs")
+            finish.run(["exportfs", "-ra"])
+            finish.execute(self.instance)
+        return path
+
+    def attach(self, vm_name: str, nfs_root: str, tarball: str, extract: ExtractCommand) -> None:
+        """
+        Mounts the shared rootfs of tarball read-only at <nfs_root>/rootfs
+        of vm_name, with a writable home/mmtc on top (both in fstab).
+        """
+        export = self.ensure_rootfs(tarball, extract)
+        address = self.address()
+        mount_point = f"{nfs_root}/rootfs"
+        home = f"{nfs_root}/{USER_HOME.replace('/', '-')}"
+        bundle = VmBundle(f"shared-rootfs-mount {vm_name}")
+        bundle.mkdir(mount_point).mkdir(home)
+        bundle.run(["chown", "1000:1000", home])
+        bundle.run(f"grep -q ' {mount_point} ' /etc/fstab || "
+                   f"echo '{address}:{export} {mount_point} nfs ro,hard,_netdev 0 0' >> /etc/fstab",
+                   "Add shared rootfs to fstab")
+        bundle.run(f"grep -q ' {mount_point}/{USER_HOME} ' /etc/fstab || "
+                   f"echo '{home} {mount_point}/{USER_HOME} none bind,nofail,"
+                   f"x-systemd.requires-mounts-for={mount_point} 0 0' >> /etc/fstab", "Add user home to fstab")
+        bundle.run(f"mountpoint -q {mount_point} || mount {mount_point}", "Mount shared rootfs")
+        bundle.run(f"mountpoint -q {mount_point}/{USER_HOME} || mount {mount_point}/{USER_HOME}", "Mount user home")
+        bundle.execute(vm_name)
+
+
+SHARED_ROOTFS = SharedRootfsServer()
@@ -0,0 +1,103 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable
+
+from config import STEP_MAX_WORKERS
+from scripts.job_manager import set_job_step
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+
+class StepFailed(Exception):
+    """
+    Raised by StepGraph.run when a step fails; the original error is chained.
+    """
+
+    def __init__(self, step: str, error: Exception):
+        super().__init__(f"Step '{step}' failed: {error}")
+        self.step = step
+        self.error = error
+
+
+class StepGraph:
+    """
+    Provisioning steps with declared dependencies, run by a concurrent
+    scheduler: a step starts as soon as all its dependencies have finished.
+
+    The first failure stops the graph (no new steps are started) and is
+    raised as StepFailed. Per-step durations are kept in self.durations.
+    """
+
+    def __init__(self, name: str, max_workers: int = STEP_MAX_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self.steps: dict[str, tuple[Callable, tuple, dict]] = {}
+        self.deps: dict[str, set[str]] = {}
+        self.durations: dict[str, float] = {}
+
+    def add(self, name: str, func: Callable, *args, deps: Iterable[str] = (), **kwargs) -> "StepGraph":
+        if name in self.steps:
+            raise ValueError(f"Step '{name}' is already defined")
+        self.steps[name] = (func, args, kwargs)
+        self.deps[name] = set(deps)
+        return self
+
+    def _validate(self) -> None:
+        for name, deps in self.deps.items():
+            missing = deps - self.steps.keys()
+            if missing:
+                raise ValueError(f"Step '{name}' depends on unknown steps {sorted(missing)}")
+        # Kahn's algorithm: every step must become ready at some point
+        remaining = {name: set(deps) for name, deps in self.deps.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle between steps {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _timed(self, name: str) -> float:
+        func, args, kwargs = self.steps[name]
+        start = time.time()
+        func(*args, **kwargs)
+        return time.time() - start
+
+    def run(self) -> dict[str, float]:
+        """
+        Executes the graph and returns the duration of each step in seconds.
+        """
+        self._validate()
+        done: set[str] = set()
+        pending = set(self.steps)
+        running = {}
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as executor:
+            while pending or running:
+                for name in sorted(pending):
+                    if self.deps[name] <= done:
+                        pending.discard(name)
+                        running[executor.submit(self._timed, name)] = name
+                        logging.info("[%s] step '%s' started", self.name, name)
+                set_job_step(", ".join(sorted(running.values())))
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.durations[name] = round(future.result(), 2)
+                    except Exception as e:
+                        logging.error("[%s] step '%s' failed: %s", self.name, name, e)
+                        # Fail fast: start nothing else, let running steps drain.
+                        pending.clear()
+                        wait(running)
+                        raise StepFailed(name, e) from e
+                    done.add(name)
+                    logging.info("[%s] step '%s' finished in %ss", self.name, name, self.durations[name])
+
+        logging.info("[%s] all %d steps finished in %.2fs", self.name, len(done), time.time() - start)
+        return dict(self.durations)
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from config import ACTIVE_USERS_DB_PATH, ACTIVE_USERS_PATH
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ("user_name", "user_network_id", "user_subnet", "nfs_ip_addr", "macvlan_interface")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS active_users (
+    user_name         TEXT    PRIMARY KEY,
+    user_network_id   INTEGER NOT NULL UNIQUE,
+    user_subnet       TEXT    NOT NULL,
+    nfs_ip_addr       TEXT    NOT NULL,
+    macvlan_interface TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_vms (
+    user_name TEXT PRIMARY KEY,
+    vm_name   TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS user_nodes (
+    user_name TEXT NOT NULL,
+    node      TEXT NOT NULL,
+    PRIMARY KEY (user_name, node)
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class UserStore:
+    """
+    SQLite (WAL mode) store for active users.
+
+    user_name and user_network_id are unique, lookups use the table indexes
+    and every write runs in its own transaction, so concurrent /create_user
+    requests cannot both pass the duplicate check or lose a write.
+
+    The VM of each user environment is kept in user_vms and the nodes set
+    up in it in user_nodes, so node changes only touch the difference.
+    """
+
+    def __init__(self, db_path: str = ACTIVE_USERS_DB_PATH, json_path: str = ACTIVE_USERS_PATH):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.local = threading.local()
+        self._connection().executescript(SCHEMA)
+        self.migrate_from_json()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Yields a connection inside a BEGIN IMMEDIATE transaction (write lock
+        taken up front), committed on success and rolled back on error.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def migrate_from_json(self) -> int:
+        """
+        One-shot import of the legacy active_users.json. Runs only once per
+        database; returns the number of users imported.
+        """
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            users = []
+            if os.path.exists(self.json_path):
+                try:
+                    with open(self.json_path, "r") as file:
+                        users = json.load(file)
+                except json.JSONDecodeError as e:
+                    logging.error("Cannot migrate %s: %s", self.json_path, e)
+            imported = 0
+            for user in users:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO active_users VALUES (?, ?, ?, ?, ?)",
+                    tuple(user[field] for field in USER_FIELDS),
+                )
+                imported += cursor.rowcount
+            conn.execute("INSERT INTO store_meta VALUES ('json_migrated', ?)", (self.json_path,))
+        if imported:
+            logging.info("Migrated %d active users from %s", imported, self.json_path)
+        return imported
+
+    def add(self, user: dict) -> None:
+        """
+        Inserts a user atomically.
+
+        Raises:
+            sqlite3.IntegrityError: If the user name or network ID is taken.
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO active_users VALUES (?, ?, ?, ?, ?)",
+                tuple(user[field] for field in USER_FIELDS),
+            )
+
+    def get(self, user_name: str, user_network_id: Optional[int] = None) -> Optional[dict]:
+        query = "SELECT * FROM active_users WHERE user_name = ?"
+        params = [user_name]
+        if user_network_id is not None:
+            query += " AND user_network_id = ?"
+            params.append(user_network_id)
+        row = self._connection().execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    def get_by_network_id(self, user_network_id: int) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT * FROM active_users WHERE user_network_id = ?", (user_network_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def all(self) -> list[dict]:
+        rows = self._connection().execute("SELECT * FROM active_users ORDER BY user_network_id")
+        return [dict(row) for row in rows]
+
+    def network_ids(self) -> list[int]:
+        rows = self._connection().execute("SELECT user_network_id FROM active_users")
+        return [row[0] for row in rows]
+
+    def set_vm(self, user_name: str, vm_name: str) -> None:
+        """
+        Records vm_name as the environment VM of a user (replacing any other).
+        """
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM user_vms WHERE user_name = ? OR vm_name = ?", (user_name, vm_name))
+            conn.execute("INSERT INTO user_vms VALUES (?, ?)", (user_name, vm_name))
+
+    def vm(self, user_name: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT vm_name FROM user_vms WHERE user_name = ?", (user_name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def user_of_vm(self, vm_name: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT user_name FROM user_vms WHERE vm_name = ?", (vm_name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def remove_env(self, user_name: str) -> None:
+        """
+        Forgets the environment VM of a user and its nodes.
+        """
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM user_nodes WHERE user_name = ?", (user_name,))
+            conn.execute("DELETE FROM user_vms WHERE user_name = ?", (user_name,))
+
+    def nodes(self, user_name: str) -> list[str]:
+        """
+        Returns the nodes set up in the environment of a user.
+        """
+        rows = self._connection().execute(
+            "SELECT node FROM user_nodes WHERE user_name = ? ORDER BY node", (user_name,)
+        )
+        return [row[0] for row in rows]
+
+    def add_nodes(self, user_name: str, nodes: list[str]) -> None:
+        with self.transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO user_nodes VALUES (?, ?)",
+                             [(user_name, node) for node in nodes])
+
+    def remove_nodes(self, user_name: str, nodes: Optional[list[str]] = None) -> None:
+        """
+        Forgets the given nodes of a user, or all of them when nodes is None.
+        """
+        with self.transaction() as conn:
+            if nodes is None:
+                conn.execute("DELETE FROM user_nodes WHERE user_name = ?", (user_name,))
+            else:
+                conn.executemany("DELETE FROM user_nodes WHERE user_name = ? AND node = ?",
+                                 [(user_name, node) for node in nodes])
+
+    def delete(self, user_name: str) -> bool:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM user_nodes WHERE user_name = ?", (user_name,))
+            conn.execute("DELETE FROM user_vms WHERE user_name = ?", (user_name,))
+            return conn.execute("DELETE FROM active_users WHERE user_name = ?", (user_name,)).rowcount > 0
+
+    def clear(self) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM user_nodes")
+            conn.execute("DELETE FROM user_vms")
+            conn.execute("DELETE FROM active_users")
@@ -0,0 +1,154 @@
+import base64
+import io
+import logging
+import os
+import shlex
+import subprocess
+import tarfile
+import time
+import uuid
+from typing import Optional, Union
+
+from scripts.lxd_backend import get_lxd
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# Prefix of the per-command status lines the generated script prints
+STATUS_MARKER = "@@bundle"
+
+SCRIPT_HEADER = """#!/bin/bash
+B="$(cd "$(dirname "$0")" && pwd)"
+trap 'rm -rf "$B"' EXIT
+step() {
+    local index=$1; shift
+    local start=$(date +%s%N)
+    "$@" >"$B/out" 2>&1
+    local rc=$?
+    local ms=$(( ($(date +%s%N) - start) / 1000000 ))
+    echo "@@bundle $index $rc $ms $(tail -c 2000 "$B/out" | base64 -w0)"
+    return $rc
+}
+"""
+
+
+class VmBundle:
+    """
+    Collects the files and commands of one provisioning stage and runs them
+    in the VM with a single exec.
+
+    Files and a generated bash script are packed into one tar stream that is
+    fed to the exec on stdin. The script installs the files, runs the
+    commands in order and prints one status line per command, so a stage
+    costs one round trip instead of one per mkdir/chown/systemctl.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.files: list[tuple[bytes, int]] = []
+        self.steps: list[tuple[str, str, bool]] = []
+
+    def run(self, command: Union[list[str], str], description: Optional[str] = None,
+            check: bool = True) -> "VmBundle":
+        """
+        Adds a command: an argv list, or a string run with bash -c.
+        With check, a failure stops the bundle.
+        """
+        if isinstance(command, str):
+            shell = "bash -c " + shlex.quote(command)
+            description = description or command
+        else:
+            shell = shlex.join(command)
+            description = description or " ".join(command)
+        self.steps.append((description, shell, check))
+        return self
+
+    def mkdir(self, path: str, owner: Optional[str] = None, mode: Optional[str] = None) -> "VmBundle":
+        self.run(["mkdir", "-p", path])
+        if owner:
+            self.run(["chown", "-R", owner, path])
+        if mode:
+            self.run(["chmod", "-R", mode, path])
+        return self
+
+    def add_bytes(self, data: Union[bytes, str], target: str, mode: int = 0o644) -> "VmBundle":
+        """
+        Installs data at target (parent directories are created).
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        staged = f'"$B/files/{len(self.files)}"'
+        self.files.append((data, mode))
+        self.steps.append((f"Install {target}", f"install -D -m {mode:o} {staged} {shlex.quote(target)}", True))
+        return self
+
+    def add_file(self, source: str, target: str) -> "VmBundle":
+        """
+        Installs a host file at target, keeping its permission bits.
+        """
+        with open(source, "rb") as file:
+            data = file.read()
+        return self.add_bytes(data, target, os.stat(source).st_mode & 0o7777)
+
+    def script(self) -> str:
+        lines = [SCRIPT_HEADER]
+        for index, (_, shell, check) in enumerate(self.steps):
+            lines.append(f"step {index} {shell}" + (" || exit $?" if check else ""))
+        lines.append("exit 0")
+        return "\n".join(lines) + "\n"
+
+    def archive(self) -> bytes:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            members = [(f"files/{i}", data, mode) for i, (data, mode) in enumerate(self.files)]
+            members.append(("run.sh", self.script().encode(), 0o755))
+            for name, data, mode in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = mode
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def _parse(self, stdout: str) -> list[dict]:
+        results = [{"step": description, "status": "skipped"} for description, _, _ in self.steps]
+        for line in stdout.splitlines():
+            if not line.startswith(STATUS_MARKER + " "):
+                continue
+            fields = line.split(" ", 4)
+            index, returncode, ms = int(fields[1]), int(fields[2]), int(fields[3])
+            output = base64.b64decode(fields[4]).decode(errors="replace") if len(fields) > 4 else ""
+            results[index].update(status="ok" if returncode == 0 else "failed",
+                                  returncode=returncode, seconds=ms / 1000, output=output)
+        return results
+
+    def execute(self, vm_name: str) -> list[dict]:
+        """
+        Ships the bundle to the VM and runs it.
+
+        Returns:
+            One dict per command: step, status ("ok", "failed", "skipped"),
+            returncode, seconds and the tail of its output.
+
+        Raises:
+            subprocess.CalledProcessError: If a checked command failed.
+        """
+        directory = f"/tmp/bundle-{uuid.uuid4().hex[:12]}"
+        command = ["bash", "-c", f"mkdir -p {directory} && tar -xf - -C {directory} && exec {directory}/run.sh"]
+        start = time.time()
+        result = get_lxd().exec(vm_name, command, stdin=self.archive())
+        results = self._parse(result.stdout)
+        for entry in results:
+            if entry["status"] == "failed":
+                logging.error("[%s] %s failed (%s): %s", self.name, entry["step"], entry["returncode"], entry["output"])
+            else:
+                logging.debug("[%s] %s: %s", self.name, entry["step"], entry["status"])
+        logging.info("[%s] %d commands in VM %s, one exec, %.2fs",
+                     self.name, len(self.steps), vm_name, time.time() - start)
+        if result.returncode != 0:
+            # The last failure is the checked command that stopped the bundle
+            failed = next((entry for entry in reversed(results) if entry["status"] == "failed"), None)
+            step = failed["step"] if failed else "bundle setup"
+            raise subprocess.CalledProcessError(result.returncode, f"{self.name}: {step}",
+                                                result.stdout, result.stderr)
+        return results
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Optional
+
+from config import (
+    VM_POOL_MAX_LOAD,
+    VM_POOL_MIN_FREE_MEM_MB,
+    VM_POOL_PREFIX,
+    VM_POOL_REFILL_INTERVAL,
+    VM_POOL_ROOT_SIZE,
+    VM_POOL_SIZE,
+    VM_POOL_UBUNTU_VERSION,
+)
+from scripts.create_env_vm import VmManager
+from scripts.lxd_backend import get_lxd
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+# LXD config key holding the pool state of a VM ("building" or "ready")
+POOL_STATE_KEY = "user.pool"
+
+
+def host_free_memory_mb() -> int:
+    with open("/proc/meminfo", "r") as file:
+        for line in file:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+class VmPool:
+    """
+    Warm pool of pre-booted, pre-provisioned user VMs.
+
+    Pool VMs run with the generic setup only (packages, TFTP and NBD
+    servers, default NIC only). claim() hands one out under the user's VM name so that
+    create_user_env_vm only applies the per-user parts; a background thread
+    refills the pool while the host has CPU and memory to spare.
+    """
+
+    def __init__(self, size: int = VM_POOL_SIZE, prefix: str = VM_POOL_PREFIX,
+                 ubuntu_version: str = VM_POOL_UBUNTU_VERSION, root_size: str = VM_POOL_ROOT_SIZE,
+                 vm_manager: VmManager = None):
+        self.size = size
+        self.prefix = prefix
+        self.ubuntu_version = ubuntu_version
+        self.root_size = root_size
+        self.vm_manager = vm_manager or VmManager()
+        self.lock = threading.Lock()
+        self.ready = deque()
+        self.building = 0
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "built": 0,
+            "build_failures": 0,
+            "refills_deferred": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    # --------------------------------------------------------------------------
+    # Refilling
+    # --------------------------------------------------------------------------
+    def _set_state(self, vm_name: str, state: str) -> None:
+        self.vm_manager.run_command(["lxc", "config", "set", vm_name, f"{POOL_STATE_KEY}={state}"],
+                                    f"Mark {vm_name} as {state}")
+
+    def _delete(self, vm_name: str) -> None:
+        get_lxd().run(["lxc", "delete", vm_name, "--force"])
+
+    def _adopt(self) -> None:
+        """
+        Takes back the ready VMs left by a previous run and deletes the
+        half-built ones.
+        """
+        result = get_lxd().run(["lxc", "list", f"{self.prefix}-", "--format", "json"])
+        if result.returncode != 0:
+            logging.error("Cannot list pool VMs: %s", result.stderr)
+            return
+        for instance in json.loads(result.stdout):
+            name = instance["name"]
+            if not name.startswith(f"{self.prefix}-"):
+                continue
+            if instance.get("config", {}).get(POOL_STATE_KEY) == "ready" and instance["status"] == "Running":
+                self.ready.append(name)
+            else:
+                logging.info("Deleting unfinished pool VM %s", name)
+                self._delete(name)
+        logging.info("Adopted %d ready pool VMs", len(self.ready))
+
+    def host_has_capacity(self) -> bool:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        free_mb = host_free_memory_mb()
+        if load > VM_POOL_MAX_LOAD or free_mb < VM_POOL_MIN_FREE_MEM_MB:
+            logging.info("Pool refill deferred: load %.2f per CPU, %d MiB free", load, free_mb)
+            return False
+        return True
+
+    def _build_one(self) -> None:
+        vm = self.vm_manager
+        name = f"{self.prefix}-{uuid.uuid4().hex[:8]}"
+        logging.info("Building pool VM %s", name)
+        try:
+            vm.create_user_vm(self.ubuntu_version, name, self.root_size)
+            self._set_state(name, "building")
+            vm.wait_for_agent(name)
+            if not vm.is_golden(name):
+                vm.update_apt(name)
+                vm.install_base_packages(name)
+                vm.setup_tftp_server(name)
+                vm.setup_nbd_server(name)
+                vm.apt_install(name, ["isc-dhcp-server"])
+            self._set_state(name, "ready")
+        except Exception as e:
+            logging.error("Failed to build pool VM %s: %s", name, e)
+            self._delete(name)
+            with self.lock:
+                self.stats["build_failures"] += 1
+            return
+        with self.lock:
+            self.ready.append(name)
+            self.stats["built"] += 1
+        logging.info("Pool VM %s ready (%d/%d)", name, len(self.ready), self.size)
+
+    def _refill(self) -> None:
+        while self.running:
+            with self.lock:
+                if len(self.ready) + self.building >= self.size:
+                    return
+            if not self.host_has_capacity():
+                with self.lock:
+                    self.stats["refills_deferred"] += 1
+                return
+            with self.lock:
+                self.building += 1
+            try:
+                self._build_one()
+            finally:
+                with self.lock:
+                    self.building -= 1
+
+    def _refill_loop(self) -> None:
+        while self.running:
+            try:
+                self._refill()
+            except Exception as e:
+                logging.error("Pool refill failed: %s", e)
+            self.wakeup.wait(VM_POOL_REFILL_INTERVAL)
+            self.wakeup.clear()
+
+    def start(self) -> None:
+        """
+        Adopts existing pool VMs and starts the refiller (no-op if disabled).
+        """
+        if not self.enabled or self.running:
+            return
+        self._adopt()
+        self.running = True
+        self.thread = threading.Thread(target=self._refill_loop, name="vm-pool-refill", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+
+    # --------------------------------------------------------------------------
+    # Claiming
+    # --------------------------------------------------------------------------
+    def claim(self, ubuntu_version: str, vm_name: str, root_size: str) -> Optional[dict]:
+        """
+        Hands a ready pool VM out as vm_name.
+
+        LXD only renames stopped instances, so the VM is stopped, renamed and
+        started again; that reboot is still far cheaper than a first boot and
+        the generic provisioning.
+
+        Returns:
+            The create_user_vm style result, or None on a pool miss (the
+            caller then launches a VM itself).
+        """
+        if not self.enabled:
+            return None
+        name = None
+        with self.lock:
+            if ubuntu_version == self.ubuntu_version and root_size == self.root_size and self.ready:
+                name = self.ready.popleft()
+            if name is None:
+                self.stats["misses"] += 1
+        self.wakeup.set()
+        if name is None:
+            return None
+
+        vm = self.vm_manager
+        try:
+            vm.run_command(["lxc", "stop", name], f"Stop pool VM {name}")
+            vm.run_command(["lxc", "rename", name, vm_name], f"Rename pool VM {name} to {vm_name}")
+            vm.run_command(["lxc", "config", "unset", vm_name, POOL_STATE_KEY], f"Release {vm_name} from the pool")
+            vm.run_command(["lxc", "start", vm_name], f"Start VM {vm_name}")
+            # The rename does not reach the guest: give it the hostname a launched VM would have
+            vm.wait_for_agent(vm_name)
+            vm.run_command(["lxc", "exec", vm_name, "--", "hostnamectl", "set-hostname", vm_name],
+                           f"Set hostname of {vm_name}")
+            vm.run_command(["lxc", "exec", vm_name, "--", "sed", "-i", rf"s/\b{name}\b/{vm_name}/g", "/etc/hosts"],
+                           f"Rename {name} in /etc/hosts of {vm_name}")
+        except Exception as e:
+            logging.error("Failed to claim pool VM %s as %s: %s", name, vm_name, e)
+            # vm_name did not exist before the claim, so whichever name is left can go
+            self._delete(name)
+            self._delete(vm_name)
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+        logging.info("Claimed pool VM %s as %s", name, vm_name)
+        return {"created": True, "pooled": True, "pool_vm": name}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = self.size
+            stats["ready"] = len(self.ready)
+            stats["building"] = self.building
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / requests, 3) if requests else 0.0
+        return stats
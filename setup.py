@@ -9,7 +9,6 @@ setup(
     packages=find_packages(),  # This will find packages in directories with __init__.py files.
     install_requires=[
         "fastapi",
-        "pandas",
         "pylxd",
         "redis",
         "uvicorn" ,
@@ -8,9 +8,11 @@ The modules are re-exported here for convenience.
 
 from .poe_manager import *
 from  .switch_manager  import *
+from .switch_session import *
 
 __all__ = [
     # List the modules that you want to expose for external use.
     "poe_manager",
-    "switch_manager"
+    "switch_manager",
+    "switch_session"
 ]
\ No newline at end of file
@@ -1,5 +1,7 @@
-from config import RESOURCE_JSON_PATH
+from config import POE_POWER_BUDGET, POE_PORT_WATTS, POE_STAGGER_DELAY
 from switch.switch_manager import SwitchManager
+from scripts.resource_inventory import INVENTORY
+import logging
 import time
 import os
 import sys
@@ -21,45 +23,43 @@ class PoeManager:
 
     def get_switch_interfaces(self):
 
-        interfaces = []
-        # Get the absolute path of the parent directory
-
-        # Now include the directory path in the file path
-        file_path = RESOURCE_JSON_PATH
-
-        # Open and read the JSON file
-        with open(file_path, 'r') as file:
-            resources = json.load(file)
-
-            for resource in resources:
-                print(resource)
-                interfaces.append(resource['switch_interface'])
-
-
-        return interfaces
+        return INVENTORY.switch_interfaces()
+
+    def set_power(self, interfaces, state):
+        """
+        Sets PoE "on" or "off" on many interfaces in bulk.
+
+        Powering off is done in one configuration session. Powering on is
+        staggered in batches that fit in POE_POWER_BUDGET (assuming each device
+        draws up to POE_PORT_WATTS while booting), with POE_STAGGER_DELAY
+        seconds between batches instead of a fixed sleep per port.
+        """
+        if state not in ("on", "off"):
+            raise ValueError(f"Invalid PoE state '{state}', expected 'on' or 'off'")
+        interfaces = list(dict.fromkeys(interfaces))
+        if not interfaces:
+            return
+
+        if state == "off":
+            self.switch.poe_bulk(interfaces, "off")
+            logging.info("PoE off on %d interfaces", len(interfaces))
+            return
+
+        batch_size = max(1, POE_POWER_BUDGET // max(1, POE_PORT_WATTS))
+        for i in range(0, len(interfaces), batch_size):
+            if i:
+                time.sleep(POE_STAGGER_DELAY)
+            batch = interfaces[i:i + batch_size]
+            self.switch.poe_bulk(batch, "on")
+            logging.info("PoE on for batch %s", batch)
 
     def turn_all_off(self):
 
-        interfaces = self.get_switch_interfaces()
-
-        for interface in interfaces:
-            print(interface)
-            self.switch.poe_off(interface)
-            time.sleep(7)
-            
-                
-              
-
-
+        self.set_power(self.get_switch_interfaces(), "off")
 
     def turn_all_on(self):
 
-        interfaces = self.get_switch_interfaces()
-
-        for interface in interfaces:
-            print(interface)
-            self.switch.poe_on(interface)
-            time.sleep(7)
+        self.set_power(self.get_switch_interfaces(), "on")
 
 
 
@@ -1,6 +1,39 @@
 from netmiko import Netmiko
+import re
 import time
 
+# Cisco IOS accepts at most five ranges in one "interface range" command
+MAX_RANGES_PER_COMMAND = 5
+
+
+def interface_ranges(interfaces, max_ranges=MAX_RANGES_PER_COMMAND):
+    """
+    Groups interface names into "interface range" arguments, e.g.
+    ["GigabitEthernet1/0/1", "GigabitEthernet1/0/2", "GigabitEthernet1/0/4"]
+    -> ["GigabitEthernet1/0/1 - 2 , GigabitEthernet1/0/4"].
+    """
+    ports = {}
+    for interface in interfaces:
+        match = re.match(r"^(.*?)(\d+)$", interface.replace(" ", ""))
+        if not match:
+            raise ValueError(f"Unsupported interface name '{interface}'")
+        ports.setdefault(match.group(1), set()).add(int(match.group(2)))
+
+    ranges = []
+    for prefix, numbers in ports.items():
+        numbers = sorted(numbers)
+        start = prev = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number is not None and number == prev + 1:
+                prev = number
+                continue
+            ranges.append(f"{prefix}{start}" if start == prev else f"{prefix}{start} - {prev}")
+            if number is not None:
+                start = prev = number
+
+    return [" , ".join(ranges[i:i + max_ranges]) for i in range(0, len(ranges), max_ranges)]
+
+
 class SwitchManager():
 
     def __init__(self, device_type, ip, port, password ,username=None, enable_password=None):
@@ -20,6 +53,15 @@ class SwitchManager():
     def check_enable_mode(self):
         return self.netCon.check_enable_mode()
 
+    def is_alive(self):
+        return self.netCon.is_alive()
+
+    def clear_buffer(self):
+        return self.netCon.clear_buffer()
+
+    def disconnect(self):
+        self.netCon.disconnect()
+
 
     def sendCommand(self, cmd):
         self.netCon.write_channel(cmd+'\n')
@@ -76,6 +118,39 @@ class SwitchManager():
         self.sendCommand(power_on)
         self.sendCommand("end")
 
+    def get_access_vlan(self, interface):
+        """
+        Returns the access VLAN configured on interface, or None.
+        """
+        out = self.netCon.send_command(f"show interfaces {interface} switchport")
+        match = re.search(r"Access Mode VLAN:\s*(\d+)", out)
+        return int(match.group(1)) if match else None
+
+    def supports_interface_range(self):
+        return self.esw['device_type'].startswith("cisco")
+
+    def poe_bulk(self, interfaces, state):
+        """
+        Sets PoE "on" or "off" on many interfaces in a single configuration
+        session, using "interface range" groups when the platform supports it.
+        """
+        if not interfaces:
+            return
+        if not self.check_enable_mode():
+            self.enable_device()
+
+        power = "power inline auto" if state == "on" else "power inline never"
+        if self.supports_interface_range():
+            targets = ["interface range " + group for group in interface_ranges(interfaces)]
+        else:
+            targets = ["interface " + interface for interface in interfaces]
+
+        self.sendCommand("configure terminal")
+        for target in targets:
+            self.sendCommand(target)
+            self.sendCommand(power)
+        self.sendCommand("end")
+
     def mode_access(self ,interface):
         if not self.check_enable_mode():
                 self.enable_device()
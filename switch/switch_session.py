@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from config import SWITCH_KEEPALIVE_INTERVAL
+from switch.switch_manager import SwitchManager
+
+# Setup module-level logger
+logger = logging.getLogger(__name__)
+
+
+class SwitchSessionManager:
+    """
+    Keeps one authenticated SwitchManager (Netmiko connection) per switch.
+
+    Commands are serialized through a per-switch lock, dead connections are
+    re-established transparently and a background thread sends keepalives
+    so the telnet session is not dropped by the switch between requests.
+    """
+
+    def __init__(self, keepalive_interval: int = SWITCH_KEEPALIVE_INTERVAL):
+        self.keepalive_interval = keepalive_interval
+        self.sessions = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.keepalive_thread = None
+        self.stats = {
+            "connects": 0,
+            "reconnects": 0,
+            "reuses": 0,
+            "connect_time_total": 0.0,
+        }
+
+    @staticmethod
+    def _key(config: dict) -> tuple:
+        return (config.get("ip"), config.get("port"))
+
+    def _get_lock(self, key: tuple) -> threading.Lock:
+        with self.lock:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def _connect(self, key: tuple, config: dict) -> SwitchManager:
+        start = time.time()
+        switch = SwitchManager(
+            device_type=config.get("device_type"),
+            ip=config.get("ip"),
+            port=config.get("port"),
+            password=config.get("password"),
+        )
+        if not switch.check_enable_mode():
+            switch.enable_device()
+        elapsed = time.time() - start
+        with self.lock:
+            self.sessions[key] = switch
+            self.stats["connects"] += 1
+            self.stats["connect_time_total"] += elapsed
+        logging.info("Connected to switch %s:%s in %.2fs", key[0], key[1], elapsed)
+        return switch
+
+    def _drop(self, key: tuple) -> None:
+        with self.lock:
+            switch = self.sessions.pop(key, None)
+        if switch is not None:
+            try:
+                switch.disconnect()
+            except Exception as e:
+                logging.debug("Ignoring error while closing switch session %s: %s", key, e)
+
+    def _alive(self, switch: SwitchManager) -> bool:
+        try:
+            return switch.is_alive()
+        except Exception:
+            return False
+
+    @contextmanager
+    def session(self, config: dict):
+        """
+        Yields the shared SwitchManager for the switch described by config,
+        holding the switch lock for the duration of the block.
+        """
+        key = self._key(config)
+        with self._get_lock(key):
+            switch = self.sessions.get(key)
+            if switch is not None and self._alive(switch):
+                with self.lock:
+                    self.stats["reuses"] += 1
+                switch.clear_buffer()
+            else:
+                if switch is not None:
+                    logging.warning("Switch session %s:%s is dead; reconnecting.", key[0], key[1])
+                    self._drop(key)
+                    with self.lock:
+                        self.stats["reconnects"] += 1
+                switch = self._connect(key, config)
+            self._start_keepalive()
+            try:
+                yield switch
+            except Exception:
+                # The channel may be left mid-command; start clean next time.
+                self._drop(key)
+                raise
+
+    def _start_keepalive(self) -> None:
+        if self.keepalive_interval <= 0 or self.keepalive_thread is not None:
+            return
+        self.keepalive_thread = threading.Thread(
+            target=self._keepalive_loop, name="switch-keepalive", daemon=True
+        )
+        self.keepalive_thread.start()
+
+    def _keepalive_loop(self) -> None:
+        while True:
+            time.sleep(self.keepalive_interval)
+            with self.lock:
+                keys = list(self.sessions)
+            for key in keys:
+                lock = self._get_lock(key)
+                # A busy session is alive by definition; skip it.
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    switch = self.sessions.get(key)
+                    if switch is not None and not self._alive(switch):
+                        logging.warning("Keepalive failed for switch %s:%s; dropping session.", key[0], key[1])
+                        self._drop(key)
+                finally:
+                    lock.release()
+
+    def get_stats(self) -> dict:
+        """
+        Returns connection counters, including the average connect time and
+        the fraction of operations served by an existing session.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats["open_sessions"] = len(self.sessions)
+        total = stats["connects"] + stats["reuses"]
+        stats["avg_connect_time"] = round(stats["connect_time_total"] / stats["connects"], 3) if stats["connects"] else 0.0
+        stats["reuse_rate"] = round(stats["reuses"] / total, 3) if total else 0.0
+        stats["connect_time_total"] = round(stats["connect_time_total"], 3)
+        return stats
+
+
+# Process-wide session pool shared by the API and VmManager
+SWITCH_SESSIONS = SwitchSessionManager()
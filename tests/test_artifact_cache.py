@@ -0,0 +1,122 @@
+import hashlib
+import os
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts import artifact_cache
+from scripts.artifact_cache import ArtifactCache
+
+# ArtifactCache against a stand-in artifact server on localhost: no LXD needed
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 17)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.files with optional Range support; the first GET of a
+    path in server.cut is cut after that many bytes.
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        data = server.files.get(self.path.lstrip("/"))
+        if data is None:
+            self.send_error(404)
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and server.ranges:
+            start = int(range_header[len("bytes="):].split("-")[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        cut = server.cut.pop(self.path.lstrip("/"), None)
+        self.wfile.write(body[:cut] if cut is not None else body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.files = {"boot/rpi4.tar.gz": PAYLOAD}
+    httpd.requests = []
+    httpd.cut = {}
+    httpd.ranges = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def cache(server, tmp_path, monkeypatch):
+    # No backoff between retries
+    monkeypatch.setattr(artifact_cache.time, "sleep", lambda seconds: None)
+    return ArtifactCache(root_dir=str(tmp_path), base_url=f"http://127.0.0.1:{server.server_port}",
+                         timeout=5, retries=3)
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_miss_then_hit(cache, server):
+    first = cache.fetch("boot/rpi4.tar.gz")
+    second = cache.fetch("boot/rpi4.tar.gz")
+    assert first == second
+    assert read(first) == PAYLOAD
+    assert len(server.requests) == 1
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["artifacts"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_resume_after_cut_transfer(cache, server):
+    server.cut["boot/rpi4.tar.gz"] = 1024 * 1024
+    path = cache.fetch("boot/rpi4.tar.gz", sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    assert read(path) == PAYLOAD
+    assert [header for _, header in server.requests] == [None, f"bytes={1024 * 1024}-"]
+    stats = cache.get_stats()
+    assert stats["resumed"] == 1
+    assert stats["bytes_downloaded"] == len(PAYLOAD)
+
+
+def test_server_ignoring_range(cache, server):
+    server.ranges = False
+    server.cut["boot/rpi4.tar.gz"] = 1024 * 1024
+    path = cache.fetch("boot/rpi4.tar.gz")
+    # The second attempt starts over instead of appending the whole file
+    assert read(path) == PAYLOAD
+    assert len(server.requests) == 2
+    assert cache.get_stats()["resumed"] == 0
+
+
+def test_not_found_is_not_retried(cache, server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        cache.fetch("boot/missing.tar.gz")
+    assert error.value.code == 404
+    assert len(server.requests) == 1
+    assert cache.get_stats()["errors"] == 1
+
+
+def test_checksum_mismatch_is_discarded(cache, server, tmp_path):
+    with pytest.raises(ValueError):
+        cache.fetch("boot/rpi4.tar.gz", sha256="0" * 64)
+    assert cache.lookup("boot/rpi4.tar.gz") is None
+    assert os.listdir(tmp_path / "partial") == []
+    assert os.listdir(tmp_path / "blobs") == []
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from scripts import apt_cache
+from scripts.apt_cache import APT_PROXY_CONF, APT_PROXY_DETECT, AptCacheProxy
+from scripts.cloud_init import NAT_SYSCTL_FILE, render_user_data
+
+
+def load_cloud_config(text):
+    assert text.startswith("#cloud-config\n")
+    return json.loads(text[len("#cloud-config\n"):])
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    # A running proxy without LXD
+    monkeypatch.setattr(apt_cache, "APT_CACHE_ENABLED", True)
+    proxy = AptCacheProxy(port=3142)
+    monkeypatch.setattr(proxy, "ensure_instance", lambda: None)
+    monkeypatch.setattr(proxy, "proxy_url", lambda: "http://10.0.3.5:3142")
+    return proxy
+
+
+def test_user_data_keeps_apt_proxy_files(proxy):
+    config = load_cloud_config(render_user_data(["ssh-ed25519 AAAA user"], ["nfs-kernel-server"],
+                                                write_files=proxy.user_data_files()))
+    paths = [entry["path"] for entry in config["write_files"]]
+    assert paths == [NAT_SYSCTL_FILE, APT_PROXY_DETECT, APT_PROXY_CONF]
+    detect = config["write_files"][1]
+    assert detect["permissions"] == "0755"
+    assert "echo http://10.0.3.5:3142" in detect["content"]
+    assert config["packages"] == ["nfs-kernel-server"]
+    assert config["ssh_authorized_keys"] == ["ssh-ed25519 AAAA user"]
+
+
+def test_vendor_data_matches_user_data_files(proxy):
+    vendor = load_cloud_config(proxy.vendor_data())
+    assert vendor["write_files"] == proxy.user_data_files()
+
+
+def test_no_proxy_files_when_disabled(proxy, monkeypatch):
+    monkeypatch.setattr(apt_cache, "APT_CACHE_ENABLED", False)
+    assert proxy.user_data_files() == []
+    assert proxy.launch_options() == []
+    config = load_cloud_config(render_user_data(write_files=proxy.user_data_files()))
+    assert [entry["path"] for entry in config["write_files"]] == [NAT_SYSCTL_FILE]
+    assert "packages" not in config
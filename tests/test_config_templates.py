@@ -0,0 +1,43 @@
+import json
+
+from scripts.config_templates import (DHCP_HOST_TABLES, UPLINK_INTERFACE, render_dhcpd_subnet, render_export_line,
+                                      render_netplan, render_tftpd_config)
+from config import VM_INTERFACE
+
+
+def test_render_dhcpd_subnet():
+    assert render_dhcpd_subnet("10.111.3.4/24") == (
+        "subnet 10.111.3.0 netmask 255.255.255.0 {\n"
+        "    range 10.111.3.6 10.111.3.11;\n"
+        "    option routers 10.111.3.4;\n"
+        "    option domain-name-servers 8.8.8.8, 8.8.4.4;\n"
+        "}\n"
+        + "".join(f'include "/etc/dhcp/{table}";\n' for table in DHCP_HOST_TABLES)
+    )
+
+
+def test_render_dhcpd_subnet_other_prefix_and_tables():
+    subnet = render_dhcpd_subnet("10.111.130.1/25", host_tables=[])
+    assert subnet.startswith("subnet 10.111.130.0 netmask 255.255.255.128 {\n")
+    assert "range 10.111.130.3 10.111.130.8;" in subnet
+    assert "include" not in subnet
+
+
+def test_render_netplan():
+    config = json.loads(render_netplan("10.111.3.4/24", "00:16:3e:aa:bb:cc"))["network"]
+    assert config["version"] == 2
+    assert config["ethernets"][UPLINK_INTERFACE] == {"dhcp4": True}
+    assert config["ethernets"][VM_INTERFACE] == {
+        "dhcp4": False,
+        "addresses": ["10.111.3.4/24"],
+        "match": {"macaddress": "00:16:3e:aa:bb:cc"},
+        "set-name": VM_INTERFACE,
+    }
+    # Without a MAC the NIC is matched by name
+    by_name = json.loads(render_netplan("10.111.3.4/24"))["network"]["ethernets"][VM_INTERFACE]
+    assert "match" not in by_name
+
+
+def test_render_tftpd_config_and_export_line():
+    assert 'TFTP_DIRECTORY="/srv/tftp"\n' in render_tftpd_config("/srv/tftp")
+    assert render_export_line("/srv/rootfs", "ro,no_subtree_check") == "/srv/rootfs *(ro,no_subtree_check)"
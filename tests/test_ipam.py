@@ -0,0 +1,56 @@
+import pytest
+
+from scripts.ipam import NetworkIdAllocator, UserNetwork, parse_id_ranges
+
+
+def test_allocate_hands_out_free_ids_in_order():
+    allocator = NetworkIdAllocator(first=3, last=6, used=[4], reserved="")
+    assert [allocator.allocate() for _ in range(3)] == [3, 5, 6]
+    with pytest.raises(ValueError, match="No free"):
+        allocator.allocate()
+
+
+def test_allocate_requested_id_checks_bounds_and_collisions():
+    allocator = NetworkIdAllocator(first=3, last=253, reserved="")
+    assert allocator.allocate(10) == 10
+    with pytest.raises(ValueError, match="already allocated"):
+        allocator.allocate(10)
+    for network_id in (2, 254):
+        with pytest.raises(ValueError, match="between 3 and 253"):
+            allocator.allocate(network_id)
+    # The requested ID is skipped by the free-list
+    assert 10 not in [allocator.allocate() for _ in range(250)]
+
+
+def test_release_makes_an_id_free_again():
+    allocator = NetworkIdAllocator(first=3, last=4, reserved="")
+    assert (allocator.allocate(), allocator.allocate()) == (3, 4)
+    allocator.release(3)
+    assert allocator.is_free(3)
+    assert allocator.allocate() == 3
+    # Out of range and never allocated IDs are ignored
+    allocator.release(254)
+    allocator.release(2)
+
+
+def test_stored_ids_outside_the_range_do_not_fail_seeding():
+    allocator = NetworkIdAllocator(first=3, last=253, used=[254, 5], reserved="")
+    assert not allocator.is_free(5)
+    assert not allocator.is_free(254)
+    assert allocator.allocate() == 3
+
+
+def test_reserved_ranges():
+    assert parse_id_ranges("10-12, 42,") == [10, 11, 12, 42]
+    allocator = NetworkIdAllocator(first=3, last=12, reserved="3-10")
+    assert allocator.allocate() == 11
+
+
+def test_user_network_addresses():
+    network = UserNetwork.from_id(3, supernet="10.111.0.0/16", prefix=24)
+    assert str(network.subnet) == "10.111.3.0/24"
+    assert str(network.nfs_ip) == "10.111.3.4/24"
+    assert [str(address) for address in network.dhcp_range] == ["10.111.3.6", "10.111.3.11"]
+    assert network.vlan_id == 3
+    with pytest.raises(ValueError, match="outside"):
+        UserNetwork.from_id(256, supernet="10.111.0.0/16", prefix=24)
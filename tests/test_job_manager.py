@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from scripts.job_manager import FAILED, SUCCEEDED, JobConflict, JobManager, set_job_step
+
+
+@pytest.fixture
+def jobs():
+    manager = JobManager(max_workers=2, history_size=10)
+    yield manager
+    manager.shutdown(wait=True)
+
+
+def wait_finished(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["state"] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_result_and_steps(jobs):
+    def work(value):
+        set_job_step("compute")
+        return value * 2
+
+    job = wait_finished(jobs, jobs.submit("work", work, 21))
+    assert (job["state"], job["result"], job["step"]) == (SUCCEEDED, 42, "compute")
+    assert job["finished_at"] is not None
+
+
+def test_failure_is_recorded(jobs):
+    def fail():
+        raise RuntimeError("lxc launch failed")
+
+    job = wait_finished(jobs, jobs.submit("fail", fail))
+    assert (job["state"], job["error"]) == (FAILED, "lxc launch failed")
+    assert job["finished_at"] is not None
+
+
+def test_same_key_returns_the_active_job(jobs):
+    release = threading.Event()
+    first = jobs.submit("create_user_env_vm", release.wait, key="vm1")
+    assert jobs.submit("create_user_env_vm", release.wait, key="vm1") == first
+    # Other keys are not affected
+    other = jobs.submit("create_user_env_vm", lambda: None, key="vm2")
+    assert other != first
+    release.set()
+    wait_finished(jobs, first)
+
+
+def test_exclusive_submit_conflicts_with_an_active_job(jobs):
+    release = threading.Event()
+    first = jobs.submit("create_user_env_vm", release.wait, key="vm1")
+    with pytest.raises(JobConflict) as conflict:
+        jobs.submit("add_user_nodes", lambda: None, key="vm1", exclusive=True)
+    assert (conflict.value.job_id, conflict.value.key) == (first, "vm1")
+    assert len(jobs.list()) == 1
+    release.set()
+    wait_finished(jobs, first)
+    # Once the job is done the key is free again
+    job_id = jobs.submit("add_user_nodes", lambda: "added", key="vm1", exclusive=True)
+    assert wait_finished(jobs, job_id)["result"] == "added"
+
+
+def test_terminal_state_always_has_finished_at(jobs):
+    seen = []
+    release = threading.Event()
+    job_id = jobs.submit("work", release.wait)
+
+    def poll():
+        while True:
+            job = jobs.get(job_id)
+            if job["state"] in (SUCCEEDED, FAILED):
+                seen.append(job["finished_at"])
+                return
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    release.set()
+    poller.join(5)
+    assert seen and seen[0] is not None
@@ -0,0 +1,46 @@
+import json
+
+from scripts.nbd_config import (NBD_GENERIC_SECTION, content_hash, load_node_images, node_base_image, node_folder,
+                                parse_exported_nodes, render_nbd_config)
+from config.constants import CONFIG_DIR
+
+
+def test_render_nbd_config():
+    config = render_nbd_config({"j20-2": "/root/nbd_jetson_j20-2/jp3541.img",
+                                "j10-1": "/root/nbd_jetson_j10-1/nbd_jetson_j10-1.img"}, "10.111.3.4")
+    assert config == (
+        "[generic]\nallowlist = true\n"
+        "\n"
+        "[nbd_jetson_j10-1]\nexportname = /root/nbd_jetson_j10-1/nbd_jetson_j10-1.img\n"
+        "readonly = false\nlistenaddr = 10.111.3.4\n"
+        "\n"
+        "[nbd_jetson_j20-2]\nexportname = /root/nbd_jetson_j20-2/jp3541.img\n"
+        "readonly = false\nlistenaddr = 10.111.3.4\n"
+    )
+    # Same state, same text: no reload
+    same = render_nbd_config({"j10-1": "/root/nbd_jetson_j10-1/nbd_jetson_j10-1.img",
+                              "j20-2": "/root/nbd_jetson_j20-2/jp3541.img"}, "10.111.3.4")
+    assert content_hash(same) == content_hash(config)
+
+
+def test_render_without_exports_or_listen_address():
+    assert render_nbd_config({}) == NBD_GENERIC_SECTION
+    assert "listenaddr" not in render_nbd_config({"j20-1": "/root/img"})
+
+
+def test_parse_exported_nodes_round_trip():
+    config = render_nbd_config({"j20-1": "/a.img", "jtx-3": "/b.img"}, "10.111.3.4")
+    assert parse_exported_nodes(config) == ["j20-1", "jtx-3"]
+    # Legacy configs written by hand or by the old appender
+    assert parse_exported_nodes("[generic]\n[nbd_jetson_j10-1]\nexportname = x\n\n[other]\n") == ["j10-1"]
+
+
+def test_node_base_image(tmp_path):
+    path = tmp_path / "node_config.json"
+    path.write_text(json.dumps({"j20": {"rootfs": "/root/nfsroot-3541/rootfs", "nbd_image": "jp3541.img"},
+                                "rpi4": {"rootfs": "/root/nfsroot-rpi4/rootfs"}}))
+    images = load_node_images(str(path))
+    assert node_base_image("j20-1", images) == f"{CONFIG_DIR}/jp3541.img"
+    assert node_base_image("rpi4-2", images) is None
+    assert node_base_image("unknown", images) is None
+    assert node_folder("j20-1") == "/root/nbd_jetson_j20-1"
@@ -0,0 +1,42 @@
+import importlib.util
+import os
+
+import pytest
+
+# user-scripts/nfs_root_prepare.py runs inside the user VM: loaded by path
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "user-scripts", "nfs_root_prepare.py")
+spec = importlib.util.spec_from_file_location("nfs_root_prepare", SCRIPT)
+nfs_root_prepare = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(nfs_root_prepare)
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    # No mounts or exportfs: record the commands instead
+    run = []
+    monkeypatch.setattr(nfs_root_prepare, "run", run.append)
+    return run
+
+
+def test_copy_root_links_symlinked_directories(tmp_path, commands):
+    base = tmp_path / "rootfs"
+    for name in ("usr/bin", "usr/lib", "etc", "var"):
+        (base / name).mkdir(parents=True)
+    (base / "etc" / "hostname").write_text("base\n")
+    # Merged /usr: top-level directories are links into usr
+    os.symlink("usr/bin", base / "bin")
+    os.symlink("usr/lib", base / "lib")
+    (base / "README").write_text("not a directory\n")
+    final = tmp_path / "device" / "rootfs"
+    final.mkdir(parents=True)
+    unique = nfs_root_prepare.PROFILES["jetson"]["unique_dirs"]
+
+    nfs_root_prepare.build_copy_root(str(base), str(final), unique)
+
+    # Copies go through `cp -a` (recorded), the rest is linked to rootfs_shared
+    copied = sorted(command[2] for command in commands if command[:2] == ["cp", "-a"])
+    assert copied == [str(base / "etc"), str(base / "var")]
+    for name in ("bin", "lib", "usr"):
+        assert os.readlink(final / name) == os.path.join("rootfs_shared", name)
+    assert not os.path.lexists(final / "README")
+    assert ["mount", "--rbind", str(base), str(final / "rootfs_shared")] in commands
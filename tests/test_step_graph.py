@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from scripts.step_graph import StepFailed, StepGraph
+
+
+def test_steps_start_after_their_dependencies():
+    events = []
+    lock = threading.Lock()
+
+    def step(name, seconds=0.0):
+        with lock:
+            events.append(("start", name))
+        time.sleep(seconds)
+        with lock:
+            events.append(("end", name))
+
+    steps = StepGraph("test", max_workers=4)
+    steps.add("create_macvlan", step, "create_macvlan", 0.05)
+    steps.add("set_nfs_ip_addr", step, "set_nfs_ip_addr", 0.05, deps=["create_macvlan"])
+    steps.add("push_user_tools", step, "push_user_tools", deps=["set_nfs_ip_addr"])
+    steps.add("configure_nfs_nodes", step, "configure_nfs_nodes", deps=["set_nfs_ip_addr"])
+    steps.add("setup_vpn_vlan", step, "setup_vpn_vlan", 0.05)
+    durations = steps.run()
+
+    assert set(durations) == set(steps.steps)
+    for name, deps in steps.deps.items():
+        for dep in deps:
+            assert events.index(("end", dep)) < events.index(("start", name))
+    # Independent steps overlap
+    assert events.index(("start", "setup_vpn_vlan")) < events.index(("end", "create_macvlan"))
+
+
+def test_first_failure_stops_the_graph():
+    started = []
+    drained = threading.Event()
+
+    def fail():
+        raise RuntimeError("netplan apply failed")
+
+    def slow():
+        time.sleep(0.1)
+        drained.set()
+
+    steps = StepGraph("test", max_workers=4)
+    steps.add("set_nfs_ip_addr", fail)
+    steps.add("slow", slow)
+    steps.add("configure_nfs_nodes", started.append, "configure_nfs_nodes", deps=["set_nfs_ip_addr"])
+    steps.add("after_slow", started.append, "after_slow", deps=["slow"])
+    with pytest.raises(StepFailed) as error:
+        steps.run()
+
+    assert error.value.step == "set_nfs_ip_addr"
+    assert isinstance(error.value.__cause__, RuntimeError)
+    # Running steps are drained, nothing new is started
+    assert drained.is_set()
+    assert started == []
+
+
+def test_cycle_is_rejected_before_running():
+    ran = []
+    steps = StepGraph("test")
+    steps.add("a", ran.append, "a", deps=["c"])
+    steps.add("b", ran.append, "b", deps=["a"])
+    steps.add("c", ran.append, "c", deps=["b"])
+    steps.add("d", ran.append, "d")
+    with pytest.raises(ValueError, match="cycle"):
+        steps.run()
+    assert ran == []
+
+
+def test_unknown_dependency_and_duplicate_step():
+    steps = StepGraph("test")
+    steps.add("a", lambda: None, deps=["missing"])
+    with pytest.raises(ValueError, match="unknown steps"):
+        steps.run()
+    with pytest.raises(ValueError, match="already defined"):
+        steps.add("a", lambda: None)
@@ -0,0 +1,86 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from scripts.user_store import UserStore
+
+
+def user(name, network_id):
+    return {
+        "user_name": name,
+        "user_network_id": network_id,
+        "user_subnet": f"10.111.{network_id}.0/24",
+        "nfs_ip_addr": f"10.111.{network_id}.4/24",
+        "macvlan_interface": f"macvlan_{name}",
+    }
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "active_users.db"), str(tmp_path / "active_users.json")
+
+
+def test_migrates_the_json_file_once(paths):
+    db_path, json_path = paths
+    with open(json_path, "w") as file:
+        json.dump([user("alice", 3), user("bob", 4)], file)
+    store = UserStore(db_path=db_path, json_path=json_path)
+    assert [u["user_name"] for u in store.all()] == ["alice", "bob"]
+    assert store.get("bob", 4) == user("bob", 4)
+
+    # Users deleted after the migration are not imported again
+    store.delete("alice")
+    assert UserStore(db_path=db_path, json_path=json_path).migrate_from_json() == 0
+    assert UserStore(db_path=db_path, json_path=json_path).network_ids() == [4]
+
+
+def test_broken_json_file_is_skipped(paths):
+    db_path, json_path = paths
+    with open(json_path, "w") as file:
+        file.write("[{")
+    store = UserStore(db_path=db_path, json_path=json_path)
+    assert store.all() == []
+
+
+def test_name_and_network_id_are_unique(paths):
+    store = UserStore(*paths)
+    store.add(user("alice", 3))
+    with pytest.raises(sqlite3.IntegrityError, match="user_name"):
+        store.add(user("alice", 5))
+    with pytest.raises(sqlite3.IntegrityError, match="user_network_id"):
+        store.add(user("bob", 3))
+    assert store.get_by_network_id(3)["user_name"] == "alice"
+
+
+def test_concurrent_adds_keep_one_winner(paths):
+    store = UserStore(*paths)
+    errors = []
+
+    def add(name):
+        try:
+            store.add(user(name, 7))
+        except sqlite3.IntegrityError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add, args=(f"user{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.all()) == 1
+    assert len(errors) == 7
+
+
+def test_environment_vm_and_nodes(paths):
+    store = UserStore(*paths)
+    store.add(user("alice", 3))
+    store.set_vm("alice", "alice-vm")
+    store.add_nodes("alice", ["j20-2", "j20-1", "j20-1"])
+    assert (store.vm("alice"), store.user_of_vm("alice-vm")) == ("alice-vm", "alice")
+    assert store.nodes("alice") == ["j20-1", "j20-2"]
+    store.remove_nodes("alice", ["j20-1"])
+    assert store.nodes("alice") == ["j20-2"]
+    store.remove_env("alice")
+    assert (store.vm("alice"), store.nodes("alice")) == (None, [])
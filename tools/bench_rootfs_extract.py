@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compares rootfs extraction throughput per compression format and decompressor.
+
+The tarball is recompressed once per format (gzip, bzip2, xz, zstd), then
+extracted with every decompressor installed on the host (e.g. gzip and pigz).
+Throughput is the uncompressed tar size divided by the extraction time.
+
+Usage:
+    python -m tools.bench_rootfs_extract ../config/rootfs-jp3274.tar.gz [--workdir /var/tmp/bench]
+"""
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+
+from config import ROOTFS_ZSTD_LEVEL
+from scripts.rootfs_extract import DECOMPRESSORS, detect_format
+
+# Compressors per format, fastest available first
+COMPRESSORS = {
+    "gzip": ["pigz", "gzip"],
+    "bzip2": ["pbzip2", "bzip2"],
+    "xz": ["xz -T0"],
+    "zstd": [f"zstd -T0 -{ROOTFS_ZSTD_LEVEL}"],
+}
+EXTENSIONS = {"gzip": ".tar.gz", "bzip2": ".tar.bz2", "xz": ".tar.xz", "zstd": ".tar.zst"}
+
+
+def available(programs):
+    return [program for program in programs if shutil.which(program.split()[0])]
+
+
+def run(command):
+    subprocess.run(["bash", "-c", "set -o pipefail; " + command], check=True)
+
+
+def decompress(tarball, raw):
+    """Writes the uncompressed tar of tarball to raw."""
+    fmt = detect_format(tarball)
+    if fmt == "tar":
+        shutil.copyfile(tarball, raw)
+        return
+    program = available(DECOMPRESSORS[fmt])[0]
+    run(f"{program} -dc {shlex.quote(tarball)} > {shlex.quote(raw)}")
+
+
+def extract(tarball, program, workdir):
+    """
+    Extracts tarball with program into a fresh directory, returns the elapsed
+    seconds, or None when tar fails.
+    """
+    target = tempfile.mkdtemp(dir=workdir, prefix="extract-")
+    command = ["tar"]
+    if program:
+        command.append(f"--use-compress-program={shlex.quote(program)}")
+    command += ["-xpf", shlex.quote(tarball), "--xattrs", "--xattrs-include='*'", "-C", target]
+    if os.geteuid() != 0:
+        # Device nodes and foreign owners need root: skip them, the data is what is timed
+        command += ["--no-same-owner", "--exclude='./dev/*'", "--exclude='dev/*'"]
+    start = time.time()
+    result = subprocess.run(["bash", "-c", " ".join(command)])
+    elapsed = time.time() - start
+    shutil.rmtree(target, ignore_errors=True)
+    if result.returncode != 0:
+        print(f"tar exited with {result.returncode} extracting {tarball}" + (f" with {program}" if program else ""))
+        return None
+    return elapsed
+
+
+def print_row(fmt, program, size_mb, raw_mb, seconds):
+    if seconds is None:
+        print(f"{fmt:<8}{program:<14}{size_mb:>10.0f}{'failed':>10}{'-':>10}")
+    else:
+        print(f"{fmt:<8}{program:<14}{size_mb:>10.0f}{seconds:>10.2f}{raw_mb / seconds:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rootfs extraction per format.")
+    parser.add_argument("tarball", help="Rootfs tarball in any supported format")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (needs ~3x the rootfs size)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.workdir, prefix="bench-rootfs-")
+    try:
+        raw = os.path.join(workdir, "rootfs.tar")
+        decompress(args.tarball, raw)
+        raw_mb = os.path.getsize(raw) / 1e6
+        print(f"Uncompressed tar: {raw_mb:.0f} MB")
+        print(f"{'format':<8}{'decompressor':<14}{'size MB':>10}{'seconds':>10}{'MB/s':>10}")
+
+        print_row("tar", "-", raw_mb, raw_mb, extract(raw, None, workdir))
+        for fmt, compressors in COMPRESSORS.items():
+            compressors = available(compressors)
+            if not compressors:
+                print(f"{fmt:<8}no compressor installed")
+                continue
+            variant = os.path.join(workdir, "rootfs" + EXTENSIONS[fmt])
+            run(f"{compressors[0]} -c {shlex.quote(raw)} > {shlex.quote(variant)}")
+            size_mb = os.path.getsize(variant) / 1e6
+            for program in available(DECOMPRESSORS[fmt]):
+                print_row(fmt, program, size_mb, raw_mb, extract(variant, program, workdir))
+            os.remove(variant)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
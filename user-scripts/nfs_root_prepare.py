@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Prepares the NFS root filesystems of several devices concurrently.
+
+Runs inside the user VM and replaces the per-device loops of nfs_setup.sh
+and nfs_rpi4_setup.sh: every device root is built by a worker pool,
+/etc/exports is rewritten once and `exportfs -ra` runs once at the end.
+
+Usage:
+    nfs_root_prepare.py [--profile jetson|rpi] [--mode copy|overlay] <nfsroot-v> <device1> <device2> ...
+
+Prints a JSON summary with the per-device timings on the last line.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORTS_FILE = "/etc/exports"
+
+# Per-profile directories that are copied for each device (never symlinked)
+# and export options, as in nfs_setup.sh (jetson) and nfs_rpi4_setup.sh (rpi)
+PROFILES = {
+    "jetson": {
+        "unique_dirs": {"etc", "var", "dev", "proc", "run", "tmp", "root", "mnt", "sys"},
+        "export_options": "async,rw,no_root_squash,no_all_squash,no_subtree_check,insecure,"
+                          "anonuid=1000,anongid=1000,crossmnt",
+        "customize": True,
+    },
+    "rpi": {
+        "unique_dirs": {"etc", "var", "home", "root", "dev", "proc", "run", "tmp", "mnt", "sys"},
+        "export_options": "rw,sync,no_subtree_check,no_root_squash,crossmnt",
+        "customize": False,
+    },
+}
+
+FAN_CONTROL_LINE = "/usr/bin/python3 /home/mmtc/scripts/fan/fan_control.py &"
+
+
+def run(command):
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+def is_nfs_mount(path):
+    """True when path lives on an NFS mount (the shared rootfs of the host-wide server)."""
+    result = subprocess.run(["findmnt", "-n", "-o", "FSTYPE", "--target", path], capture_output=True, text=True)
+    return result.stdout.strip().startswith("nfs")
+
+
+def with_reexport(options, reexport):
+    return options + ",reexport=auto-fsidnum" if reexport else options
+
+
+def fsid(path):
+    """Stable fsid for an overlay export, computed like the bash scripts (cksum of the path)."""
+    result = subprocess.run(["cksum"], input=path.encode(), capture_output=True, check=True)
+    return result.stdout.split()[0].decode()
+
+
+def mount_overlay(base_rootfs, device_dir):
+    final_root = os.path.join(device_dir, "rootfs")
+    upper, work = os.path.join(device_dir, "upper"), os.path.join(device_dir, "work")
+    for path in (final_root, upper, work):
+        os.makedirs(path, exist_ok=True)
+    if not os.path.ismount(final_root):
+        run(["mount", "-t", "overlay", "overlay", "-o",
+             f"lowerdir={base_rootfs},upperdir={upper},workdir={work},index=on,nfs_export=on", final_root])
+
+
+def bind_shared(base_rootfs, final_root):
+    shared_root = os.path.join(final_root, "rootfs_shared")
+    os.makedirs(shared_root, exist_ok=True)
+    if not os.path.ismount(shared_root):
+        run(["mount", "--rbind", base_rootfs, shared_root])
+
+
+def build_copy_root(base_rootfs, final_root, unique_dirs):
+    """Copies the unique directories and links the others to rootfs_shared."""
+    bind_shared(base_rootfs, final_root)
+    for name in sorted(os.listdir(base_rootfs)):
+        source = os.path.join(base_rootfs, name)
+        target = os.path.join(final_root, name)
+        # isdir follows links: bin, lib and sbin -> usr/... on merged-/usr roots are linked too
+        if not os.path.isdir(source):
+            continue
+        if name in unique_dirs:
+            if not os.path.isdir(target):
+                run(["cp", "-a", source, target])
+        elif not os.path.islink(target):
+            os.symlink(os.path.join("rootfs_shared", name), target)
+
+
+def customize(device, final_root):
+    """Sets the hostname and starts the fan control from rc.local."""
+    etc = os.path.join(final_root, "etc")
+    with open(os.path.join(etc, "hostname"), "w") as file:
+        file.write(f"{device}\n")
+    rc_local = os.path.join(etc, "rc.local")
+    lines = []
+    if os.path.exists(rc_local):
+        with open(rc_local, "r") as file:
+            lines = file.read().splitlines()
+    if not any(line.startswith("#!/bin/bash") for line in lines):
+        lines.insert(0, "#!/bin/bash")
+    if FAN_CONTROL_LINE.rstrip(" &") not in "\n".join(lines):
+        lines.append(FAN_CONTROL_LINE)
+    with open(rc_local, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    os.chmod(rc_local, 0o755)
+
+
+def prepare_device(nfs_root, device, profile, mode, reexport=False):
+    start = time.time()
+    base_rootfs = os.path.join(nfs_root, "rootfs")
+    device_dir = os.path.join(nfs_root, device)
+    final_root = os.path.join(device_dir, "rootfs")
+    overlay = os.path.isdir(os.path.join(device_dir, "upper"))
+    existed = os.path.isdir(final_root)
+    if existed:
+        # Already set up: only restore the mounts, whatever the requested mode
+        if overlay:
+            mount_overlay(base_rootfs, device_dir)
+        else:
+            bind_shared(base_rootfs, final_root)
+    else:
+        overlay = mode == "overlay"
+        if overlay:
+            mount_overlay(base_rootfs, device_dir)
+        else:
+            os.makedirs(final_root)
+            build_copy_root(base_rootfs, final_root, profile["unique_dirs"])
+        if profile["customize"]:
+            customize(device, final_root)
+    options = profile["export_options"] + (f",fsid={fsid(final_root)}" if overlay else "")
+    options = with_reexport(options, reexport)
+    return {
+        "device": device,
+        "status": "existing" if existed else "created",
+        "mode": "overlay" if overlay else "copy",
+        "export": f"{final_root} *({options})",
+        "seconds": round(time.time() - start, 3),
+    }
+
+
+def write_exports(export_lines):
+    """Rewrites /etc/exports once: the given exports replace any line for the same path."""
+    paths = {line.split()[0] for line in export_lines}
+    kept = []
+    if os.path.exists(EXPORTS_FILE):
+        with open(EXPORTS_FILE, "r") as file:
+            for line in file.read().splitlines():
+                fields = line.split()
+                if fields and fields[0] in paths:
+                    continue
+                if line.startswith("# Configuring NFS exports"):
+                    continue
+                kept.append(line)
+    tmp_path = f"{EXPORTS_FILE}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write("\n".join(kept + export_lines) + "\n")
+    os.replace(tmp_path, EXPORTS_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare per-device NFS root filesystems in parallel.")
+    parser.add_argument("nfsroot_v", help="NFS root directory name under /root, e.g. nfsroot-jp-3541")
+    parser.add_argument("devices", nargs="+", help="Device names")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="jetson")
+    parser.add_argument("--mode", choices=["copy", "overlay"], default=os.getenv("NFS_ROOT_MODE", "copy"))
+    parser.add_argument("--workers", type=int, default=8, help="Devices prepared at the same time")
+    args = parser.parse_args()
+
+    start = time.time()
+    nfs_root = os.path.join("/root", args.nfsroot_v)
+    profile = PROFILES[args.profile]
+    base_rootfs = os.path.join(nfs_root, "rootfs")
+    reexport = is_nfs_mount(base_rootfs)
+    results, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {device: executor.submit(prepare_device, nfs_root, device, profile, args.mode, reexport)
+                   for device in dict.fromkeys(args.devices)}
+        for device, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors[device] = str(e)
+
+    export_lines = [result["export"] for result in results]
+    export_lines.append(f"{base_rootfs} *({with_reexport(profile['export_options'], reexport)})")
+    write_exports(export_lines)
+    run(["exportfs", "-ra"])
+    run(["systemctl", "enable", "--now", "nfs-kernel-server"])
+
+    summary = {"devices": results, "errors": errors, "seconds": round(time.time() - start, 3)}
+    print(json.dumps(summary))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
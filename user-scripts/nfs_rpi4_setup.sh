@@ -32,6 +32,34 @@ is_unique_dir() {
     return 1
 }
 
+# Device root mode: "copy" (uniques copied, the rest linked) or "overlay"
+# (overlayfs: shared rootfs as read-only lower dir, per-device upper/work dirs)
+NFS_ROOT_MODE="${NFS_ROOT_MODE:-copy}"
+
+mount_overlay_root() {
+    local device_dir=$1
+    mkdir -p "$device_dir/rootfs" "$device_dir/upper" "$device_dir/work"
+    if ! mountpoint -q "$device_dir/rootfs"; then
+        mount -t overlay overlay \
+            -o "lowerdir=$BASE_ROOTFS,upperdir=$device_dir/upper,workdir=$device_dir/work,index=on,nfs_export=on" \
+            "$device_dir/rootfs"
+        echo "Mounted overlay root filesystem for $(basename "$device_dir")."
+    fi
+}
+
+# An overlay has no UUID: NFS needs a stable fsid for it
+export_options() {
+    local path=$1 options=$2
+    if [[ -d "$(dirname "$path")/upper" ]]; then
+        options="$options,fsid=$(echo -n "$path" | cksum | cut -d' ' -f1)"
+    fi
+    # Shared rootfs mounted from the host-wide NFS server: re-export it
+    if [[ "$(findmnt -n -o FSTYPE --target "$BASE_ROOTFS")" == nfs* ]]; then
+        options="$options,reexport=auto-fsidnum"
+    fi
+    echo "$options"
+}
+
 ###############################################################################
 # 2. Per-device rootfs setup
 ###############################################################################
@@ -45,8 +73,10 @@ for DEVICE in "${DEVICE_NAMES[@]}"; do
     # ------------------------------------------------------------------ #
     if [[ -d "$FINAL_ROOT" ]]; then
         echo "Device $DEVICE already set up. Skipping overlay creation…"
-        if ! mountpoint -q "$SHARED_ROOT"; then
-            mount --bind "$BASE_ROOTFS" "$SHARED_ROOT"
+        if [[ -d "$DEVICE_DIR/upper" ]]; then
+            mount_overlay_root "$DEVICE_DIR"
+        elif ! mountpoint -q "$SHARED_ROOT"; then
+            mount --rbind "$BASE_ROOTFS" "$SHARED_ROOT"
             echo "Mounted base root filesystem for $DEVICE."
         else
             echo "Shared root filesystem already mounted for $DEVICE."
@@ -54,13 +84,23 @@ for DEVICE in "${DEVICE_NAMES[@]}"; do
         continue          
     fi
 
+    # ------------------------------------------------------------------ #
+    # 2.1  Overlay mode: mount, nothing to copy
+    # ------------------------------------------------------------------ #
+    if [[ "$NFS_ROOT_MODE" == "overlay" ]]; then
+        echo "Setting up overlay root filesystem for $DEVICE…"
+        mount_overlay_root "$DEVICE_DIR"
+        echo "${FINAL_ROOT} *($(export_options "$FINAL_ROOT" "rw,sync,no_subtree_check,no_root_squash,crossmnt"))" >> "$EXPORTS_FILE"
+        continue
+    fi
+
     echo "Setting up root filesystem for $DEVICE…"
 
     # ------------------------------------------------------------------ #
     # 2.1  Create skeleton and bind-mount shared tree
     # ------------------------------------------------------------------ #
     mkdir -p "$FINAL_ROOT" "$SHARED_ROOT"
-    mount --bind "$BASE_ROOTFS" "$SHARED_ROOT"
+    mount --rbind "$BASE_ROOTFS" "$SHARED_ROOT"
     echo "Mounted base root filesystem for $DEVICE."
 
     # ------------------------------------------------------------------ #
@@ -91,7 +131,7 @@ done
 ###############################################################################
 # 3. Shared rootfs export (once)
 ###############################################################################
-BASE_EXPORT="${BASE_ROOTFS} *(rw,sync,no_subtree_check,no_root_squash,crossmnt)"
+BASE_EXPORT="${BASE_ROOTFS} *($(export_options "$BASE_ROOTFS" "rw,sync,no_subtree_check,no_root_squash,crossmnt"))"
 grep -Fxq "$BASE_EXPORT" "$EXPORTS_FILE" || echo "$BASE_EXPORT" >> "$EXPORTS_FILE"
 
 ###############################################################################
@@ -32,6 +32,36 @@ is_unique_dir() {
     return 1
 }
 
+# Device root mode: "copy" (unique directories copied, the rest linked to the
+# bind-mounted shared rootfs) or "overlay" (overlayfs with the shared rootfs as
+# read-only lower dir and per-device upper/work dirs: no copy at all)
+NFS_ROOT_MODE="${NFS_ROOT_MODE:-copy}"
+
+# Mount the overlay root of a device (no-op if already mounted)
+mount_overlay_root() {
+    local device_dir=$1
+    mkdir -p "$device_dir/rootfs" "$device_dir/upper" "$device_dir/work"
+    if ! mountpoint -q "$device_dir/rootfs"; then
+        mount -t overlay overlay \
+            -o "lowerdir=$BASE_ROOTFS,upperdir=$device_dir/upper,workdir=$device_dir/work,index=on,nfs_export=on" \
+            "$device_dir/rootfs"
+        echo "Mounted overlay root filesystem for $(basename "$device_dir")."
+    fi
+}
+
+# Export options of a device root; an overlay has no UUID, so NFS needs a stable fsid
+export_options() {
+    local path=$1 options=$2
+    if [ -d "$(dirname "$path")/upper" ]; then
+        options="$options,fsid=$(echo -n "$path" | cksum | cut -d' ' -f1)"
+    fi
+    # Shared rootfs mounted from the host-wide NFS server: re-export it
+    if [[ "$(findmnt -n -o FSTYPE --target "$BASE_ROOTFS")" == nfs* ]]; then
+        options="$options,reexport=auto-fsidnum"
+    fi
+    echo "$options"
+}
+
 # Setup root filesystem for each device
 for DEVICE in "${DEVICE_NAMES[@]}"; do
     DEVICE_DIR="$NFS_ROOT/$DEVICE"
@@ -43,8 +73,10 @@ for DEVICE in "${DEVICE_NAMES[@]}"; do
     # Skip setup if the device directory already exists
     if [ -d "$FINAL_ROOT" ]; then
         echo "Device $DEVICE already set up. Skipping..."
-        if ! mountpoint -q "$SHARED_ROOT"; then
-            mount --bind "$BASE_ROOTFS" "$SHARED_ROOT"
+        if [ -d "$DEVICE_DIR/upper" ]; then
+            mount_overlay_root "$DEVICE_DIR"
+        elif ! mountpoint -q "$SHARED_ROOT"; then
+            mount --rbind "$BASE_ROOTFS" "$SHARED_ROOT"
             echo "Mounted base root filesystem for $DEVICE."
         else
             echo "Shared root filesystem already mounted for $DEVICE."
@@ -53,42 +85,47 @@ for DEVICE in "${DEVICE_NAMES[@]}"; do
 
     fi
 
-    echo "Setting up root filesystem for $DEVICE..."
-
-    # Create necessary directories
-    mkdir -p "$FINAL_ROOT"
-    mkdir -p "$SHARED_ROOT"
-
-    # Bind mount BASE_ROOTFS to SHARED_ROOT (if not already mounted)
-    if ! mountpoint -q "$SHARED_ROOT"; then
-        mount --bind "$BASE_ROOTFS" "$SHARED_ROOT"
-        echo "Mounted base root filesystem for $DEVICE."
-    fi
+    if [ "$NFS_ROOT_MODE" = "overlay" ]; then
+        echo "Setting up overlay root filesystem for $DEVICE..."
+        mount_overlay_root "$DEVICE_DIR"
+    else
+        echo "Setting up root filesystem for $DEVICE..."
 
-    # Iterate through directories in BASE_ROOTFS
-    for DIR in "$BASE_ROOTFS"/*; do
-        DIR_NAME=$(basename "$DIR")
+        # Create necessary directories
+        mkdir -p "$FINAL_ROOT"
+        mkdir -p "$SHARED_ROOT"
 
-        # Skip if not a directory
-        if [ ! -d "$DIR" ]; then
-            continue
+        # Bind mount BASE_ROOTFS to SHARED_ROOT (if not already mounted)
+        if ! mountpoint -q "$SHARED_ROOT"; then
+            mount --rbind "$BASE_ROOTFS" "$SHARED_ROOT"
+            echo "Mounted base root filesystem for $DEVICE."
         fi
 
-        # Handle unique directories
-        if is_unique_dir "$DIR_NAME"; then
-            # Copy the directory if it doesn't already exist
-            if [ ! -d "$FINAL_ROOT/$DIR_NAME" ]; then
-                cp -a "$DIR" "$FINAL_ROOT/$DIR_NAME"
-                echo "Copied unique directory $DIR_NAME for $DEVICE."
+        # Iterate through directories in BASE_ROOTFS
+        for DIR in "$BASE_ROOTFS"/*; do
+            DIR_NAME=$(basename "$DIR")
+
+            # Skip if not a directory
+            if [ ! -d "$DIR" ]; then
+                continue
             fi
-        else
-            # Create a relative symbolic link to SHARED_ROOT if it doesn't already exist
-            if [ ! -L "$FINAL_ROOT/$DIR_NAME" ]; then
-                ln -s "rootfs_shared/$DIR_NAME" "$FINAL_ROOT/$DIR_NAME"
-                echo "Linked shared directory $DIR_NAME for $DEVICE."
+
+            # Handle unique directories
+            if is_unique_dir "$DIR_NAME"; then
+                # Copy the directory if it doesn't already exist
+                if [ ! -d "$FINAL_ROOT/$DIR_NAME" ]; then
+                    cp -a "$DIR" "$FINAL_ROOT/$DIR_NAME"
+                    echo "Copied unique directory $DIR_NAME for $DEVICE."
+                fi
+            else
+                # Create a relative symbolic link to SHARED_ROOT if it doesn't already exist
+                if [ ! -L "$FINAL_ROOT/$DIR_NAME" ]; then
+                    ln -s "rootfs_shared/$DIR_NAME" "$FINAL_ROOT/$DIR_NAME"
+                    echo "Linked shared directory $DIR_NAME for $DEVICE."
+                fi
             fi
-        fi
-    done
+        done
+    fi
 
     # Customize hostname for each device
     echo "$DEVICE" > "$FINAL_ROOT/etc/hostname"
@@ -121,13 +158,13 @@ for DEVICE in "${DEVICE_NAMES[@]}"; do
     # Configure NFS exports
     echo "# Configuring NFS exports $DEVICE ..." >> "$EXPORTS_FILE"
     FINAL_ROOT_EXPORT="$NFS_ROOT/$DEVICE/rootfs"
-    echo "$FINAL_ROOT_EXPORT *(async,rw,no_root_squash,no_all_squash,no_subtree_check,insecure,anonuid=1000,anongid=1000,crossmnt)" >> "$EXPORTS_FILE"
+    echo "$FINAL_ROOT_EXPORT *($(export_options "$FINAL_ROOT_EXPORT" "async,rw,no_root_squash,no_all_squash,no_subtree_check,insecure,anonuid=1000,anongid=1000,crossmnt"))" >> "$EXPORTS_FILE"
 done
 
 
 
 # Export the shared BASE_ROOTFS if not already exported
-base_export_line="$BASE_ROOTFS *(async,rw,no_root_squash,no_all_squash,no_subtree_check,insecure,anonuid=1000,anongid=1000,crossmnt)"
+base_export_line="$BASE_ROOTFS *($(export_options "$BASE_ROOTFS" "async,rw,no_root_squash,no_all_squash,no_subtree_check,insecure,anonuid=1000,anongid=1000,crossmnt"))"
 if ! grep -Fxq "$base_export_line" "$EXPORTS_FILE"; then
     echo "$base_export_line" >> "$EXPORTS_FILE"
 fi